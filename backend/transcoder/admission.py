@@ -0,0 +1,167 @@
+"""
+Admission control.
+
+The host has a budget of encode cost (see placement.job_cost, one unit is a
+1080p25 x264 encode). A start whose channel does not fit in what the
+pending/running jobs (and the stopped ones waiting for a retry) leave is
+rejected or, if asked, queued until a running process exits and frees
+enough of the budget.
+
+The budget is ENCODE_CAPACITY if set, else the cores divided by the cores
+one unit needs, as measured by `manage.py benchmark_ladder --calibrate`.
+With several nodes every node reports its own budget and a start goes to
+the least loaded node it fits on.
+
+Admissions read the budget and reserve it in one transaction holding the
+rows of the live nodes (of every job on a single host), so concurrent
+starts are placed one after the other instead of overcommitting a node.
+"""
+import json, os
+from collections import defaultdict
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from .models import Channel, TranscodingJob
+from .job_state import transition
+from .placement import job_cost
+
+CORES_PER_COST = 2.0        # until calibrated, a 1080p25 x264 encode at preset fast takes about two cores
+ACTIVE_STATUSES = ['pending', 'running']
+ADMIT_STATUSES = ['queued', 'stopped', 'error', 'completed']    # a pending job is already admitted
+
+
+def channel_cost(channel):
+    """Encode cost of a channel, from its ABR ladder (prefetched if available)."""
+    if channel.is_abr:
+        resolutions = [abr.resolution for abr in channel.abr.all()]
+    else:
+        resolutions = [channel.resolution or '1920x1080']
+    return job_cost(channel.video_codec, channel.frame_rate, resolutions)
+
+
+def cores_per_cost():
+    path = getattr(settings, 'CAPACITY_FILE', None)
+    if path and os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)['cores_per_cost']
+    return CORES_PER_COST
+
+
+def host_capacity():
+    capacity = getattr(settings, 'ENCODE_CAPACITY', None)
+    if capacity:
+        return float(capacity)
+    cores = getattr(settings, 'ENCODER_CORES', None) or os.cpu_count() or 1
+    return round(cores / cores_per_cost(), 3)
+
+
+def room(capacity, used):
+    return {'capacity': round(capacity, 3), 'used': round(used, 3), 'available': round(capacity - used, 3)}
+
+
+def node_headroom(exclude_jobs=(), lock=False):
+    """
+    Budget per live node (node -> room), or {None: room} for this host
+    alone when no nodes are registered (see nodes.py). With `lock` (inside
+    a transaction) the budget can't change until the transaction ends.
+    """
+    from .nodes import live_nodes
+
+    nodes = list(live_nodes().select_for_update() if lock else live_nodes())
+    if lock and not nodes:
+        # No node row to hold on a single host, hold the job rows instead
+        list(TranscodingJob.objects.select_for_update().order_by('id').values_list('id', flat=True))
+    # A job waiting for its retry keeps its place
+    channels = Channel.objects.filter(
+        Q(jobs__status__in=ACTIVE_STATUSES) | Q(jobs__status='stopped', jobs__next_retry_at__isnull=False)
+    ).exclude(
+        jobs__id__in=exclude_jobs
+    ).select_related('jobs').prefetch_related('abr')
+    if not nodes:
+        return {None: room(host_capacity(), sum(channel_cost(channel) for channel in channels))}
+    used = defaultdict(float)
+    for channel in channels:
+        used[channel.jobs.node_id] += channel_cost(channel)
+    return {node: room(node.capacity, used[node.id]) for node in nodes}
+
+
+def summary(rooms):
+    """Total budget of `rooms`, with the budget per node when there are nodes."""
+    total = room(sum(r['capacity'] for r in rooms.values()), sum(r['used'] for r in rooms.values()))
+    if None not in rooms:
+        total['nodes'] = {node.name: dict(r) for node, r in rooms.items()}
+    return total
+
+
+def headroom(exclude_jobs=()):
+    return summary(node_headroom(exclude_jobs))
+
+
+def decide(job, cost, rooms, queue=False, from_statuses=ADMIT_STATUSES):
+    """
+    Admit `job` on the least loaded node of `rooms` it fits on (moving it
+    to pending there), else queue or reject it. `rooms` is updated, and
+    must come from node_headroom(lock=True) in the same transaction.
+    """
+    control = getattr(settings, 'ADMISSION_CONTROL', True)
+    fits = [node for node, r in rooms.items() if not control or cost <= r['available']]
+    if fits:
+        def load(node):
+            r = rooms[node]
+            return (r['used'] + cost) / r['capacity'] if r['capacity'] else float('inf'), node.name if node else ''
+        node = min(fits, key=load)
+        # Pending right away, so the next admission counts this job
+        if transition(job.id, 'pending', from_statuses, node=node, retry_count=0, next_retry_at=None):
+            rooms[node].update(room(rooms[node]['capacity'], rooms[node]['used'] + cost))
+            job.node = node
+            return 'admitted'
+        return 'rejected'
+    if queue and transition(job.id, 'queued', start_time=timezone.now(), error_message=None, node=None):
+        return 'queued'
+    return 'rejected'
+
+
+def admit(job, queue=False):
+    """
+    Decide on starting `job`: 'admitted' (job.node set, the caller starts
+    it there), 'queued' or 'rejected'. Returns (decision, cost, headroom).
+    """
+    cost = channel_cost(job.channel)
+    with transaction.atomic():
+        rooms = node_headroom([job.id], lock=True)
+        before = summary(rooms)
+        return decide(job, cost, rooms, queue), cost, before
+
+
+def admit_many(jobs, queue=False):
+    """admit() for several jobs in order, loading the budget once. Returns {decision: [job ids]}."""
+    decisions = {'admitted': [], 'queued': [], 'rejected': []}
+    with transaction.atomic():
+        rooms = node_headroom([job.id for job in jobs], lock=True)
+        for job in jobs:
+            decisions[decide(job, channel_cost(job.channel), rooms, queue)].append(job.id)
+    return decisions
+
+
+def admit_queued():
+    """
+    Move queued jobs to pending in queue order while they fit, stopping at
+    the first that doesn't so large channels are not starved. Returns the
+    admitted job ids, for the caller to start.
+    """
+    queued = TranscodingJob.objects.filter(status='queued').select_related('channel').prefetch_related(
+        'channel__abr'
+    ).order_by('start_time', 'id')
+    admitted = []
+    with transaction.atomic():
+        rooms = node_headroom(lock=True)
+        for job in queued:
+            if decide(job, channel_cost(job.channel), rooms, from_statuses=['queued']) != 'admitted':
+                break
+            admitted.append(job.id)
+    return admitted
+
+
+def queue_position(job):
+    return TranscodingJob.objects.filter(status='queued', start_time__lte=job.start_time).exclude(id=job.id).count() + 1
@@ -0,0 +1,76 @@
+import asyncio
+from urllib.parse import parse_qs
+from asgiref.sync import sync_to_async
+from channels.db import database_sync_to_async
+from channels.generic.websocket import AsyncJsonWebsocketConsumer
+from django.conf import settings
+from .events import JOB_STATUS_GROUP, METRICS_GROUP
+from .logread import LEVELS, LOG_FOLLOW_INTERVAL, MAX_TAIL, read_after, search
+from .logsink import channel_log_path
+from .models import Channel
+
+
+class StatusConsumer(AsyncJsonWebsocketConsumer):
+    """Pushes job status transitions and metrics samples to the dashboard."""
+
+    # Samples come from the single `manage.py publish_metrics` process, whichever process serves the socket
+    groups = [JOB_STATUS_GROUP, METRICS_GROUP]
+
+    async def job_status(self, event):
+        # job_id and status, plus channel_id/error_message when the sender knows them
+        await self.send_json({**event, 'type': 'job_status'})
+
+    async def metrics_sample(self, event):
+        await self.send_json({
+            'type': 'metrics',
+            **event['sample'],
+        })
+
+
+class ChannelLogConsumer(AsyncJsonWebsocketConsumer):
+    """
+    Follows a channel's log: the matching tail first, then the lines written
+    since every LOG_FOLLOW_INTERVAL seconds. ?tail=, ?level= and ?q= work as
+    on GET /api/channels/<id>/logs/. Closes with 4400 for invalid
+    parameters and 4404 for an unknown channel.
+    """
+    follow_task = None
+
+    async def connect(self):
+        params = {key: values[-1] for key, values in parse_qs(self.scope['query_string'].decode()).items()}
+        try:
+            tail = min(max(int(params.get('tail', 100)), 1), MAX_TAIL)
+        except ValueError:
+            tail = None
+        level, q = params.get('level'), params.get('q')
+        if tail is None or level and level not in LEVELS:
+            await self.close(code=4400)
+            return
+        pk = self.scope['url_route']['kwargs']['pk']
+        name = await database_sync_to_async(
+            lambda: Channel.objects.filter(pk=pk).values_list('name', flat=True).first()
+        )()
+        if name is None:
+            await self.close(code=4404)
+            return
+        await self.accept()
+        self.follow_task = asyncio.create_task(self.follow(channel_log_path(name), tail, level, q))
+
+    async def disconnect(self, code):
+        if self.follow_task:
+            self.follow_task.cancel()
+
+    async def follow(self, path, tail, level, q):
+        # File reads run off the event loop and apart from the database thread
+        lines, position = await sync_to_async(search, thread_sensitive=False)(path, tail, None, level, q)
+        first = True
+        while True:
+            if lines or first:
+                await self.send_json({
+                    'type': 'log',
+                    'lines': [line.decode('utf-8', 'replace') for line in lines],
+                    'after': '%d:%d' % position,
+                })
+                first = False
+            await asyncio.sleep(getattr(settings, 'LOG_FOLLOW_INTERVAL', LOG_FOLLOW_INTERVAL))
+            lines, position = await sync_to_async(read_after, thread_sensitive=False)(path, position, level, q)
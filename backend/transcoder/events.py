@@ -0,0 +1,33 @@
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+
+# Channel layer groups the websocket consumer subscribes to
+JOB_STATUS_GROUP = 'job_status'
+METRICS_GROUP = 'metrics'
+
+
+def _group_send(group, message):
+    channel_layer = get_channel_layer()
+    if channel_layer is None:
+        return
+    try:
+        async_to_sync(channel_layer.group_send)(group, message)
+    except Exception as e:
+        # Broadcasting is best effort, never break job control because Redis is down
+        print(f"Could not broadcast to {group}: {e}")
+
+
+def broadcast_job_status(job_id, status, **extra):
+    _group_send(JOB_STATUS_GROUP, {
+        'type': 'job.status',
+        'job_id': job_id,
+        'status': status,
+        **extra,
+    })
+
+
+def broadcast_metrics(sample):
+    _group_send(METRICS_GROUP, {
+        'type': 'metrics.sample',
+        'sample': sample,
+    })
@@ -0,0 +1,543 @@
+"""
+FFmpeg command builder.
+
+`build_command` is a pure function of a frozen ChannelSnapshot, so it can
+be tested without a database and memoized. `command_for_channel` caches
+the result per (channel id, updated_at): retries and restarts of an
+unchanged channel skip both the ABR queries and the rebuild. The snapshot
+itself is cached the same way (`channel_snapshot`), so the start task reads
+the resolutions from it and a new thread count only rebuilds the argv.
+
+Channels reading the same input can share one FFmpeg: `build_shared_command`
+demuxes and decodes the input once and splits it into a filter branch and
+outputs per channel.
+
+Encoder tuning comes from the channel's EncoderProfile. Threads not set
+there are derived from the host cores and the encoders already running
+(`default_encoder_threads`), so concurrent jobs don't oversubscribe the CPU.
+"""
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, fields, replace
+from functools import lru_cache
+from django.conf import settings
+from django.core.exceptions import ObjectDoesNotExist
+
+CACHE_SIZE = 1024
+
+# Preset used when the encoder profile sets none
+DEFAULT_PRESETS = {'libx264': 'fast'}
+
+
+@dataclass(frozen=True)
+class OutputSnapshot:
+    output_type: str
+    output_url: str
+    output_multicast_ip: str
+    output_network: str
+
+    @classmethod
+    def from_model(cls, output):
+        return cls(**{f.name: getattr(output, f.name) for f in fields(cls)})
+
+
+@dataclass(frozen=True)
+class ABRSnapshot:
+    output_type: str
+    output_url: str
+    output_multicast_ip: str
+    output_network: str
+    video_bitrate: int
+    audio_bitrate: int
+    buffer_size: int
+    resolution: str
+    service_id: int
+    video_pid: int
+    audio_pid: int
+    pmt_pid: int
+    pcr_pid: int
+    outputs: tuple = ()     # extra destinations of the same encode
+
+    @classmethod
+    def from_model(cls, abr):
+        values = {f.name: getattr(abr, f.name) for f in fields(cls) if f.name != 'outputs'}
+        return cls(outputs=tuple(OutputSnapshot.from_model(o) for o in abr.outputs.all()), **values)
+
+
+@dataclass(frozen=True)
+class EncoderSnapshot:
+    preset: str = None
+    tune: str = None
+    threads: int = None
+    lookahead_threads: int = None
+    rc_lookahead: int = None
+    slices: int = None
+
+    @classmethod
+    def from_model(cls, profile, threads=None):
+        """Snapshot an EncoderProfile (or None), `threads` used when it sets none."""
+        values = {f.name: getattr(profile, f.name) for f in fields(cls)} if profile else {}
+        values['threads'] = values.get('threads') or threads
+        return cls(**values)
+
+
+@dataclass(frozen=True)
+class ChannelSnapshot:
+    name: str
+    input_type: str
+    input_url: str
+    input_multicast_ip: str
+    input_network: str
+    input_file: str
+    is_abr: bool
+    video_codec: str
+    audio: str
+    audio_gain: float
+    bitrate_mode: str
+    scan_type: str
+    aspect_ratio: str
+    frame_rate: int
+    logo_path: str
+    logo_position: str
+    logo_opacity: float
+    profiles: tuple = ()
+    encoder: EncoderSnapshot = EncoderSnapshot()
+
+    @classmethod
+    def from_model(cls, channel, profiles=None, threads=None):
+        """
+        Snapshot a Channel, loading its ABR profiles and their outputs unless
+        given. `threads` is the default for video encoders without a set count.
+        """
+        if profiles is None:
+            profiles = channel.abr.prefetch_related('outputs') if channel.is_abr else ()
+        try:
+            encoder_profile = channel.encoder_profile
+        except ObjectDoesNotExist:
+            encoder_profile = None
+        values = {f.name: getattr(channel, f.name) for f in fields(cls) if f.name not in ('profiles', 'encoder')}
+        return cls(
+            profiles=tuple(ABRSnapshot.from_model(p) for p in profiles),
+            encoder=EncoderSnapshot.from_model(encoder_profile, threads),
+            **values
+        )
+
+
+def default_encoder_threads(encoders, exclude_channels=()):
+    """
+    Threads per video encoder when `encoders` more start next to the ones
+    of active jobs: the cores (ENCODER_CORES, else all) split evenly.
+    """
+    from .models import ABR
+
+    cores = getattr(settings, 'ENCODER_CORES', None) or os.cpu_count() or 1
+    running = ABR.objects.filter(
+        channel__jobs__status__in=['pending', 'running']
+    ).exclude(channel_id__in=exclude_channels).count()
+    return max(1, cores // max(1, running + encoders))
+
+
+def batch_encoder_threads(job_ids):
+    """
+    default_encoder_threads for starting the ABR channels of `job_ids`
+    together, counted once for a bulk start instead of once per job.
+    """
+    from .models import ABR
+
+    channels = list(ABR.objects.filter(
+        channel__jobs__id__in=job_ids, channel__is_abr=True
+    ).values_list('channel_id', flat=True))
+    return default_encoder_threads(len(channels), set(channels))
+
+
+def input_args(channel):
+    if channel.input_type == 'hls':
+        return ['-re', '-i', channel.input_url]
+    if channel.input_type == 'udp':
+        return [
+            '-f', 'mpegts', '-fflags', '+nobuffer+discardcorrupt',
+            '-probesize', '1000000', '-analyzeduration', '1000000',
+            '-i', f"udp://{channel.input_multicast_ip}?localaddr={channel.input_network}"
+        ]
+    if channel.input_type == 'file':
+        return ['-i', channel.input_file]
+    return []
+
+
+def input_address(channel):
+    """The address FFmpeg reads the channel from, or None."""
+    args = input_args(channel)
+    return args[args.index('-i') + 1] if '-i' in args else None
+
+
+def has_logo(channel):
+    return bool(channel.logo_path and channel.logo_path.strip())
+
+
+def resolution_groups(channel):
+    """Profile indexes per distinct resolution, in order of first use."""
+    groups = {}
+    for i, profile in enumerate(channel.profiles):
+        groups.setdefault(profile.resolution, []).append(i)
+    return list(groups.items())
+
+
+def service_name(channel, profile):
+    """MPEG-TS service name of a rendition sent over UDP, None for outputs without one."""
+    if not sends_udp(profile):
+        return None
+    return f"{channel.name}@{profile.resolution.split('x')[1]}"
+
+
+def audio_groups(channel):
+    """
+    Profile indexes that can share one audio encode (same audio bitrate and
+    PID). Each group is one output, a tee muxer when it has several profiles.
+    Metadata is per output, so UDP renditions only share with renditions of
+    the same service name and keep their `<name>@<height>`.
+    """
+    groups = {}
+    for i, profile in enumerate(channel.profiles):
+        groups.setdefault((profile.audio_bitrate, profile.audio_pid, service_name(channel, profile)), []).append(i)
+    return list(groups.values())
+
+
+def abr_filter_graph(channel, video_in='[0:v]', audio_in='[0:a]', logo_in='[1:v]', prefix=''):
+    """
+    Filter graph of one ABR channel. The inputs and a label prefix can be
+    given so several channels fit in one graph (see build_shared_command).
+    """
+    filter_parts = []
+
+    if has_logo(channel):
+        # Logo is input 1 unless given, overlay position given as 'x=..:y=..'
+        raw_position = channel.logo_position or 'x=10:y=10'
+        ffmpeg_position = raw_position.replace('x=', '').replace('y=', '')
+        filter_parts.append(f"{logo_in}format=rgba,colorchannelmixer=aa={channel.logo_opacity}[{prefix}logo]")
+
+        # Apply overlay based on scan type
+        if channel.scan_type == 'progressive':
+            # For progressive: apply deinterlacing first, then overlay
+            filter_parts.append(f"{video_in}yadif[{prefix}deint_video]")
+            filter_parts.append(f"[{prefix}deint_video][{prefix}logo]overlay={ffmpeg_position}[{prefix}logo_video]")
+        else:
+            # For interlaced: apply overlay directly
+            filter_parts.append(f"{video_in}[{prefix}logo]overlay={ffmpeg_position}[{prefix}logo_video]")
+        source = f"[{prefix}logo_video]"
+    elif channel.scan_type == 'progressive':
+        source = f"{video_in}yadif,"
+    else:
+        source = video_in
+
+    # Scale once per distinct resolution, then split for the profiles sharing it
+    resolutions = resolution_groups(channel)
+    if len(resolutions) > 1:
+        filter_parts.append(f"{source}split={len(resolutions)}" + ''.join(f"[{prefix}v{j}]" for j in range(len(resolutions))))
+        sources = [f"[{prefix}v{j}]" for j in range(len(resolutions))]
+    else:
+        sources = [source]
+    for source, (resolution, indexes) in zip(sources, resolutions):
+        split = f",split={len(indexes)}" if len(indexes) > 1 else ''
+        filter_parts.append(f"{source}scale={resolution}{split}" + ''.join(f"[{prefix}vout{i}]" for i in indexes))
+
+    # Volume once, then one copy per output
+    audio_gain = channel.audio_gain if channel.audio_gain else 1.0
+    outputs = len(audio_groups(channel))
+    split = f",asplit={outputs}" if outputs > 1 else ''
+    filter_parts.append(f"{audio_in}volume={audio_gain}{split}" + ''.join(f"[{prefix}aout{g}]" for g in range(outputs)))
+
+    return ';'.join(filter_parts)
+
+
+def interlace_args(channel):
+    if channel.scan_type != 'interlaced':
+        return []
+    if channel.video_codec == 'libx264':
+        return ['-x264opts', 'tff=1:interlaced=1']
+    if channel.video_codec == 'mpeg2video':
+        return ['-flags', '+ildct+ilme', '-top', '1']
+    return []
+
+
+def codec_params_args(channel):
+    """Private encoder options, x265 interlacing included as it shares -x265-params."""
+    encoder = channel.encoder
+    if channel.video_codec == 'mpeg2video':
+        return ['-slices', str(encoder.slices)] if encoder.slices else []
+    if channel.video_codec not in ('libx264', 'libx265'):
+        return []
+    params = []
+    if channel.video_codec == 'libx265' and channel.scan_type == 'interlaced':
+        params += ['interlace=1', 'field=tff']
+    if encoder.lookahead_threads:
+        params.append(f'lookahead-threads={encoder.lookahead_threads}')
+    if encoder.rc_lookahead is not None:
+        params.append(f'rc-lookahead={encoder.rc_lookahead}')
+    if encoder.slices:
+        params.append(f'slices={encoder.slices}')
+    if not params:
+        return []
+    return [f"-{channel.video_codec[3:]}-params", ':'.join(params)]
+
+
+def output_args(channel, profile):
+    if profile.output_type == 'udp':
+        resolution_height = profile.resolution.split('x')[1]
+        return [
+            '-f', 'mpegts',
+            '-ttl', '50',
+            '-streamid', f'0:{profile.video_pid}',
+            '-streamid', f'1:{profile.audio_pid}',
+            '-mpegts_service_id', str(profile.service_id),
+            '-mpegts_pmt_start_pid', str(profile.pmt_pid),
+            '-mpegts_start_pid', str(profile.pcr_pid),
+            '-metadata', f'service_name={channel.name}@{resolution_height}',
+            '-metadata', f'service_provider={channel.name}',
+            f'udp://{profile.output_multicast_ip}?localaddr={profile.output_network}&pkt_size=1316',
+        ]
+    if profile.output_type == 'hls':
+        return [
+            '-f', 'hls', '-hls_time', '10', '-hls_list_size', '6',
+            '-hls_flags', 'delete_segments', profile.output_url
+        ]
+    if profile.output_type == 'rtmp':
+        return ['-f', 'flv', profile.output_url]
+    if profile.output_type == 'file':
+        return ['-f', 'mpegts', profile.output_url]
+    return []
+
+
+def abr_args(channel):
+    args = []
+    if has_logo(channel):
+        args += ['-i', channel.logo_path]
+    args += ['-filter_complex', abr_filter_graph(channel)]
+    args += abr_output_args(channel)
+    return args
+
+
+def tee_slave(profile, target, index, onfail=None):
+    """
+    Tee slave sending video stream `index` and the audio stream to `target`,
+    the profile itself or one of its extra outputs, with the muxer options
+    of output_args.
+    """
+    options = [f"select=\\'v:{index},a\\'"]
+    if onfail:
+        options.append(f'onfail={onfail}')
+    url = target.output_url
+    if target.output_type == 'udp':
+        options = ['f=mpegts', *options,
+                   f'mpegts_service_id={profile.service_id}',
+                   f'mpegts_pmt_start_pid={profile.pmt_pid}',
+                   f'mpegts_start_pid={profile.pcr_pid}',
+                   'pcr_period=20']
+        url = f'udp://{target.output_multicast_ip}?localaddr={target.output_network}&pkt_size=1316&ttl=50'
+    elif target.output_type == 'hls':
+        options = ['f=hls', *options, 'hls_time=10', 'hls_list_size=6', 'hls_flags=delete_segments']
+    elif target.output_type == 'rtmp':
+        options = ['f=flv', *options]
+    elif target.output_type == 'file':
+        options = ['f=mpegts', *options, 'pcr_period=20']
+    return f"[{':'.join(options)}]{url}"
+
+
+def sends_udp(profile):
+    return any(target.output_type == 'udp' for target in (profile, *profile.outputs))
+
+
+def tee_output_args(channel, profiles):
+    """
+    One tee output for profiles sharing an audio encode, with a slave per
+    profile and per extra output of a profile.
+    """
+    args = []
+    # PIDs are stream ids, so they are set on the tee output and kept by the slaves
+    for k, profile in enumerate(profiles):
+        if sends_udp(profile):
+            args += ['-streamid', f'{k}:{profile.video_pid}']
+    if any(sends_udp(profile) for profile in profiles):
+        args += ['-streamid', f'{len(profiles)}:{profiles[0].audio_pid}']
+    slaves = []
+    for k, profile in enumerate(profiles):
+        slaves.append(tee_slave(profile, profile, k))
+        # A failing extra destination must not take the main output down
+        slaves += [tee_slave(profile, target, k, onfail='ignore') for target in profile.outputs]
+    # Metadata is shared by all slaves, audio_groups only puts profiles with one service name together
+    name = service_name(channel, profiles[0])
+    if name:
+        args += ['-metadata', f'service_name={name}', '-metadata', f'service_provider={channel.name}']
+    args += ['-f', 'tee', '|'.join(slaves)]
+    return args
+
+
+def encoder_args(channel, profiles):
+    """Encoder options for one output, rate control set per video stream."""
+    encoder = channel.encoder
+    args = ['-c:v', channel.video_codec, '-c:a', channel.audio]
+    if channel.video_codec in ('libx264', 'libx265'):
+        preset = encoder.preset or DEFAULT_PRESETS.get(channel.video_codec)
+        if preset:
+            args += ['-preset', preset]
+        if encoder.tune:
+            args += ['-tune', encoder.tune]
+    if encoder.threads:
+        args += ['-threads:v', str(encoder.threads)]
+    args += [
+        '-aspect', str(channel.aspect_ratio),
+        '-r', str(channel.frame_rate),
+    ]
+    for k, profile in enumerate(profiles):
+        bitrate = str(profile.video_bitrate)
+        args += [f'-b:v:{k}', bitrate]
+        if channel.bitrate_mode.lower() == 'cbr':
+            args += [f'-minrate:v:{k}', bitrate, f'-maxrate:v:{k}', bitrate, f'-bufsize:v:{k}', str(profile.buffer_size)]
+        elif channel.bitrate_mode.lower() == 'vbr':
+            args += [f'-maxrate:v:{k}', bitrate, f'-bufsize:v:{k}', str(profile.buffer_size)]
+    args += [
+        '-g', '50',
+        '-bf', '2',
+        '-sc_threshold', '0',
+    ]
+    return args
+
+
+def abr_output_args(channel, prefix=''):
+    args = []
+    # One output per audio group, profiles in a group share one audio encode
+    for g, indexes in enumerate(audio_groups(channel)):
+        profiles = [channel.profiles[i] for i in indexes]
+        args += encoder_args(channel, profiles)
+        tee = len(profiles) > 1 or bool(profiles[0].outputs)
+        if not tee:
+            args += ['-pcr_period', '20']
+        args += interlace_args(channel)
+        args += codec_params_args(channel)
+        args += ['-b:a:0', str(profiles[0].audio_bitrate)]
+        for i in indexes:
+            args += ['-map', f'[{prefix}vout{i}]']
+        args += ['-map', f'[{prefix}aout{g}]']
+        if tee:
+            args += tee_output_args(channel, profiles)
+        else:
+            args += output_args(channel, profiles[0])
+    return args
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _build(snapshot):
+    # Progress goes to stdout as key=value blocks, logs stay on stderr
+    command = ['ffmpeg', '-progress', 'pipe:1']
+    command += input_args(snapshot)
+    if snapshot.is_abr and snapshot.profiles:
+        command += abr_args(snapshot)
+    return tuple(command)
+
+
+def build_command(snapshot):
+    """Return the FFmpeg argv for a ChannelSnapshot."""
+    return list(_build(snapshot))
+
+
+_snapshot_cache = OrderedDict()
+_channel_cache = OrderedDict()
+
+
+def _cached(cache, key, build):
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache[key] = value
+        if len(cache) > CACHE_SIZE:
+            cache.popitem(last=False)
+    else:
+        cache.move_to_end(key)
+    return value
+
+
+def channel_snapshot(channel):
+    """
+    ChannelSnapshot of a Channel without default threads, cached per
+    (id, updated_at) so the ABR profiles are only queried when it changed.
+    """
+    return _cached(_snapshot_cache, (channel.pk, channel.updated_at), lambda: ChannelSnapshot.from_model(channel))
+
+
+def command_for_channel(channel, threads=None):
+    """
+    Return the FFmpeg argv for a Channel, `threads` as in from_model.
+    Cached per (id, updated_at, threads), so the ABR profiles are only
+    queried when the channel changed.
+    """
+    def build():
+        snapshot = channel_snapshot(channel)
+        if threads and not snapshot.encoder.threads:
+            snapshot = replace(snapshot, encoder=replace(snapshot.encoder, threads=threads))
+        return _build(snapshot)
+
+    return list(_cached(_channel_cache, (channel.pk, channel.updated_at, threads), build))
+
+
+def shared_input_key(channel):
+    """
+    Identify the input of a channel that can share its decode with others,
+    or None. Only ABR channels are shared, they map their outputs from the
+    filter graph and so fit into one combined graph.
+    """
+    if not (channel.is_abr and input_args(channel)):
+        return None
+    return ' '.join(input_args(channel))
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def _build_shared(snapshots):
+    if len(snapshots) == 1:
+        return _build(snapshots[0])
+
+    command = ['ffmpeg', '-progress', 'pipe:1']
+    command += input_args(snapshots[0])
+
+    # Logos come after the shared input, numbered in channel order
+    logo_inputs = {}
+    for n, channel in enumerate(snapshots):
+        if has_logo(channel):
+            logo_inputs[n] = len(logo_inputs) + 1
+            command += ['-i', channel.logo_path]
+
+    # Decode once, then give every channel its own copy of video and audio
+    count = len(snapshots)
+    filter_parts = [
+        f"[0:v]split={count}" + ''.join(f"[c{n}_in_v]" for n in range(count)),
+        f"[0:a]asplit={count}" + ''.join(f"[c{n}_in_a]" for n in range(count)),
+    ]
+    for n, channel in enumerate(snapshots):
+        filter_parts.append(abr_filter_graph(
+            channel, f"[c{n}_in_v]", f"[c{n}_in_a]", f"[{logo_inputs.get(n)}:v]", prefix=f"c{n}_"
+        ))
+    command += ['-filter_complex', ';'.join(filter_parts)]
+
+    for n, channel in enumerate(snapshots):
+        command += abr_output_args(channel, prefix=f"c{n}_")
+    return tuple(command)
+
+
+def build_shared_command(snapshots):
+    """Return one FFmpeg argv encoding every snapshot from their common input."""
+    snapshots = tuple(snapshots)
+    keys = {shared_input_key(s) for s in snapshots}
+    if len(keys) != 1 or None in keys:
+        raise ValueError("Only ABR channels with the same input can share an FFmpeg process")
+    return list(_build_shared(snapshots))
+
+
+def shared_command_for_jobs(job_ids):
+    """Build the shared FFmpeg argv for the channels of `job_ids`, in job id order."""
+    from .models import Channel
+
+    channels = Channel.objects.filter(jobs__id__in=job_ids).select_related(
+        'jobs', 'encoder_profile'
+    ).prefetch_related('abr__outputs')
+    channels = sorted(channels, key=lambda c: c.jobs.id)
+    # The process's encoders share the default thread budget
+    threads = default_encoder_threads(sum(len(c.abr.all()) for c in channels), [c.id for c in channels])
+    return build_shared_command(ChannelSnapshot.from_model(c, c.abr.all(), threads) for c in channels)
@@ -0,0 +1,61 @@
+import time
+from collections import deque
+from django.conf import settings
+
+# Defaults, each can be overridden in settings with the same name
+STALL_TIMEOUT = 10          # seconds without a new frame
+MIN_SPEED = 0.95            # below this FFmpeg is slower than real-time
+SLOW_TIMEOUT = 30           # seconds below MIN_SPEED before restarting
+DROP_WINDOW = 60            # seconds of history for dropped/duplicated frames
+MAX_DROPPED_FRAMES = 250    # dropped + duplicated frames allowed per DROP_WINDOW
+
+
+class StallDetector:
+    """
+    Watches the progress stats of one FFmpeg process and returns a reason
+    when it should be restarted: frames not advancing, speed under
+    real-time for too long, or dropped/duplicated frames piling up.
+    """
+
+    def __init__(self):
+        self.stall_timeout = getattr(settings, 'STALL_TIMEOUT', STALL_TIMEOUT)
+        self.min_speed = getattr(settings, 'MIN_SPEED', MIN_SPEED)
+        self.slow_timeout = getattr(settings, 'SLOW_TIMEOUT', SLOW_TIMEOUT)
+        self.drop_window = getattr(settings, 'DROP_WINDOW', DROP_WINDOW)
+        self.max_dropped_frames = getattr(settings, 'MAX_DROPPED_FRAMES', MAX_DROPPED_FRAMES)
+        self.last_frame = None
+        self.frame_changed_at = None
+        self.slow_since = None
+        self.drops = deque()
+
+    def check(self, stats, now=None):
+        now = time.time() if now is None else now
+        if stats.updated_at is None:
+            return None  # no progress yet, the startup watchdog covers this
+
+        # Frame counter not advancing, also catches FFmpeg no longer reporting at all
+        if stats.frame != self.last_frame:
+            self.last_frame = stats.frame
+            self.frame_changed_at = now
+        elif now - self.frame_changed_at >= self.stall_timeout:
+            return f"Stalled: no new frames for {int(now - self.frame_changed_at)}s"
+
+        # Sustained encoding below real-time
+        if stats.speed is not None and stats.speed < self.min_speed:
+            if self.slow_since is None:
+                self.slow_since = now
+            elif now - self.slow_since >= self.slow_timeout:
+                return f"Degraded: encoding at {stats.speed}x real-time for {int(now - self.slow_since)}s"
+        else:
+            self.slow_since = None
+
+        # Dropped and duplicated frames rising within the window
+        lost = (stats.drop_frames or 0) + (stats.dup_frames or 0)
+        self.drops.append((now, lost))
+        while self.drops and now - self.drops[0][0] > self.drop_window:
+            self.drops.popleft()
+        increase = lost - self.drops[0][1]
+        if increase > self.max_dropped_frames:
+            return f"Degraded: {increase} dropped/duplicated frames in the last {self.drop_window}s"
+
+        return None
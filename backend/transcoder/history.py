@@ -0,0 +1,98 @@
+"""
+Job history.
+
+The job row only holds the latest start, end and error of a channel, so
+every start, running, exit, retry, stop, stall and error is also appended
+to JobEvent. The supervisor collects its events in an EventBuffer and
+writes them with one bulk insert every EVENT_FLUSH_INTERVAL seconds;
+Celery tasks write their rare events directly.
+
+Events older than JOB_EVENT_RETENTION_DAYS are rolled up into daily counts
+per channel and kind (JobEventRollup) and deleted in chunks by a periodic
+task, so the table only grows with the retention window.
+"""
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, F
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+from .models import JobEvent, JobEventRollup, TranscodingJob
+from .nodes import local_node_name
+
+# Defaults, each can be overridden in settings with the same name
+EVENT_FLUSH_INTERVAL = 2            # seconds between the supervisor's event writes
+JOB_EVENT_RETENTION_DAYS = 90       # raw events kept, older ones only as daily counts
+JOB_EVENT_ROLLUP_BATCH = 10000      # events rolled up and deleted per transaction
+
+
+def write_events(events):
+    """Insert (job id, kind, timestamp, exit code, message) events in one query, skipping deleted jobs."""
+    if not events:
+        return 0
+    channels = dict(TranscodingJob.objects.filter(id__in={e[0] for e in events}).values_list('id', 'channel_id'))
+    node = local_node_name()
+    rows = [
+        JobEvent(
+            channel_id=channels[job_id], kind=kind, timestamp=timestamp,
+            exit_code=exit_code, message=message, node=node,
+        )
+        for job_id, kind, timestamp, exit_code, message in events if job_id in channels
+    ]
+    JobEvent.objects.bulk_create(rows, batch_size=500)
+    return len(rows)
+
+
+def record_event(job_id, kind, exit_code=None, message=None):
+    """Write one event right away, for paths outside the supervisor."""
+    return write_events([(job_id, kind, timezone.now(), exit_code, message)])
+
+
+class EventBuffer:
+    """Events of the supervisor waiting for the next batch write."""
+
+    def __init__(self):
+        self.events = []
+
+    def add(self, job_id, kind, exit_code=None, message=None):
+        self.events.append((job_id, kind, timezone.now(), exit_code, message))
+
+    def drain(self):
+        events, self.events = self.events, []
+        return events
+
+
+def rollup_events(now=None, retention_days=None, batch=None):
+    """
+    Fold the events older than the retention window into JobEventRollup and
+    delete them, oldest first, `batch` events per transaction. Returns the
+    number of events rolled up.
+    """
+    now = now or timezone.now()
+    if retention_days is None:
+        retention_days = getattr(settings, 'JOB_EVENT_RETENTION_DAYS', JOB_EVENT_RETENTION_DAYS)
+    batch = batch or getattr(settings, 'JOB_EVENT_ROLLUP_BATCH', JOB_EVENT_ROLLUP_BATCH)
+    cutoff = now - timedelta(days=retention_days)
+
+    total = 0
+    while True:
+        with transaction.atomic():
+            # The timestamp index gives the oldest events without scanning the table
+            ids = list(
+                JobEvent.objects.filter(timestamp__lt=cutoff).order_by('timestamp', 'id').values_list('id', flat=True)[:batch]
+            )
+            if not ids:
+                break
+            counts = (
+                JobEvent.objects.filter(id__in=ids).annotate(day=TruncDate('timestamp'))
+                .values('channel_id', 'day', 'kind').annotate(n=Count('id'))
+            )
+            for row in counts:
+                rollup, created = JobEventRollup.objects.get_or_create(
+                    channel_id=row['channel_id'], day=row['day'], kind=row['kind'], defaults={'count': row['n']},
+                )
+                if not created:
+                    JobEventRollup.objects.filter(id=rollup.id).update(count=F('count') + row['n'])
+            JobEvent.objects.filter(id__in=ids).delete()
+        total += len(ids)
+    return total
@@ -0,0 +1,47 @@
+"""
+Job status state machine.
+
+Every status change is a single compare-and-set UPDATE:
+
+    UPDATE transcoder_transcodingjob SET status=... WHERE id=... AND status IN (...)
+
+so concurrent writers (supervisor, Celery tasks, API) never overwrite a
+newer status with a stale in-memory copy of the job.
+"""
+from django.db.models import F
+from .models import TranscodingJob
+from .events import broadcast_job_status
+
+ALL_STATUSES = [status for status, _ in TranscodingJob.STATUS_CHOICES]
+
+# Target status -> statuses it may be entered from
+ALLOWED_TRANSITIONS = {
+    'queued': ['stopped', 'error', 'completed'],       # start waiting for capacity
+    'pending': ['queued', 'stopped', 'error', 'completed', 'running'],   # any (re)start, not twice
+    'running': ['pending'],
+    'completed': ['running'],
+    'error': ['stopped', 'pending', 'running'],
+    'stopped': ['queued', 'pending', 'running', 'error'],
+}
+
+
+def transition(job_id, status, from_statuses=None, **fields):
+    """
+    Move a job to `status` if it is currently in one of `from_statuses`
+    (defaults to ALLOWED_TRANSITIONS), writing `fields` in the same query.
+    Returns True if the transition happened.
+    """
+    if from_statuses is None:
+        from_statuses = ALLOWED_TRANSITIONS[status]
+    updated = TranscodingJob.objects.filter(id=job_id, status__in=from_statuses).update(
+        status=status, version=F('version') + 1, **fields
+    )
+    if updated:
+        extra = {'error_message': fields['error_message']} if 'error_message' in fields else {}
+        broadcast_job_status(job_id, status, **extra)
+    return bool(updated)
+
+
+def update_job(job_id, **fields):
+    """Write non-status fields of a job in one query."""
+    return bool(TranscodingJob.objects.filter(id=job_id).update(version=F('version') + 1, **fields))
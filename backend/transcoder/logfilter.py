@@ -0,0 +1,90 @@
+import re, time
+from django.conf import settings
+
+# Defaults, each can be overridden in settings with the same name
+LOG_PROGRESS_INTERVAL = 10      # seconds between logged progress lines, 0 logs all of them
+LOG_REPEAT_WINDOW = 30          # seconds a repeated warning is counted instead of logged
+
+PROGRESS_LINE = re.compile(rb'^(frame|size)=.*\btime=')
+ERROR_LINE = re.compile(
+    rb'error|fatal|failed|failure|could not|cannot|unable to|no such|denied|refused|timed out|invalid', re.I
+)
+# Same warning with other numbers or addresses, e.g. "[h264 @ 0x55d0] error at 12 7"
+VARIABLE_PARTS = re.compile(rb'0x[0-9a-fA-F]+|\d+')
+
+
+class LogFilter:
+    """
+    Thins the stderr of one FFmpeg process before it reaches the channel
+    log: progress lines are sampled to one per `progress_interval` seconds,
+    and a component warning ("[name @ 0x...] ...") seen again within
+    `repeat_window` seconds is counted and summed up as "Last message
+    repeated N times". Errors and all other lines (banner, stream mapping,
+    state changes) are always kept.
+    """
+
+    def __init__(self, progress_interval=None, repeat_window=None):
+        if progress_interval is None:
+            progress_interval = getattr(settings, 'LOG_PROGRESS_INTERVAL', LOG_PROGRESS_INTERVAL)
+        if repeat_window is None:
+            repeat_window = getattr(settings, 'LOG_REPEAT_WINDOW', LOG_REPEAT_WINDOW)
+        self.progress_interval = progress_interval
+        self.repeat_window = repeat_window
+        self.progress_at = None
+        self.held_progress = None   # latest progress line not logged yet
+        self.repeats = {}           # warning without numbers -> [first logged at, times repeated, latest line]
+        self.lines_in = 0
+        self.lines_out = 0
+
+    def feed(self, lines, now=None):
+        """Return the lines of `lines` to log."""
+        now = time.time() if now is None else now
+        kept = []
+        for line in lines:
+            if PROGRESS_LINE.match(line):
+                if self.progress_at is None or now - self.progress_at >= self.progress_interval:
+                    kept.append(line)
+                    self.progress_at, self.held_progress = now, None
+                else:
+                    self.held_progress = line
+            elif line.startswith(b'[') and not ERROR_LINE.search(line):
+                key = VARIABLE_PARTS.sub(b'#', line)
+                repeat = self.repeats.get(key)
+                if repeat and now - repeat[0] < self.repeat_window:
+                    repeat[1] += 1
+                    repeat[2] = line
+                    continue
+                if repeat and repeat[1]:
+                    kept.append(self.summary(repeat))
+                self.repeats[key] = [now, 0, line]
+                kept.append(line)
+            else:
+                kept.append(line)
+        kept += self.expire(now)
+        self.lines_in += len(lines)
+        self.lines_out += len(kept)
+        return kept
+
+    def expire(self, now):
+        """Summaries of the warnings whose window has passed."""
+        kept = []
+        for key, repeat in list(self.repeats.items()):
+            if now - repeat[0] >= self.repeat_window:
+                if repeat[1]:
+                    kept.append(self.summary(repeat))
+                del self.repeats[key]
+        return kept
+
+    def finish(self):
+        """Lines still held back when FFmpeg exits: pending summaries and the last progress line."""
+        kept = [self.summary(repeat) for repeat in self.repeats.values() if repeat[1]]
+        self.repeats = {}
+        if self.held_progress:
+            kept.append(self.held_progress)
+            self.held_progress = None
+        self.lines_out += len(kept)
+        return kept
+
+    @staticmethod
+    def summary(repeat):
+        return b'Last message repeated %d times: %s' % (repeat[1], repeat[2])
@@ -0,0 +1,157 @@
+"""
+Reading channel logs for the API.
+
+The active log is read in blocks between the offsets of its sparse index
+(see logsink.py): the tail walks blocks backwards from the end and a
+`since` query seeks to the last indexed line before that time, so neither
+reads more than a block or two beyond the lines it returns. Rotated
+segments are only opened when the active log doesn't cover the query.
+
+New lines are read by polling: every read returns a position (inode and
+end offset of the active log) and the next one reads from there, either by
+the client (?after=) or by the log websocket (see consumers.py), so no
+sync web worker waits for lines to be written.
+"""
+import bisect, os, re, time
+from .logsink import log_timestamp, open_segment, read_index, segments
+from .logfilter import ERROR_LINE
+
+LEVELS = ['info', 'warning', 'error']
+BLOCK_SIZE = 64 * 1024      # block size for logs written before they were indexed
+MAX_READ = 1024 * 1024      # bytes read after a position per poll, the rest on the next one
+MAX_TAIL = 5000             # most lines a tail returns
+
+# Defaults, each can be overridden in settings with the same name
+LOG_FOLLOW_INTERVAL = 1.0   # seconds between reads of a log followed over the websocket
+SEGMENT_TIME = re.compile(r'\.(\d{8}-\d{6})-\d+')
+
+
+def line_level(line):
+    """'error', 'warning' (FFmpeg component messages) or 'info', from a log line with its timestamp."""
+    message = line.partition(b' - ')[2]
+    if ERROR_LINE.search(message):
+        return 'error'
+    if message.startswith(b'['):
+        return 'warning'
+    return 'info'
+
+
+def line_filter(since=None, level=None, q=None):
+    """Predicate for log lines: written at or after `since` (unix time), at least `level`, containing `q`."""
+    since_text = log_timestamp(since).encode() if since is not None else None
+    min_level = LEVELS.index(level) if level else 0
+    needle = q.lower().encode() if q else None
+
+    def keep(line):
+        # Timestamps sort as text, "2025-01-01 12:00:00,123 - ..."
+        if since_text and line[:len(since_text)] < since_text:
+            return False
+        if min_level and LEVELS.index(line_level(line)) < min_level:
+            return False
+        return not needle or needle in line.lower()
+    return keep
+
+
+def block_offsets(index, size):
+    """Offsets splitting the active log in blocks: its index, or fixed blocks where it has none."""
+    offsets = [offset for _, offset in index if offset < size]
+    if not offsets or offsets[0] > 0:
+        # The start of a log written before indexing
+        offsets = list(range(0, offsets[0] if offsets else size, BLOCK_SIZE)) + offsets
+    return offsets or [0]
+
+
+def read_backwards(f, offsets, size, line_starts=()):
+    """
+    Yield the lines of each block from the end, newest block first (lines
+    in file order). Blocks not starting on a line (not in `line_starts`)
+    hand their first piece to the block before.
+    """
+    end, carry = size, b''
+    for start in reversed(offsets):
+        f.seek(start)
+        data = f.read(end - start) + carry
+        carry = b''
+        if start > 0 and start not in line_starts:
+            carry, _, data = data.partition(b'\n')
+        yield [line for line in data.split(b'\n') if line]
+        end = start
+
+
+def segment_end(path):
+    """Rotation time of a segment (unix time), from its name."""
+    match = SEGMENT_TIME.search(os.path.basename(path))
+    return time.mktime(time.strptime(match.group(1), '%Y%m%d-%H%M%S')) + 1 if match else 0
+
+
+def read_segment(path):
+    with open_segment(path) as f:
+        return [line for line in f.read().split(b'\n') if line]
+
+
+def search(path, tail=100, since=None, level=None, q=None):
+    """
+    The last `tail` lines of the log at `path` (with its rotated segments)
+    matching the filters, oldest first. Returns (lines, position), the
+    position (inode, end offset of the active log) being where read_after
+    continues.
+    """
+    keep = line_filter(since, level, q)
+    found = []
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        f, position = None, (0, 0)
+    if f:
+        with f:
+            stat = os.fstat(f.fileno())
+            size, position = stat.st_size, (stat.st_ino, stat.st_size)
+            index = [(t, offset) for t, offset in read_index(path) if offset < size]
+            offsets = block_offsets(index, size)
+            if since is not None:
+                # Only the blocks from the last index entry before `since`
+                first = bisect.bisect_right([t for t, _ in index], since) - 1
+                if first >= 0:
+                    offsets = offsets[offsets.index(index[first][1]):]
+            for lines in read_backwards(f, offsets, size, {offset for _, offset in index}):
+                found = [line for line in lines if keep(line)] + found
+                if len(found) >= tail:
+                    return found[-tail:], position
+            started = offsets[0] == 0
+        if not started:
+            return found[-tail:], position
+
+    # Older lines are in the rotated segments, newest first
+    for segment in reversed(segments(path)):
+        if since is not None and segment_end(segment) < since:
+            break
+        found = [line for line in read_segment(segment) if keep(line)] + found
+        if len(found) >= tail:
+            break
+    return found[-tail:], position
+
+
+def read_after(path, position, level=None, q=None, max_read=MAX_READ):
+    """
+    Matching lines of the active log written after `position` (from search
+    or a previous read_after), without waiting for new ones. Returns (lines,
+    position). A rotated log is read from its start; a line still being
+    written is left for the next read.
+    """
+    keep = line_filter(level=level, q=q)
+    inode, offset = position
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return [], (0, 0)
+    with f:
+        stat = os.fstat(f.fileno())
+        if stat.st_ino != inode or stat.st_size < offset:
+            offset = 0
+        f.seek(offset)
+        data = f.read(min(stat.st_size - offset, max_read))
+    end = data.rfind(b'\n') + 1
+    if not end and len(data) == max_read:
+        end = len(data)     # a single line longer than max_read
+    lines = [line for line in data[:end].split(b'\n') if line and keep(line)]
+    return lines, (stat.st_ino, offset + end)
@@ -0,0 +1,286 @@
+"""
+Per-channel FFmpeg logs.
+
+The active log of a channel is `<name>.log`. It is rotated when it reaches
+LOG_MAX_SIZE or when a new LOG_ROTATE_INTERVAL period starts (daily by
+default). The rotated segment (`<name>.log.<YYYYmmdd-HHMMSS-micro>`) is
+compressed on a background thread, with zstd if the zstandard package is
+installed and LOG_COMPRESSION asks for it, else gzip. The compressed
+segments of a channel are kept within LOG_RETENTION_BYTES and
+LOG_RETENTION_DAYS, and all channels together within LOG_TOTAL_BYTES.
+The oldest segments are deleted first.
+
+Next to the active log a sparse index (`<name>.idx`) records the time and
+byte offset of a line every LOG_INDEX_SPACING bytes, so readers can seek
+to a time or read the end of the log block by block (see logread.py).
+"""
+import glob, gzip, os, queue, re, shutil, struct, threading, time
+from datetime import datetime
+from django.conf import settings
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# Defaults, each can be overridden in settings with the same name
+LOG_MAX_SIZE = 5 * 1024 * 1024              # active log size before rotating
+LOG_ROTATE_INTERVAL = 24 * 3600             # seconds, a new period starts a new segment
+LOG_COMPRESSION = 'gzip'                    # 'gzip', 'zstd' or 'none'
+LOG_RETENTION_BYTES = 10 * 1024 * 1024      # compressed history per channel
+LOG_RETENTION_DAYS = 14
+LOG_TOTAL_BYTES = 2 * 1024 * 1024 * 1024    # compressed history of all channels
+LOG_INDEX_SPACING = 16 * 1024               # bytes of log between two index entries
+FLUSH_BYTES = 64 * 1024
+COMPRESSED = ('.gz', '.zst')
+INDEX_ENTRY = struct.Struct('<dQ')          # unix time of a line, its byte offset
+
+
+def setting(name):
+    return getattr(settings, name, globals()[name])
+
+
+def channel_log_path(name):
+    """Log file of the channel called `name`."""
+    log_dir = getattr(settings, 'CHANNEL_LOG_DIR', None) or os.path.abspath(os.path.join('logs', 'channels'))
+    return os.path.join(log_dir, re.sub(r'[^a-zA-Z0-9_-]', '_', name) + '.log')
+
+
+def index_path(path):
+    return os.path.splitext(path)[0] + '.idx'
+
+
+def read_index(path):
+    """[(unix time, offset)] of the index of the active log at `path`, oldest first."""
+    try:
+        with open(index_path(path), 'rb') as f:
+            data = f.read()
+    except FileNotFoundError:
+        return []
+    # A partly written last entry is ignored
+    data = data[:len(data) - len(data) % INDEX_ENTRY.size]
+    return list(INDEX_ENTRY.iter_unpack(data))
+
+
+def log_timestamp(now=None):
+    # Same format as logging's default asctime, e.g. 2025-01-01 12:00:00,123
+    now = time.time() if now is None else now
+    return time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now)) + f",{int(now % 1 * 1000):03d}"
+
+
+class ChannelLog:
+    """
+    Buffered per-channel log file.
+
+    Lines are queued in memory and written in batches by `flush`, and the
+    file size is tracked from what was written instead of stat-ing the
+    file, so a busy FFmpeg costs one write per batch. Full or outdated
+    files are rotated and handed to the compressor.
+    """
+
+    def __init__(self, path, max_size=None, rotate_interval=None):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.path = path
+        self.max_size = max_size or setting('LOG_MAX_SIZE')
+        self.rotate_interval = rotate_interval or setting('LOG_ROTATE_INTERVAL')
+        self.index_spacing = setting('LOG_INDEX_SPACING')
+        self.file = open(path, 'ab')
+        self.size = self.file.tell()
+        # Period of the last write, a log reopened after a restart keeps its own
+        self.period = self.period_of(os.path.getmtime(path) if self.size else time.time())
+        self.open_index()
+        self.buffer = []
+        self.buffered = 0
+        self.buffer_time = None     # time of the first buffered line, for the index
+
+    def open_index(self):
+        entries = read_index(self.path)
+        # An index ahead of the log (log replaced or truncated) starts over
+        if self.size == 0 or (entries and entries[-1][1] >= self.size):
+            entries = []
+            open(index_path(self.path), 'wb').close()
+        self.index = open(index_path(self.path), 'ab')
+        self.indexed_at = entries[-1][1] if entries else None
+
+    def period_of(self, timestamp):
+        return int(timestamp // self.rotate_interval)
+
+    def write_lines(self, lines, timestamp=None):
+        """Queue raw byte lines, all stamped with the same time."""
+        if not lines:
+            return
+        timestamp = time.time() if timestamp is None else timestamp
+        if self.buffer_time is None:
+            self.buffer_time = timestamp
+        prefix = log_timestamp(timestamp).encode() + b' - '
+        for line in lines:
+            entry = prefix + line + b'\n'
+            self.buffer.append(entry)
+            self.buffered += len(entry)
+        if self.buffered >= FLUSH_BYTES:
+            self.flush()
+
+    def write(self, message):
+        self.write_lines([message.encode('utf-8', 'replace')])
+
+    def flush(self):
+        if not self.buffer or self.file.closed:
+            return
+        data = b''.join(self.buffer)
+        buffer_time = self.buffer_time
+        self.buffer = []
+        self.buffered = 0
+        self.buffer_time = None
+
+        period = self.period_of(time.time())
+        if self.size and (self.size + len(data) > self.max_size or period != self.period):
+            self.rotate()
+        self.period = period
+
+        # Batches start on a line, index one every LOG_INDEX_SPACING bytes
+        if self.indexed_at is None or self.size - self.indexed_at >= self.index_spacing:
+            self.index.write(INDEX_ENTRY.pack(buffer_time, self.size))
+            self.index.flush()
+            self.indexed_at = self.size
+
+        self.file.write(data)
+        self.file.flush()
+        self.size += len(data)
+
+    def rotate(self):
+        """Move the current file aside as a segment and start an empty one."""
+        self.file.close()
+        segment = f"{self.path}.{datetime.now().strftime('%Y%m%d-%H%M%S-%f')}"
+        os.rename(self.path, segment)
+        self.file = open(self.path, 'ab')
+        self.size = 0
+        # Segments are read whole, only the active log is indexed
+        self.index.close()
+        self.open_index()
+        compressor.submit(segment, self.path)
+
+    def close(self):
+        self.flush()
+        self.file.close()
+        self.index.close()
+
+
+class SharedLog:
+    """Writes the output of a shared FFmpeg to the log of every channel it encodes."""
+
+    def __init__(self, paths, max_size=None):
+        self.logs = [ChannelLog(path, max_size) for path in paths]
+
+    def write_lines(self, lines, timestamp=None):
+        timestamp = time.time() if timestamp is None else timestamp
+        for log in self.logs:
+            log.write_lines(lines, timestamp)
+
+    def write(self, message):
+        for log in self.logs:
+            log.write(message)
+
+    def flush(self):
+        for log in self.logs:
+            log.flush()
+
+    def close(self):
+        for log in self.logs:
+            log.close()
+
+
+def segments(path):
+    """Rotated segments of the log at `path`, oldest first."""
+    return sorted(p for p in glob.glob(glob.escape(path) + '.*') if not p.endswith('.tmp'))
+
+
+def open_segment(path):
+    """Binary reader for a log file or segment, compressed or not."""
+    if path.endswith('.gz'):
+        return gzip.open(path, 'rb')
+    if path.endswith('.zst'):
+        return zstandard.ZstdDecompressor().stream_reader(open(path, 'rb'), closefd=True)
+    return open(path, 'rb')
+
+
+def compress(segment, method=None):
+    """Compress a rotated segment next to it and remove the original. Returns the new path."""
+    method = method or setting('LOG_COMPRESSION')
+    if method == 'zstd' and zstandard is None:
+        method = 'gzip'     # zstandard not installed
+    if method == 'none':
+        return segment
+    target = segment + ('.zst' if method == 'zstd' else '.gz')
+    with open(segment, 'rb') as src, open(target + '.tmp', 'wb') as dst:
+        if method == 'zstd':
+            zstandard.ZstdCompressor(level=10).copy_stream(src, dst)
+        else:
+            with gzip.GzipFile(fileobj=dst, mode='wb', compresslevel=6, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, 1024 * 1024)
+    # Keep the time of the last line, retention goes by it
+    mtime = os.path.getmtime(segment)
+    os.rename(target + '.tmp', target)
+    os.utime(target, (mtime, mtime))
+    os.remove(segment)
+    return target
+
+
+def enforce_retention(path, now=None):
+    """Delete the oldest segments of `path` beyond the channel budget, then of all logs beyond the total one."""
+    now = now or time.time()
+    max_age = setting('LOG_RETENTION_DAYS') * 86400
+    budget = setting('LOG_RETENTION_BYTES')
+    kept = 0
+    for segment in reversed(segments(path)):
+        size = os.path.getsize(segment)
+        if kept + size > budget or now - os.path.getmtime(segment) > max_age:
+            os.remove(segment)
+        else:
+            kept += size
+
+    # All channels in the directory, the oldest segment of any channel goes first
+    everything = [p for p in glob.glob(os.path.join(glob.escape(os.path.dirname(path)), '*.log.*')) if not p.endswith('.tmp')]
+    sizes = {p: os.path.getsize(p) for p in everything}
+    total = sum(sizes.values())
+    for segment in sorted(everything, key=os.path.getmtime):
+        if total <= setting('LOG_TOTAL_BYTES'):
+            break
+        os.remove(segment)
+        total -= sizes[segment]
+
+
+class Compressor:
+    """Compresses rotated segments and applies the retention budgets on one background thread."""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def submit(self, segment, path):
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name='log-compressor', daemon=True)
+                self.thread.start()
+        self.queue.put((segment, path))
+
+    def run(self):
+        while True:
+            segment, path = self.queue.get()
+            try:
+                # Segments left raw by an earlier run are compressed too
+                for raw in segments(path):
+                    if not raw.endswith(COMPRESSED):
+                        compress(raw)
+                enforce_retention(path)
+            except Exception as e:
+                print(f"Could not compress {segment}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def join(self):
+        """Wait until every submitted segment is done."""
+        self.queue.join()
+
+
+compressor = Compressor()
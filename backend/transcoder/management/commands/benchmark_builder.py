@@ -0,0 +1,52 @@
+import time
+from django.core.management.base import BaseCommand
+from transcoder.ffmpeg_builder import ABRSnapshot, ChannelSnapshot, build_command, _build
+
+LADDER = ['1920x1080', '1280x720', '854x480', '640x360']
+
+
+def make_snapshot(i):
+    profiles = tuple(
+        ABRSnapshot(
+            output_type='udp', output_url=None, output_multicast_ip=f'239.2.{i % 250}.{p + 1}:5000',
+            output_network='10.0.0.1', video_bitrate=4000000 // (p + 1), audio_bitrate=128000,
+            buffer_size=8000000 // (p + 1), resolution=resolution, service_id=p + 1,
+            video_pid=101, audio_pid=102, pmt_pid=4096, pcr_pid=256,
+        )
+        for p, resolution in enumerate(LADDER)
+    )
+    return ChannelSnapshot(
+        name=f'bench-{i}', input_type='udp', input_url=None, input_multicast_ip=f'239.1.{i % 250}.1:5000',
+        input_network='10.0.0.2', input_file=None, is_abr=True, video_codec='libx264', audio='aac',
+        audio_gain=1.0, bitrate_mode='vbr', scan_type='progressive', aspect_ratio='16:9', frame_rate=25,
+        logo_path='/media/logo.png', logo_position='x=10:y=10', logo_opacity=1.0, profiles=profiles,
+    )
+
+
+class Command(BaseCommand):
+    help = "Time FFmpeg command building for N four-profile ABR channels, uncached and cached"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--channels', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = options['channels']
+        snapshots = [make_snapshot(i) for i in range(count)]
+        _build.cache_clear()
+
+        started = time.perf_counter()
+        for snapshot in snapshots:
+            _build.__wrapped__(snapshot)
+        uncached = time.perf_counter() - started
+
+        for snapshot in snapshots:
+            build_command(snapshot)
+        started = time.perf_counter()
+        for snapshot in snapshots:
+            build_command(snapshot)
+        cached = time.perf_counter() - started
+
+        per_1000 = 1000 / count
+        self.stdout.write(f"{count} channels, {len(LADDER)} profiles each")
+        self.stdout.write(f"uncached: {uncached * per_1000 * 1000:.1f} ms per 1000 channels")
+        self.stdout.write(f"cached:   {cached * per_1000 * 1000:.1f} ms per 1000 channels")
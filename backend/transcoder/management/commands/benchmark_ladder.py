@@ -0,0 +1,86 @@
+import json, os, resource, statistics, subprocess, tempfile, time
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from transcoder.ffmpeg_builder import ABRSnapshot, ChannelSnapshot, build_command
+from transcoder.placement import job_cost
+
+
+def make_ladder(resolutions, audio_bitrates, output_dir):
+    return tuple(
+        ABRSnapshot(
+            output_type='file', output_url=os.path.join(output_dir, f'{p}.ts'), output_multicast_ip=None,
+            output_network=None, video_bitrate=4000000 // (p + 1), audio_bitrate=audio_bitrate,
+            buffer_size=8000000 // (p + 1), resolution=resolution, service_id=p + 1,
+            video_pid=101, audio_pid=102, pmt_pid=4096, pcr_pid=256,
+        )
+        for p, (resolution, audio_bitrate) in enumerate(zip(resolutions, audio_bitrates))
+    )
+
+
+class Command(BaseCommand):
+    help = "Measure the CPU time FFmpeg needs for one ABR ladder on a generated test clip"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--ffmpeg', default='ffmpeg')
+        parser.add_argument('--seconds', type=int, default=10, help="length of the test clip")
+        parser.add_argument('--resolutions', default='1920x1080,1280x720,854x480,640x360')
+        parser.add_argument('--audio-bitrates', default='128000', help="one value for all profiles, or one per profile")
+        parser.add_argument('--codec', default='libx264')
+        parser.add_argument('--runs', type=int, default=3)
+        parser.add_argument('--calibrate', action='store_true',
+                            help="save the measured cores per encode cost unit to CAPACITY_FILE for admission control")
+
+    def handle(self, *args, **options):
+        resolutions = options['resolutions'].split(',')
+        audio_bitrates = [int(b) for b in options['audio_bitrates'].split(',')]
+        if len(audio_bitrates) == 1:
+            audio_bitrates *= len(resolutions)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            clip = os.path.join(tmp, 'input.mkv')
+            self.run([
+                options['ffmpeg'], '-v', 'error', '-f', 'lavfi', '-i', 'testsrc2=size=1920x1080:rate=25',
+                '-f', 'lavfi', '-i', 'sine=frequency=440:sample_rate=48000', '-t', str(options['seconds']),
+                '-c:v', 'libx264', '-preset', 'ultrafast', '-c:a', 'aac', clip,
+            ])
+
+            snapshot = ChannelSnapshot(
+                name='benchmark', input_type='file', input_url=None, input_multicast_ip=None, input_network=None,
+                input_file=clip, is_abr=True, video_codec=options['codec'], audio='aac', audio_gain=1.0,
+                bitrate_mode='vbr', scan_type='progressive', aspect_ratio='16:9', frame_rate=25,
+                logo_path=None, logo_position=None, logo_opacity=1.0,
+                profiles=make_ladder(resolutions, audio_bitrates, tmp),
+            )
+            command = build_command(snapshot)
+            command[0] = options['ffmpeg']
+
+            # Median of several runs, single runs vary by several percent
+            cpu_times = []
+            for _ in range(options['runs']):
+                before = resource.getrusage(resource.RUSAGE_CHILDREN)
+                self.run(command[:1] + ['-y', '-v', 'error'] + command[1:])
+                after = resource.getrusage(resource.RUSAGE_CHILDREN)
+                cpu_times.append((after.ru_utime - before.ru_utime) + (after.ru_stime - before.ru_stime))
+
+        cpu = statistics.median(cpu_times)
+        self.stdout.write(f"{len(resolutions)} profiles: {', '.join(resolutions)}")
+        self.stdout.write(f"CPU {cpu:.2f}s (median of {len(cpu_times)}) for {options['seconds']}s of input")
+        self.stdout.write(f"{cpu / options['seconds']:.3f} CPU seconds per second of input")
+
+        if options['calibrate']:
+            # Cores one cost unit (a 1080p25 x264 encode) keeps busy in real time
+            cost = job_cost(options['codec'], 25, resolutions)
+            calibration = {
+                'cores_per_cost': round(cpu / options['seconds'] / cost, 3),
+                'ladder': resolutions,
+                'codec': options['codec'],
+                'measured_at': time.time(),
+            }
+            with open(settings.CAPACITY_FILE, 'w') as f:
+                json.dump(calibration, f, indent=2)
+            self.stdout.write(f"{calibration['cores_per_cost']} cores per cost unit written to {settings.CAPACITY_FILE}")
+
+    def run(self, command):
+        result = subprocess.run(command, stdin=subprocess.DEVNULL, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        if result.returncode:
+            raise CommandError(result.stderr.decode(errors='replace')[-2000:])
@@ -0,0 +1,17 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from transcoder.metrics import MetricsSampler
+
+
+class Command(BaseCommand):
+    help = "Sample system metrics and push them to the dashboard websockets, run exactly one per deployment"
+
+    def handle(self, *args, **options):
+        sampler = MetricsSampler(
+            interval=getattr(settings, 'METRICS_SAMPLE_INTERVAL', 1.0),
+            history_size=1,
+            broadcast=True,
+        )
+        sampler.prime()
+        self.stdout.write(f"Publishing metrics every {sampler.interval}s")
+        sampler.run()
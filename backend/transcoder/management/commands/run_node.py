@@ -0,0 +1,34 @@
+import os, subprocess, sys
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from transcoder.nodes import node_queue
+from transcoder.supervisor import run
+
+
+class Command(BaseCommand):
+    help = "Run one transcoder node: a Celery worker on the node's queue and its FFmpeg supervisor"
+
+    def add_arguments(self, parser):
+        parser.add_argument('name', help="node name, also set as NODE_NAME")
+        parser.add_argument('--port', type=int, default=None, help="supervisor port, give each local node its own")
+        parser.add_argument('--concurrency', type=int, default=2, help="Celery worker processes")
+
+    def handle(self, *args, **options):
+        name = options['name']
+        port = options['port'] or settings.SUPERVISOR_PORT
+        # The worker is a separate process, it gets the same settings through the environment
+        settings.NODE_NAME = name
+        settings.SUPERVISOR_PORT = port
+        env = dict(os.environ, NODE_NAME=name, SUPERVISOR_PORT=str(port))
+
+        worker = subprocess.Popen([
+            sys.executable, '-m', 'celery', '-A', 'transcoder_system', 'worker',
+            '-Q', f"celery,{node_queue(name)}", '-n', f"{name}@%h",
+            '--concurrency', str(options['concurrency']), '-l', 'info',
+        ], env=env)
+        self.stdout.write(f"Node {name}: worker PID {worker.pid} on queue {node_queue(name)}, supervisor on port {port}")
+        try:
+            run()
+        finally:
+            worker.terminate()
+            worker.wait()
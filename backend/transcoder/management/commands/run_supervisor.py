@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from transcoder.supervisor import run
+
+
+class Command(BaseCommand):
+    help = "Run the FFmpeg supervisor that owns all transcoding processes"
+
+    def handle(self, *args, **options):
+        run()
@@ -0,0 +1,60 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from django.core.management.base import BaseCommand
+from django.db import connection, connections, OperationalError
+from transcoder.models import Channel, TranscodingJob
+from transcoder.job_state import transition
+
+STATUSES = ['pending', 'running', 'stopped', 'error']
+
+
+class Command(BaseCommand):
+    help = (
+        "Run concurrent job status transitions (compare-and-set update and broadcast, as in production) "
+        "against the configured database and report lock errors"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--transitions', type=int, default=500)
+        parser.add_argument('--threads', type=int, default=50)
+        parser.add_argument('--channels', type=int, default=50)
+
+    def handle(self, *args, **options):
+        transitions = options['transitions']
+        self.stdout.write(
+            f"{connection.vendor}: {transitions} transitions, "
+            f"{options['threads']} threads, {options['channels']} channels"
+        )
+
+        channels = [
+            Channel.objects.create(name=f"loadtest-{i}-{time.time_ns()}", input_type='file', input_file='/dev/null')
+            for i in range(options['channels'])
+        ]
+        job_ids = list(TranscodingJob.objects.filter(channel__in=channels).values_list('id', flat=True))
+
+        def change_status(i):
+            # Returns True if applied, False if the status check rejected it, or the lock error
+            try:
+                return transition(job_ids[i % len(job_ids)], STATUSES[i % len(STATUSES)])
+            except OperationalError as e:
+                return str(e)
+            finally:
+                connections.close_all()
+
+        try:
+            started = time.monotonic()
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                results = list(pool.map(change_status, range(transitions)))
+            elapsed = time.monotonic() - started
+        finally:
+            Channel.objects.filter(id__in=[c.id for c in channels]).delete()
+
+        errors = [r for r in results if isinstance(r, str)]
+        self.stdout.write(
+            f"Completed {transitions - len(errors)}/{transitions} in {elapsed:.2f}s, "
+            f"{results.count(True)} applied, {results.count(False)} rejected by the status check"
+        )
+        for error in sorted(set(errors)):
+            self.stdout.write(self.style.ERROR(f"{errors.count(error)} x {error}"))
+        if not errors:
+            self.stdout.write(self.style.SUCCESS("No lock errors"))
@@ -0,0 +1,161 @@
+import threading, time
+from collections import deque
+from django.conf import settings
+from django.db import close_old_connections
+import psutil
+from .events import broadcast_metrics
+
+# Defaults, each can be overridden in settings with the same name
+CAPACITY_INTERVAL = 5.0     # seconds between refreshes of the cached encode budget
+MIN_RATE_INTERVAL = 0.5     # seconds the counters must cover before rates are computed from them
+
+
+def _mbps(byte_count, seconds):
+    return (byte_count * 8) / (1024 * 1024) / seconds if seconds > 0 else 0.0
+
+
+class MetricsSampler:
+    """
+    Samples CPU, RAM and per-interface network rates on a background thread
+    and keeps the last `history_size` samples in a ring buffer, so requests
+    only read memory instead of sleeping to measure.
+
+    Only the sampler of `manage.py publish_metrics` has `broadcast` set:
+    the samplers of the web processes serve their own requests, one
+    publisher sends the samples to the dashboard.
+
+    The encode budget left (admission.headroom, a few queries) is refreshed
+    on the same thread every `capacity_interval` seconds, so polling
+    /api/metrics/ doesn't query the jobs on every request. The publisher
+    sends it with its samples as `capacity`, like /api/metrics/.
+    """
+
+    def __init__(self, interval=1.0, history_size=300, broadcast=False, capacity_interval=CAPACITY_INTERVAL):
+        self.interval = interval
+        self.broadcast = broadcast
+        self.capacity_interval = capacity_interval
+        self._capacity = None
+        self._capacity_time = None
+        self.samples = deque(maxlen=history_size)
+        self._lock = threading.Lock()
+        self._sample_lock = threading.Lock()
+        self._thread = None
+        self._last_counters = None
+        self._last_time = None
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self.prime()
+            self._thread = threading.Thread(target=self.run, name='metrics-sampler', daemon=True)
+            self._thread.start()
+
+    def prime(self):
+        # Read the counters once so the first sample already has rates
+        psutil.cpu_percent(interval=None)
+        self._last_counters = psutil.net_io_counters(pernic=True)
+        self._last_time = time.monotonic()
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                sample = self.sample()
+                # The publisher sends the budget with every sample, the others keep it fresh once asked for
+                due = self._capacity_time is None or time.monotonic() - self._capacity_time >= self.capacity_interval
+                if due and (self.broadcast or self._capacity is not None):
+                    self.refresh_capacity()
+                if self.broadcast:
+                    broadcast_metrics({**sample, 'capacity': self._capacity})
+            except Exception as e:
+                print(f"Metrics sampler error: {e}")
+
+    def sample(self):
+        with self._sample_lock:
+            return self._sample()
+
+    def _sample(self):
+        now = time.monotonic()
+        elapsed = now - self._last_time
+        # Right after prime() the counters cover next to no time and rates would be spikes:
+        # report zero against the primed baseline and keep it, and the sample out of the history
+        settled = elapsed >= MIN_RATE_INTERVAL
+        counters = psutil.net_io_counters(pernic=True) if settled else self._last_counters
+
+        interfaces = {}
+        total_in = total_out = 0
+        for name, current in counters.items():
+            previous = self._last_counters.get(name)
+            if previous is None:
+                continue
+            # Counters can wrap or reset when an interface goes down
+            in_bytes = max(current.bytes_recv - previous.bytes_recv, 0)
+            out_bytes = max(current.bytes_sent - previous.bytes_sent, 0)
+            total_in += in_bytes
+            total_out += out_bytes
+            interfaces[name] = {
+                "in_mbps": _mbps(in_bytes, elapsed),
+                "out_mbps": _mbps(out_bytes, elapsed),
+            }
+
+        sample = {
+            "timestamp": time.time(),
+            "cpu_usage": psutil.cpu_percent(interval=None) if settled else 0.0,
+            "ram_usage": psutil.virtual_memory().percent,
+            "network": {
+                "in_mbps": _mbps(total_in, elapsed),
+                "out_mbps": _mbps(total_out, elapsed),
+            },
+            "interfaces": interfaces,
+        }
+
+        if settled:
+            self._last_counters = counters
+            self._last_time = now
+            self.samples.append(sample)
+        return sample
+
+    def latest(self):
+        if self.samples:
+            return self.samples[-1]
+        # Sampler just started, take one now rather than return nothing
+        return self.sample()
+
+    def history(self, seconds):
+        cutoff = time.time() - seconds
+        return [s for s in list(self.samples) if s["timestamp"] >= cutoff]
+
+    def refresh_capacity(self):
+        from .admission import headroom
+
+        # No request cycle on the sampler thread, drop expired connections ourselves
+        close_old_connections()
+        self._capacity_time = time.monotonic()
+        self._capacity = headroom()
+        return self._capacity
+
+    def capacity(self):
+        """Encode budget left as of the last refresh, at most `capacity_interval` seconds old."""
+        if self._capacity is None:
+            return self.refresh_capacity()
+        return self._capacity
+
+
+_sampler = None
+_sampler_lock = threading.Lock()
+
+
+def get_sampler():
+    """Return the process-wide sampler, starting it on first use. It doesn't broadcast."""
+    global _sampler
+    if _sampler is None:
+        with _sampler_lock:
+            if _sampler is None:
+                _sampler = MetricsSampler(
+                    interval=getattr(settings, 'METRICS_SAMPLE_INTERVAL', 1.0),
+                    history_size=getattr(settings, 'METRICS_HISTORY_SIZE', 300),
+                    capacity_interval=getattr(settings, 'CAPACITY_INTERVAL', CAPACITY_INTERVAL),
+                )
+                _sampler.start()
+    return _sampler
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 06:03
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0016_alter_abr_resolution_alter_channel_audio_bitrate_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='abr',
+            name='output_network',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.AlterField(
+            model_name='channel',
+            name='is_abr',
+            field=models.BooleanField(default=True),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 06:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0017_abr_output_network_alter_channel_is_abr'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='channel',
+            name='group',
+            field=models.CharField(blank=True, db_index=True, max_length=100, null=True),
+        ),
+    ]
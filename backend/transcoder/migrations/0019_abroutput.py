@@ -0,0 +1,26 @@
+# Generated by Django 4.2 on 2026-10-18 06:41
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0018_channel_group'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ABROutput',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('output_type', models.CharField(choices=[('hls', 'hls'), ('rtmp', 'rtmp'), ('udp', 'udp'), ('file', 'file')], max_length=10)),
+                ('output_url', models.CharField(blank=True, max_length=500, null=True)),
+                ('output_multicast_ip', models.CharField(blank=True, max_length=50, null=True, validators=[django.core.validators.RegexValidator(message="Enter a valid multicast address like '239.x.x.x:port'. IP must be 224.0.0.0-239.255.255.255 and port between 1-60000.", regex='^(22[4-9]|23\\d)\\.(?:25[0-5]|2[0-4]\\d|1\\d{2}|[1-9]?\\d)\\.(?:25[0-5]|2[0-4]\\d|1\\d{2}|[1-9]?\\d)\\.(?:25[0-5]|2[0-4]\\d|1\\d{2}|[1-9]?\\d):([1-9]\\d{0,3}|[1-5]\\d{4}|60000)$')])),
+                ('output_network', models.CharField(blank=True, max_length=100, null=True)),
+                ('abr', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outputs', to='transcoder.abr')),
+            ],
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 06:43
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0019_abroutput'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EncoderProfile',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('preset', models.CharField(blank=True, choices=[('ultrafast', 'ultrafast'), ('superfast', 'superfast'), ('veryfast', 'veryfast'), ('faster', 'faster'), ('fast', 'fast'), ('medium', 'medium'), ('slow', 'slow'), ('slower', 'slower'), ('veryslow', 'veryslow')], help_text='x264/x265 preset', max_length=10, null=True)),
+                ('tune', models.CharField(blank=True, choices=[('film', 'film'), ('animation', 'animation'), ('grain', 'grain'), ('stillimage', 'stillimage'), ('fastdecode', 'fastdecode'), ('zerolatency', 'zerolatency'), ('psnr', 'psnr'), ('ssim', 'ssim')], help_text='x264/x265 tune', max_length=12, null=True)),
+                ('threads', models.IntegerField(blank=True, help_text='Threads per video encoder, derived from host cores and running jobs when empty', null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(64)])),
+                ('lookahead_threads', models.IntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(16)])),
+                ('rc_lookahead', models.IntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(0), django.core.validators.MaxValueValidator(250)])),
+                ('slices', models.IntegerField(blank=True, null=True, validators=[django.core.validators.MinValueValidator(1), django.core.validators.MaxValueValidator(32)])),
+                ('channel', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='encoder_profile', to='transcoder.channel')),
+            ],
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 06:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0020_encoderprofile'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='transcodingjob',
+            name='status',
+            field=models.CharField(choices=[('queued', 'Queued'), ('pending', 'Pending'), ('running', 'Running'), ('completed', 'Completed'), ('error', 'Error'), ('stopped', 'Stopped')], default='stopped', max_length=20),
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 4.2 on 2026-10-18 06:52
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0021_job_queued_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Node',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True)),
+                ('status', models.CharField(choices=[('up', 'Up'), ('down', 'Down')], default='up', max_length=10)),
+                ('last_heartbeat', models.DateTimeField(db_index=True)),
+                ('cores', models.IntegerField(default=1)),
+                ('capacity', models.FloatField(default=1.0, help_text='Encode budget, 1.0 is one 1080p25 x264 encode')),
+                ('registered_at', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transcodingjob',
+            name='node',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='transcoding_jobs', to='transcoder.node'),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.2 on 2026-10-18 06:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0022_node'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InputCircuit',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('address', models.CharField(max_length=500, unique=True)),
+                ('failures', models.IntegerField(default=0)),
+                ('opened_until', models.DateTimeField(blank=True, null=True)),
+                ('last_failure_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='transcodingjob',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='transcodingjob',
+            name='retry_count',
+            field=models.IntegerField(default=0),
+        ),
+    ]
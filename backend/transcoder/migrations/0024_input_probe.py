@@ -0,0 +1,28 @@
+# Generated by Django 4.2 on 2026-10-18 06:59
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0023_retry_state'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inputcircuit',
+            name='alive',
+            field=models.BooleanField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='inputcircuit',
+            name='checked_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='inputcircuit',
+            name='probe_error',
+            field=models.CharField(blank=True, max_length=255, null=True),
+        ),
+    ]
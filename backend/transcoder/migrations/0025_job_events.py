@@ -0,0 +1,48 @@
+# Generated by Django 4.2 on 2026-10-18 07:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0024_input_probe'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='JobEventRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('kind', models.CharField(choices=[('start', 'Start'), ('running', 'Running'), ('exit', 'Exit'), ('retry', 'Retry'), ('stop', 'Stop'), ('stall', 'Stall'), ('error', 'Error')], max_length=10)),
+                ('count', models.IntegerField(default=0)),
+                ('channel', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='event_rollups', to='transcoder.channel')),
+            ],
+        ),
+        migrations.CreateModel(
+            name='JobEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('timestamp', models.DateTimeField()),
+                ('kind', models.CharField(choices=[('start', 'Start'), ('running', 'Running'), ('exit', 'Exit'), ('retry', 'Retry'), ('stop', 'Stop'), ('stall', 'Stall'), ('error', 'Error')], max_length=10)),
+                ('exit_code', models.IntegerField(blank=True, null=True)),
+                ('message', models.TextField(blank=True, null=True)),
+                ('node', models.CharField(blank=True, max_length=100, null=True)),
+                ('channel', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='events', to='transcoder.channel')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='jobeventrollup',
+            constraint=models.UniqueConstraint(fields=('channel', 'day', 'kind'), name='jobeventrollup_channel_day_kind'),
+        ),
+        migrations.AddIndex(
+            model_name='jobevent',
+            index=models.Index(fields=['channel', 'timestamp', 'id'], name='jobevent_channel_time'),
+        ),
+        migrations.AddIndex(
+            model_name='jobevent',
+            index=models.Index(fields=['timestamp'], name='jobevent_time'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2 on 2026-10-18 07:11
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0025_job_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='transcodingjob',
+            name='version',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2 on 2026-10-18 09:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('transcoder', '0026_job_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='node',
+            name='supervisor_host',
+            field=models.CharField(blank=True, default='', max_length=255),
+        ),
+        migrations.AddField(
+            model_name='node',
+            name='supervisor_port',
+            field=models.IntegerField(blank=True, null=True),
+        ),
+    ]
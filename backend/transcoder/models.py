@@ -67,6 +67,8 @@ RESOLUTION_CHOICES = [
 class Channel(models.Model):
     # Name of channel
     name = models.CharField(max_length=255, unique=True)
+    # Optional group used to start/stop channels together
+    group = models.CharField(max_length=100, blank=True, null=True, db_index=True)
 
     # Input Details
     input_type = models.CharField(max_length=10, choices=INPUT_TYPES)
@@ -231,8 +233,87 @@ class ABR(models.Model):
     def __str__(self):
         return f"ABR Rendition for {self.channel.name} ({self.resolution})"
 
+class ABROutput(models.Model):
+    # Extra destination of an ABR rendition, fed from the same encode through the tee muxer
+    abr = models.ForeignKey('ABR', on_delete=models.CASCADE, related_name='outputs')
+
+    output_type = models.CharField(max_length=10, choices=OUTPUT_TYPES)
+    output_url = models.CharField(max_length=500, blank=True, null=True)
+    output_multicast_ip = models.CharField(
+        max_length=50,
+        blank=True,
+        null=True,
+        validators=[MULTICAST_IP_PORT_VALIDATOR]
+    )
+    output_network = models.CharField(max_length=100, blank=True, null=True)
+
+    def __str__(self):
+        return f"{self.output_type} output for {self.abr}"
+
+class EncoderProfile(models.Model):
+    # Encoder tuning for a channel, unset fields fall back to the builder defaults
+    PRESET_CHOICES = [(p, p) for p in [
+        'ultrafast', 'superfast', 'veryfast', 'faster', 'fast', 'medium', 'slow', 'slower', 'veryslow',
+    ]]
+    TUNE_CHOICES = [(t, t) for t in [
+        'film', 'animation', 'grain', 'stillimage', 'fastdecode', 'zerolatency', 'psnr', 'ssim',
+    ]]
+
+    channel = models.OneToOneField('Channel', on_delete=models.CASCADE, related_name='encoder_profile')
+    preset = models.CharField(max_length=10, choices=PRESET_CHOICES, blank=True, null=True, help_text="x264/x265 preset")
+    tune = models.CharField(max_length=12, choices=TUNE_CHOICES, blank=True, null=True, help_text="x264/x265 tune")
+    threads = models.IntegerField(
+        blank=True, null=True, validators=[MinValueValidator(1), MaxValueValidator(64)],
+        help_text="Threads per video encoder, derived from host cores and running jobs when empty"
+    )
+    lookahead_threads = models.IntegerField(blank=True, null=True, validators=[MinValueValidator(1), MaxValueValidator(16)])
+    rc_lookahead = models.IntegerField(blank=True, null=True, validators=[MinValueValidator(0), MaxValueValidator(250)])
+    slices = models.IntegerField(blank=True, null=True, validators=[MinValueValidator(1), MaxValueValidator(32)])
+
+    def __str__(self):
+        return f"Encoder profile for {self.channel.name}"
+
+class Node(models.Model):
+    # A transcoder host: runs a supervisor and a Celery worker on its own queue
+    STATUS_CHOICES = [
+        ('up', 'Up'),
+        ('down', 'Down'),
+    ]
+
+    name = models.CharField(max_length=100, unique=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='up')
+    last_heartbeat = models.DateTimeField(db_index=True)
+    cores = models.IntegerField(default=1)
+    capacity = models.FloatField(default=1.0, help_text="Encode budget, 1.0 is one 1080p25 x264 encode")
+    # Control socket of the node's supervisor, for the API to reach jobs running there
+    supervisor_host = models.CharField(max_length=255, blank=True, default='')
+    supervisor_port = models.IntegerField(null=True, blank=True)
+    registered_at = models.DateTimeField(auto_now_add=True)
+
+    @property
+    def queue(self):
+        return f"node.{self.name}"
+
+    def __str__(self):
+        return f"Node {self.name} ({self.status})"
+
+class InputCircuit(models.Model):
+    # State per input address: failures (channels on an input with an open circuit wait together) and liveness
+    address = models.CharField(max_length=500, unique=True)
+    failures = models.IntegerField(default=0)
+    opened_until = models.DateTimeField(null=True, blank=True)
+    last_failure_at = models.DateTimeField(null=True, blank=True)
+    # Last liveness probe of the input (see probe.py)
+    alive = models.BooleanField(null=True, blank=True)
+    probe_error = models.CharField(max_length=255, null=True, blank=True)
+    checked_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f"Circuit for {self.address} ({self.failures} failures)"
+
 class TranscodingJob(models.Model):
     STATUS_CHOICES = [
+        ('queued', 'Queued'),
         ('pending', 'Pending'),
         ('running', 'Running'),
         ('completed', 'Completed'),
@@ -246,6 +327,66 @@ class TranscodingJob(models.Model):
     end_time = models.DateTimeField(null=True, blank=True)
     ffmpeg_pid = models.IntegerField(null=True, blank=True)
     error_message = models.TextField(blank=True, null=True)
+    node = models.ForeignKey('Node', on_delete=models.SET_NULL, blank=True, null=True, related_name='transcoding_jobs')
+    # Persisted retry state, see retry.py
+    retry_count = models.IntegerField(default=0)
+    next_retry_at = models.DateTimeField(null=True, blank=True)
+    # Bumped by every write, the job list ETag is built from it (see listing.py)
+    version = models.PositiveIntegerField(default=0)
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            self.version += 1
+            # A save of some fields writes the bump too
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version'}
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return f"Job for {self.channel.name} - {self.status}"
+
+class JobEvent(models.Model):
+    # Append-only history of a channel's job, written in batches by the supervisor (see history.py)
+    KIND_CHOICES = [
+        ('start', 'Start'),
+        ('running', 'Running'),
+        ('exit', 'Exit'),
+        ('retry', 'Retry'),
+        ('stop', 'Stop'),
+        ('stall', 'Stall'),
+        ('error', 'Error'),
+    ]
+
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='events', db_index=False)
+    timestamp = models.DateTimeField()
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    exit_code = models.IntegerField(null=True, blank=True)
+    message = models.TextField(blank=True, null=True)
+    node = models.CharField(max_length=100, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pages of one channel, newest first
+            models.Index(fields=['channel', 'timestamp', 'id'], name='jobevent_channel_time'),
+            # Retention sweeps by age across all channels
+            models.Index(fields=['timestamp'], name='jobevent_time'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} of channel {self.channel_id} at {self.timestamp}"
+
+
+class JobEventRollup(models.Model):
+    # Daily event counts per channel, kept after the raw events expire
+    channel = models.ForeignKey('Channel', on_delete=models.CASCADE, related_name='event_rollups', db_index=False)
+    day = models.DateField()
+    kind = models.CharField(max_length=10, choices=JobEvent.KIND_CHOICES)
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['channel', 'day', 'kind'], name='jobeventrollup_channel_day_kind'),
+        ]
 
     def __str__(self):
-        return f"Job for {self.channel.name} - {self.status}"
\ No newline at end of file
+        return f"{self.count} {self.kind} of channel {self.channel_id} on {self.day}"
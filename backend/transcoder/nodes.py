@@ -0,0 +1,117 @@
+"""
+Multi-node scheduling.
+
+Every transcoder host sets NODE_NAME and runs a supervisor and a Celery
+worker consuming its own queue (`node.<name>`). The supervisor registers
+the node and sends a heartbeat every NODE_HEARTBEAT_INTERVAL seconds.
+
+Admission places each start on the least loaded live node and records it
+on the job, so its start/stop tasks are routed to that node's queue. A node
+whose heartbeat is older than NODE_HEARTBEAT_TIMEOUT is marked down by the
+next live node and its active jobs are started elsewhere (or queued).
+
+The node also records where its supervisor listens (NODE_SUPERVISOR_HOST,
+else SUPERVISOR_HOST, and SUPERVISOR_PORT), so the API can ask the
+supervisor running a job for its stats and placement.
+
+Without NODE_NAME the host runs alone: no registration, default queue.
+"""
+import os
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+from .models import Node, TranscodingJob
+from .job_state import transition
+
+HEARTBEAT_INTERVAL = 5      # seconds between heartbeats
+HEARTBEAT_TIMEOUT = 30      # seconds without a heartbeat before a node's jobs move
+
+
+def local_node_name():
+    return getattr(settings, 'NODE_NAME', None)
+
+
+def node_queue(name):
+    return f"node.{name}" if name else None
+
+
+def queue_options(node_name):
+    """apply_async options routing a task to a node, none for the default queue."""
+    return {'queue': node_queue(node_name)} if node_name else {}
+
+
+def local_jobs(queryset):
+    """Limit a job queryset to the jobs of this host."""
+    name = local_node_name()
+    return queryset.filter(node__name=name) if name else queryset
+
+
+def node_supervisor(node):
+    """Control socket address of the supervisor running `node`'s jobs, None for this host's own."""
+    if node is None or node.name == local_node_name() or not node.supervisor_host:
+        return None
+    return (node.supervisor_host, node.supervisor_port)
+
+
+def heartbeat_timeout():
+    return getattr(settings, 'NODE_HEARTBEAT_TIMEOUT', HEARTBEAT_TIMEOUT)
+
+
+def live_nodes():
+    cutoff = timezone.now() - timedelta(seconds=heartbeat_timeout())
+    return Node.objects.filter(status='up', last_heartbeat__gte=cutoff).order_by('name')
+
+
+def heartbeat(name, job_ids=()):
+    """
+    Register or refresh node `name`. Returns the ids among `job_ids` (the
+    jobs this host runs) that were moved to another node or queued while
+    this node was unreachable, so they can be dropped here.
+    """
+    from .admission import host_capacity
+    from .supervisor import supervisor_address
+
+    host, port = supervisor_address()
+    Node.objects.update_or_create(name=name, defaults={
+        'status': 'up',
+        'last_heartbeat': timezone.now(),
+        'cores': getattr(settings, 'ENCODER_CORES', None) or os.cpu_count() or 1,
+        'capacity': host_capacity(),
+        'supervisor_host': getattr(settings, 'NODE_SUPERVISOR_HOST', None) or host,
+        'supervisor_port': port,
+    })
+    # Jobs without a node were started before any node registered and stay
+    moved = TranscodingJob.objects.filter(id__in=job_ids).exclude(node__name=name).exclude(
+        node__isnull=True, status__in=['pending', 'running']
+    )
+    return list(moved.values_list('id', flat=True))
+
+
+def fail_over():
+    """
+    Mark nodes with an expired heartbeat down and place their active jobs
+    on live nodes, queueing those that don't fit. Returns the job ids to start.
+    """
+    from .admission import ACTIVE_STATUSES, channel_cost, decide, node_headroom
+
+    cutoff = timezone.now() - timedelta(seconds=heartbeat_timeout())
+    starts = []
+    for node in Node.objects.filter(status='up', last_heartbeat__lt=cutoff):
+        # Compare-and-set, so only one of the live nodes moves the jobs
+        if not Node.objects.filter(id=node.id, status='up', last_heartbeat__lt=cutoff).update(status='down'):
+            continue
+        print(f"Node {node.name} missed its heartbeat, moving its jobs")
+        jobs = TranscodingJob.objects.filter(node=node, status__in=ACTIVE_STATUSES).select_related(
+            'channel'
+        ).prefetch_related('channel__abr').order_by('id')
+        with transaction.atomic():
+            rooms = node_headroom(lock=True)
+            for job in jobs:
+                transition(
+                    job.id, 'stopped', ACTIVE_STATUSES, ffmpeg_pid=None, node=None,
+                    error_message=f"Node {node.name} stopped responding",
+                )
+                if decide(job, channel_cost(job.channel), rooms, queue=True) == 'admitted':
+                    starts.append(job.id)
+    return starts
@@ -0,0 +1,89 @@
+"""
+CPU placement of FFmpeg processes.
+
+Every process gets a core set sized by its share of the total encoding
+cost, taken from one NUMA node so its threads keep their caches and memory
+local. The supervisor plans again whenever a process starts or exits and
+pins every thread of the processes whose cores changed.
+"""
+import glob, os, re
+import psutil
+
+# Relative encoding cost per pixel, x265 is several times slower than x264 at the same preset
+CODEC_COST = {'libx264': 1.0, 'libx265': 3.0, 'mpeg2video': 0.3}
+REFERENCE_PIXELS = 1920 * 1080 * 25     # one 1080p25 x264 encode costs 1.0
+
+
+def job_cost(video_codec, frame_rate, resolutions):
+    """Estimated cost of a channel: resolution x frame rate x codec, summed over its profiles."""
+    pixels = 0
+    for resolution in resolutions:
+        width, height = (int(v) for v in resolution.split('x'))
+        pixels += width * height
+    cost = pixels * (frame_rate or 25) * CODEC_COST.get(video_codec, 1.0) / REFERENCE_PIXELS
+    # Decoding and muxing cost something even for a tiny ladder
+    return round(max(cost, 0.1), 3)
+
+
+def parse_cpulist(text):
+    """'0-3,8,10-11' -> [0, 1, 2, 3, 8, 10, 11]"""
+    cores = []
+    for part in text.strip().split(','):
+        if not part:
+            continue
+        first, _, last = part.partition('-')
+        cores += range(int(first), int(last or first) + 1)
+    return cores
+
+
+def numa_nodes():
+    """Cores this process may use, grouped per NUMA node."""
+    allowed = os.sched_getaffinity(0)
+    nodes = []
+    for path in sorted(glob.glob('/sys/devices/system/node/node*/cpulist'), key=lambda p: int(re.findall(r'\d+', p)[-1])):
+        with open(path) as f:
+            cores = [c for c in parse_cpulist(f.read()) if c in allowed]
+        if cores:
+            nodes.append(cores)
+    return nodes or [sorted(allowed)]
+
+
+def plan(costs, nodes):
+    """
+    Assign cores to processes, `costs` maps process key -> cost. Returns
+    key -> sorted cores. Large processes are placed first, each on the
+    node where its cores are least loaded; with more processes than cores
+    the least loaded cores are shared.
+    """
+    total_cost = sum(costs.values())
+    total_cores = sum(len(cores) for cores in nodes)
+    load = {core: 0.0 for cores in nodes for core in cores}
+    placement = {}
+    for key, cost in sorted(costs.items(), key=lambda item: (-item[1], str(item[0]))):
+        wanted = max(1, round(cost / total_cost * total_cores)) if total_cost else 1
+        best = None
+        for cores in nodes:
+            chosen = sorted(cores, key=lambda c: (load[c], c))[:wanted]
+            # Load per core after placing, then prefer the node giving the most cores
+            score = (sum(load[c] for c in chosen) + cost) / len(chosen), -len(chosen)
+            if best is None or score < best[0]:
+                best = (score, chosen)
+        chosen = best[1]
+        for core in chosen:
+            load[core] += cost / len(chosen)
+        placement[key] = sorted(chosen)
+    return placement
+
+
+def pin(pid, cores):
+    """Set the affinity of every thread of `pid`, threads started later inherit it."""
+    try:
+        threads = psutil.Process(pid).threads()
+    except (psutil.NoSuchProcess, psutil.AccessDenied):
+        return False
+    for thread in threads:
+        try:
+            os.sched_setaffinity(thread.id, cores)
+        except OSError:
+            pass    # thread exited meanwhile
+    return True
@@ -0,0 +1,162 @@
+"""
+Input liveness probing.
+
+The supervisor probes the inputs of all configured channels every
+INPUT_PROBE_INTERVAL seconds, concurrently from its event loop: a UDP
+multicast group is joined until its first packet arrives, an HLS manifest
+is fetched and must start with #EXTM3U. Results are kept in an InputCache
+for INPUT_PROBE_TTL seconds and saved on the input's InputCircuit row,
+where the channel API reads them (`input_state`).
+
+A start whose input is known to be down doesn't launch FFmpeg, the job
+waits in the supervisor until the input is seen alive again.
+"""
+import asyncio, ipaddress, socket, time, urllib.request
+from datetime import timedelta
+from urllib.parse import urlsplit, parse_qs
+from django.conf import settings
+from django.db.models import Count, Max, Q
+from django.utils import timezone
+from .models import InputCircuit
+
+# Defaults, each can be overridden in settings with the same name
+INPUT_PROBE_INTERVAL = 5        # seconds between probe rounds
+INPUT_PROBE_TIMEOUT = 2         # seconds to wait for a packet or a manifest
+INPUT_PROBE_TTL = 15            # seconds a result stays valid
+INPUT_PROBE_CONCURRENCY = 64    # inputs probed at once
+
+
+def setting(name):
+    return getattr(settings, name, globals()[name])
+
+
+def parse_udp(address):
+    """'udp://239.1.1.1:5000?localaddr=10.0.0.2' -> ('239.1.1.1', 5000, '10.0.0.2')"""
+    parts = urlsplit(address)
+    localaddr = parse_qs(parts.query).get('localaddr', [None])[0]
+    return parts.hostname, parts.port, localaddr
+
+
+def multicast_socket(group, port, interface=None):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+    try:
+        # FFmpeg may be reading the same group, bound to the group address we only get its packets
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        sock.bind((group, port))
+        mreq = socket.inet_aton(group) + socket.inet_aton(interface or '0.0.0.0')
+        sock.setsockopt(socket.IPPROTO_IP, socket.IP_ADD_MEMBERSHIP, mreq)
+        sock.setblocking(False)
+    except OSError:
+        sock.close()
+        raise
+    return sock
+
+
+async def probe_udp(address, timeout):
+    """(alive, error) of a multicast input, None for unicast (joining it would steal FFmpeg's packets)."""
+    group, port, interface = parse_udp(address)
+    if not ipaddress.ip_address(group).is_multicast:
+        return None
+    try:
+        sock = multicast_socket(group, port, interface)
+    except OSError as e:
+        return False, f"Cannot join {group}:{port}: {e}"
+    try:
+        await asyncio.wait_for(asyncio.get_running_loop().sock_recv(sock, 2048), timeout)
+        return True, None
+    except asyncio.TimeoutError:
+        return False, f"No packets within {timeout:g}s"
+    finally:
+        sock.close()
+
+
+def fetch_manifest(url, timeout):
+    with urllib.request.urlopen(url, timeout=timeout) as response:
+        return response.read(4096)
+
+
+async def probe_hls(url, timeout):
+    try:
+        # urllib blocks, the loop only waits on the thread
+        body = await asyncio.wait_for(asyncio.to_thread(fetch_manifest, url, timeout), timeout + 1)
+    except Exception as e:
+        return False, f"Manifest not reachable: {e}"
+    if not body.lstrip().startswith(b'#EXTM3U'):
+        return False, "Not an HLS manifest"
+    return True, None
+
+
+async def probe(address, timeout):
+    """(alive, error) of an input address, None if it can't be probed."""
+    scheme = urlsplit(address).scheme
+    if scheme == 'udp':
+        return await probe_udp(address, timeout)
+    if scheme in ('http', 'https'):
+        return await probe_hls(address, timeout)
+    return None
+
+
+async def probe_all(addresses, timeout=None, concurrency=None):
+    """Probe `addresses` concurrently. Returns address -> (alive, error), leaving out those that can't be probed."""
+    timeout = timeout or setting('INPUT_PROBE_TIMEOUT')
+    limit = asyncio.Semaphore(concurrency or setting('INPUT_PROBE_CONCURRENCY'))
+
+    async def one(address):
+        async with limit:
+            return address, await probe(address, timeout)
+
+    results = await asyncio.gather(*(one(address) for address in addresses))
+    return {address: result for address, result in results if result is not None}
+
+
+class InputCache:
+    """Probe results per input address, valid for `ttl` seconds."""
+
+    def __init__(self, ttl=None):
+        self.ttl = ttl or setting('INPUT_PROBE_TTL')
+        self.entries = {}   # address -> (alive, error, monotonic time of the check)
+
+    def set(self, address, alive, error=None):
+        self.entries[address] = (alive, error, time.monotonic())
+
+    def get(self, address):
+        """(alive, error), or None if unknown or expired."""
+        entry = self.entries.get(address)
+        if entry is None or time.monotonic() - entry[2] > self.ttl:
+            return None
+        return entry[:2]
+
+    def is_down(self, address):
+        result = self.get(address)
+        return result is not None and not result[0]
+
+
+def save_states(results):
+    """Write probe results (address -> (alive, error)) on the InputCircuit rows, one update per outcome."""
+    if not results:
+        return
+    now = timezone.now()
+    InputCircuit.objects.bulk_create([InputCircuit(address=address) for address in results], ignore_conflicts=True)
+    outcomes = {}
+    for address, result in results.items():
+        outcomes.setdefault(result, []).append(address)
+    for (alive, error), addresses in outcomes.items():
+        InputCircuit.objects.filter(address__in=addresses).update(alive=alive, probe_error=error, checked_at=now)
+
+
+def input_states_version():
+    """Changes whenever input_states() does: latest check and number of inputs still within INPUT_PROBE_TTL."""
+    cutoff = timezone.now() - timedelta(seconds=setting('INPUT_PROBE_TTL'))
+    return InputCircuit.objects.aggregate(
+        checked=Max('checked_at'), fresh=Count('id', filter=Q(checked_at__gte=cutoff))
+    )
+
+
+def input_states():
+    """address -> {'state', 'checked_at', 'error'} of the inputs probed within INPUT_PROBE_TTL."""
+    cutoff = timezone.now() - timedelta(seconds=setting('INPUT_PROBE_TTL'))
+    rows = InputCircuit.objects.filter(checked_at__gte=cutoff).values_list('address', 'alive', 'checked_at', 'probe_error')
+    return {
+        address: {'state': 'up' if alive else 'down', 'checked_at': checked_at, 'error': error}
+        for address, alive, checked_at, error in rows
+    }
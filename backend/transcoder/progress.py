@@ -0,0 +1,70 @@
+import time
+
+
+def _number(value, suffix='', cast=float):
+    # FFmpeg reports N/A until it has a value, and units like 'kbits/s' or 'x'
+    value = value.strip()
+    if suffix and value.endswith(suffix):
+        value = value[:-len(suffix)]
+    try:
+        return cast(value)
+    except ValueError:
+        return None
+
+
+class ProgressStats:
+    """Latest -progress block of one FFmpeg process."""
+
+    __slots__ = (
+        'frame', 'fps', 'bitrate_kbps', 'total_size', 'out_time_us',
+        'speed', 'dup_frames', 'drop_frames', 'updated_at', 'ended',
+    )
+
+    def __init__(self):
+        for field in self.__slots__:
+            setattr(self, field, None)
+        self.ended = False
+
+    def update(self, values):
+        self.frame = _number(values.get('frame', ''), cast=int)
+        self.fps = _number(values.get('fps', ''))
+        self.bitrate_kbps = _number(values.get('bitrate', ''), 'kbits/s')
+        self.total_size = _number(values.get('total_size', ''), cast=int)
+        self.out_time_us = _number(values.get('out_time_us', ''), cast=int)
+        self.speed = _number(values.get('speed', ''), 'x')
+        self.dup_frames = _number(values.get('dup_frames', ''), cast=int)
+        self.drop_frames = _number(values.get('drop_frames', ''), cast=int)
+        self.ended = values.get('progress') == 'end'
+        self.updated_at = time.time()
+
+    def as_dict(self):
+        data = {field: getattr(self, field) for field in self.__slots__}
+        data['out_time'] = self.out_time_us / 1000000 if self.out_time_us is not None else None
+        return data
+
+
+class ProgressParser:
+    """
+    Turns FFmpeg `-progress` output into ProgressStats. FFmpeg writes one
+    key=value per line and closes each block with a `progress=` line.
+    """
+
+    def __init__(self, stats=None):
+        self.stats = stats or ProgressStats()
+        self.values = {}
+
+    def feed(self, lines):
+        """Feed byte lines, return True if at least one block was completed."""
+        completed = False
+        for line in lines:
+            key, sep, value = line.decode('ascii', 'replace').partition('=')
+            if not sep:
+                continue
+            # Lines may keep a '\r' or padding around the key and value
+            key = key.strip()
+            self.values[key] = value.strip()
+            if key == 'progress':
+                self.stats.update(self.values)
+                self.values = {}
+                completed = True
+        return completed
@@ -0,0 +1,100 @@
+"""
+Retry scheduling for channels whose FFmpeg exits on its own.
+
+The retry counter and the time of the next attempt are stored on the job,
+so they survive worker and supervisor restarts. Delays grow exponentially
+with random jitter, so channels failing together don't retry in lockstep.
+The counter starts over once the job is running again, so only failures
+in a row count towards max_retries.
+
+Failures are also counted per input address (InputCircuit): while an
+input's circuit is open every channel reading it waits for the circuit to
+close, so a dead source is probed now and then instead of by every channel
+at once. The first channel reaching running on the input closes it again.
+"""
+import random
+from datetime import timedelta
+from django.conf import settings
+from django.db.models import F
+from django.utils import timezone
+from .models import InputCircuit, TranscodingJob
+from .job_state import transition
+
+# Defaults, each can be overridden in settings with the same name
+RETRY_BASE_DELAY = 10       # seconds before the first retry, doubled for each one after
+RETRY_MAX_DELAY = 300       # cap for a single delay
+CIRCUIT_RESET_AFTER = 600   # seconds without failures after which an input starts over
+
+
+def backoff_delay(attempt, rng=random):
+    """Delay before retry `attempt` (1-based): half of the exponential delay fixed, half random."""
+    base = getattr(settings, 'RETRY_BASE_DELAY', RETRY_BASE_DELAY)
+    cap = getattr(settings, 'RETRY_MAX_DELAY', RETRY_MAX_DELAY)
+    delay = min(cap, base * 2 ** (attempt - 1))
+    return round(delay / 2 + rng.uniform(0, delay / 2), 1)
+
+
+def circuit_wait(address, now=None):
+    """Seconds until the circuit of `address` closes, 0 if it is closed."""
+    now = now or timezone.now()
+    opened_until = InputCircuit.objects.filter(address=address).values_list('opened_until', flat=True).first()
+    return max((opened_until - now).total_seconds(), 0) if opened_until else 0
+
+
+def trip_circuit(address, now=None):
+    """Record a failure of `address` and return the seconds its circuit stays open."""
+    now = now or timezone.now()
+    circuit, _ = InputCircuit.objects.get_or_create(address=address)
+    # Still open: the channels failing in the same outage count once
+    if circuit.opened_until and circuit.opened_until > now:
+        return (circuit.opened_until - now).total_seconds()
+    reset_after = getattr(settings, 'CIRCUIT_RESET_AFTER', CIRCUIT_RESET_AFTER)
+    if circuit.last_failure_at and (now - circuit.last_failure_at).total_seconds() > reset_after:
+        circuit.failures = 0
+    circuit.failures += 1
+    delay = backoff_delay(circuit.failures)
+    circuit.opened_until = now + timedelta(seconds=delay)
+    circuit.last_failure_at = now
+    circuit.save()
+    return delay
+
+
+def close_circuit(address):
+    InputCircuit.objects.filter(address=address).exclude(failures=0, opened_until=None).update(
+        failures=0, opened_until=None
+    )
+
+
+def cancel_retries(job_ids):
+    """Forget the scheduled retries of stopped jobs, their tasks see it and do nothing."""
+    TranscodingJob.objects.filter(id__in=job_ids, status='stopped', next_retry_at__isnull=False).update(
+        next_retry_at=None, version=F('version') + 1
+    )
+
+
+def schedule_retry(job_id, address=None, max_retries=5):
+    """
+    Persist the next attempt of a job whose FFmpeg exited. Returns
+    ('retry', delay in seconds), ('exhausted', None) after `max_retries`
+    retries (the caller fails the job) or (None, None) if the job is no
+    longer active.
+    """
+    now = timezone.now()
+    retry_count = TranscodingJob.objects.filter(id=job_id).values_list('retry_count', flat=True).first()
+    if retry_count is None:
+        return None, None
+    if retry_count >= max_retries:
+        return 'exhausted', None
+
+    delay = backoff_delay(retry_count + 1)
+    if address:
+        # Channels on a failing input retry after its circuit closes, spread over a tenth of the wait
+        wait = trip_circuit(address, now)
+        if wait > delay:
+            delay = round(wait + random.uniform(0, wait / 10), 1)
+    if transition(
+        job_id, 'stopped', ['pending', 'running'], ffmpeg_pid=None,
+        retry_count=retry_count + 1, next_retry_at=now + timedelta(seconds=delay),
+    ):
+        return 'retry', delay
+    return None, None
@@ -0,0 +1,7 @@
+from django.urls import path
+from .consumers import ChannelLogConsumer, StatusConsumer
+
+websocket_urlpatterns = [
+    path('ws/status/', StatusConsumer.as_asgi()),
+    path('ws/channels/<int:pk>/logs/', ChannelLogConsumer.as_asgi()),
+]
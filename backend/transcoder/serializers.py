@@ -1,35 +1,97 @@
 from rest_framework import serializers
-from .models import TranscodingJob, Channel, ABR
+from .models import TranscodingJob, Channel, ABR, ABROutput, EncoderProfile, JobEvent
+from .ffmpeg_builder import input_address
+from .probe import input_states
+from .listing import SparseFieldsMixin
+
+class ABROutputSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = ABROutput
+        exclude = ['abr']
+
+    def validate(self, data):
+        output_type = data.get('output_type')
+        required = ['output_multicast_ip', 'output_network'] if output_type == 'udp' else ['output_url']
+        for field in required:
+            if data.get(field) in (None, ''):
+                raise serializers.ValidationError({
+                    field: f"This field is required when output_type='{output_type}'."
+                })
+        return data
 
 class ABRSerializer(serializers.ModelSerializer):
     channel = serializers.PrimaryKeyRelatedField(read_only=True)
+    # Extra destinations for this rendition, encoded once and sent to all of them
+    outputs = ABROutputSerializer(many=True, required=False)
     class Meta:
         model = ABR
         fields = "__all__"
 
-class TranscodingJobSerializer(serializers.ModelSerializer):
+def create_abr_profiles(channel, abr_data):
+    for abr_profile in abr_data:
+        outputs = abr_profile.pop('outputs', [])
+        abr = ABR.objects.create(channel=channel, **abr_profile)
+        for output in outputs:
+            ABROutput.objects.create(abr=abr, **output)
+
+class EncoderProfileSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = EncoderProfile
+        exclude = ['id', 'channel']
+
+class TranscodingJobSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     class Meta:
         model = TranscodingJob
         fields = "__all__"
 
-class ChannelSerializer(serializers.ModelSerializer):
+class BulkJobActionSerializer(serializers.Serializer):
+    # Jobs can be picked by id, by channel id and/or by channel group
+    job_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    channel_ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+    group = serializers.CharField(required=False)
+    # Start only: queue jobs that don't fit the encode budget instead of rejecting them
+    queue = serializers.BooleanField(required=False)
+
+    def validate(self, data):
+        if not any(data.get(field) for field in ('job_ids', 'channel_ids', 'group')):
+            raise serializers.ValidationError({
+                "job_ids": "Provide job_ids, channel_ids or group."
+            })
+        return data
+
+class ChannelSerializer(SparseFieldsMixin, serializers.ModelSerializer):
     status = serializers.SerializerMethodField()
     job_id = serializers.SerializerMethodField()
     error_message = serializers.SerializerMethodField()
+    input_state = serializers.SerializerMethodField()
     abr_profiles = ABRSerializer(many=True, required=False, read_only=False)
+    encoder_profile = EncoderProfileSerializer(required=False, allow_null=True)
 
     class Meta:
         model = Channel
         exclude = ['created_at', 'updated_at']
 
+    def _get_job(self, obj):
+        # Uses the job loaded by select_related('jobs'), None if the channel has no job
+        return getattr(obj, 'jobs', None)
+
     def get_status(self, obj):
-        return obj.jobs.status if hasattr(obj, 'jobs') else None
+        job = self._get_job(obj)
+        return job.status if job else None
 
     def get_job_id(self, obj):
-        return obj.jobs.id if hasattr(obj, 'jobs') else None
+        job = self._get_job(obj)
+        return job.id if job else None
     
     def get_error_message(self, obj):  
-        return obj.jobs.error_message if hasattr(obj, 'jobs') else None
+        job = self._get_job(obj)
+        return job.error_message if job else None
+
+    def get_input_state(self, obj):
+        # Probed by the supervisor, loaded once per request for all channels. None if not probed recently
+        if 'input_states' not in self.context:
+            self.context['input_states'] = input_states()
+        return self.context['input_states'].get(input_address(obj))
 
     def validate(self, data):
         is_abr = data.get('is_abr', getattr(self.instance, 'is_abr', False))
@@ -115,20 +177,31 @@ class ChannelSerializer(serializers.ModelSerializer):
 
         return data
 
+    def save_encoder_profile(self, channel, encoder_data):
+        # null removes the profile, so the builder defaults apply again
+        if encoder_data is None:
+            EncoderProfile.objects.filter(channel=channel).delete()
+        else:
+            EncoderProfile.objects.update_or_create(channel=channel, defaults=encoder_data)
+
     def create(self, validated_data):
         abr_data = validated_data.pop('abr_profiles', [])
+        encoder_data = validated_data.pop('encoder_profile', None)
         channel = Channel.objects.create(**validated_data)
+        if encoder_data is not None:
+            self.save_encoder_profile(channel, encoder_data)
         
         # Create ABR profiles if provided
-        for abr_profile in abr_data:
-            ABR.objects.create(channel=channel, **abr_profile)
+        create_abr_profiles(channel, abr_data)
             
         # Reload the channel with ABR profiles for response
-        channel = Channel.objects.prefetch_related('abr').get(id=channel.id)
+        channel = Channel.objects.select_related('jobs', 'encoder_profile').prefetch_related('abr__outputs').get(id=channel.id)
         return channel
 
     def update(self, instance, validated_data):
         abr_data = validated_data.pop('abr_profiles', [])
+        if 'encoder_profile' in validated_data:
+            self.save_encoder_profile(instance, validated_data.pop('encoder_profile'))
         
         # Update main channel fields
         for attr, value in validated_data.items():
@@ -138,16 +211,20 @@ class ChannelSerializer(serializers.ModelSerializer):
         # Update ABR profiles if provided
         if abr_data is not None:  # Only update if abr_profiles was in the request
             instance.abr.all().delete()  # Remove existing profiles
-            for abr_profile in abr_data:
-                ABR.objects.create(channel=instance, **abr_profile)
+            create_abr_profiles(instance, abr_data)
         
         # Reload the instance with ABR profiles for response
-        instance = Channel.objects.prefetch_related('abr').get(id=instance.id)
+        instance = Channel.objects.select_related('jobs', 'encoder_profile').prefetch_related('abr__outputs').get(id=instance.id)
         return instance
 
     def to_representation(self, instance):
         representation = super().to_representation(instance)
-        # Ensure ABR profiles are included in the response
-        if instance.is_abr and 'abr_profiles' not in representation:
+        # Ensure ABR profiles are included in the response, unless left out with ?fields=
+        if instance.is_abr and 'abr_profiles' not in representation and 'abr_profiles' in self.fields:
             representation['abr_profiles'] = ABRSerializer(instance.abr.all(), many=True).data
-        return representation
\ No newline at end of file
+        return representation
+
+class JobEventSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = JobEvent
+        fields = ['id', 'timestamp', 'kind', 'exit_code', 'message', 'node']
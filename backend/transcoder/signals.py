@@ -1,8 +1,22 @@
 from django.db.models.signals import post_save
 from django.dispatch import receiver
-from .models import TranscodingJob, Channel
+from django.utils import timezone
+from .models import TranscodingJob, Channel, EncoderProfile
+from .events import broadcast_job_status
 
 @receiver(post_save, sender=Channel)
 def create_transcoding_job(sender, instance, created, **kwarg):
     if created:
-        TranscodingJob.objects.create(channel=instance, status='stopped')
\ No newline at end of file
+        TranscodingJob.objects.create(channel=instance, status='stopped')
+
+@receiver(post_save, sender=TranscodingJob)
+def broadcast_job_update(sender, instance, **kwargs):
+    # Status transitions broadcast themselves (job_state), this covers saves from the API/admin
+    broadcast_job_status(
+        instance.id, instance.status, channel_id=instance.channel_id, error_message=instance.error_message
+    )
+
+@receiver(post_save, sender=EncoderProfile)
+def touch_channel(sender, instance, **kwargs):
+    # FFmpeg commands are cached per channel updated_at, so a new encoder profile must bump it
+    Channel.objects.filter(id=instance.channel_id).update(updated_at=timezone.now())
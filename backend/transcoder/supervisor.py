@@ -0,0 +1,668 @@
+"""
+Long-lived process that owns every FFmpeg child.
+
+Celery tasks build the FFmpeg command and send it here over a local JSON
+control socket, one request per line:
+
+    {"cmd": "start", "job_id": 1, "command": [...], "log_file": "...", "retry_count": 0, "share_key": "...", "cost": 1.5,
+     "input_address": "udp://..."}
+    {"cmd": "stop", "job_id": 1}
+    {"cmd": "status"}
+    {"cmd": "stats", "job_id": 1}
+    {"cmd": "placement"}
+    {"cmd": "inputs"}
+
+FFmpeg is expected to write `-progress` blocks to stdout and its log to
+stderr. All child output is read from a single asyncio event loop, so
+supervising hundreds of channels costs no extra threads.
+"""
+import asyncio, json, os, re, signal, socket, sys, time
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.utils import timezone
+from .models import Channel, TranscodingJob
+from .job_state import transition, update_job
+from .logsink import ChannelLog, SharedLog
+from .logfilter import LogFilter
+from .progress import ProgressParser
+from .health import StallDetector
+from .ffmpeg_builder import shared_command_for_jobs, input_address
+from .placement import numa_nodes, plan, pin
+from .admission import admit_queued
+from .nodes import fail_over, heartbeat, local_jobs, local_node_name, queue_options, HEARTBEAT_INTERVAL
+from .retry import close_circuit, schedule_retry
+from .probe import InputCache, probe_all, save_states, setting
+from .history import EventBuffer, write_events, EVENT_FLUSH_INTERVAL
+
+PENDING_TIMEOUT = 15
+STOP_TIMEOUT = 5
+MAX_RETRIES = 5
+LOG_FLUSH_INTERVAL = 0.5
+HEALTH_CHECK_INTERVAL = 2
+SHARE_JOIN_DELAY = 2        # seconds to collect jobs joining a shared process before rebuilding it
+# A launched job was admitted (pending), is retried (stopped) or is in a shared process being rebuilt (running)
+LAUNCH_STATUSES = ['pending', 'stopped', 'running']
+LINE_SPLIT = re.compile(rb'[\r\n]+')
+
+
+def supervisor_address():
+    return (
+        getattr(settings, 'SUPERVISOR_HOST', '127.0.0.1'),
+        getattr(settings, 'SUPERVISOR_PORT', 7800),
+    )
+
+
+class SupervisorError(Exception):
+    pass
+
+
+def send_command(cmd, timeout=10, address=None, **kwargs):
+    """Send one command to the supervisor at `address` (this host's by default) and return its reply."""
+    request = json.dumps({'cmd': cmd, **kwargs}).encode() + b'\n'
+    try:
+        with socket.create_connection(address or supervisor_address(), timeout=timeout) as sock:
+            sock.sendall(request)
+            reply = sock.makefile('rb').readline()
+    except OSError as e:
+        raise SupervisorError(f"FFmpeg supervisor is not reachable: {e}")
+    if not reply:
+        raise SupervisorError("FFmpeg supervisor closed the connection")
+    return json.loads(reply)
+
+
+@sync_to_async
+def _transition(job_id, status, from_statuses=None, **fields):
+    # No request cycle here, so drop expired/broken persistent connections ourselves
+    close_old_connections()
+    return transition(job_id, status, from_statuses, **fields)
+
+
+@sync_to_async
+def _update_job(job_id, **fields):
+    close_old_connections()
+    return update_job(job_id, **fields)
+
+
+@sync_to_async
+def _admit_queued():
+    from .tasks import start_jobs
+
+    close_old_connections()
+    job_ids = admit_queued()
+    if job_ids:
+        start_jobs(job_ids)
+    return job_ids
+
+
+@sync_to_async
+def _schedule_retry(job_id, address, max_retries):
+    close_old_connections()
+    return schedule_retry(job_id, address, max_retries)
+
+
+@sync_to_async
+def _close_circuits(addresses):
+    close_old_connections()
+    for address in addresses:
+        close_circuit(address)
+
+
+@sync_to_async
+def _waiting_retries():
+    close_old_connections()
+    return list(local_jobs(TranscodingJob.objects.filter(status='stopped', next_retry_at__isnull=False)).values_list(
+        'id', 'retry_count', 'next_retry_at'
+    ))
+
+
+@sync_to_async
+def _channel_inputs():
+    close_old_connections()
+    channels = Channel.objects.filter(input_type__in=['udp', 'hls']).only(
+        'input_type', 'input_url', 'input_multicast_ip', 'input_network'
+    )
+    return {input_address(channel) for channel in channels}
+
+
+@sync_to_async
+def _save_input_states(results):
+    close_old_connections()
+    save_states(results)
+
+
+@sync_to_async
+def _write_events(events):
+    close_old_connections()
+    return write_events(events)
+
+
+@sync_to_async
+def _heartbeat(name, job_ids):
+    from .tasks import start_jobs
+
+    close_old_connections()
+    moved = heartbeat(name, job_ids)
+    failed_over = fail_over()
+    if failed_over:
+        start_jobs(failed_over)
+    return moved
+
+
+@sync_to_async
+def _shared_command(job_ids):
+    close_old_connections()
+    return shared_command_for_jobs(job_ids)
+
+
+class ManagedProcess:
+    def __init__(self, key, log_files, process, command, retry_count):
+        self.key = key
+        self.log_files = log_files    # job id -> channel log path, one entry per job sharing the process
+        self.job_ids = list(log_files)
+        self.process = process
+        self.command = command
+        self.retry_count = retry_count
+        self.started_at = time.time()
+        self.log = None
+        self.log_filter = LogFilter()
+        self.progress = ProgressParser()
+        self.health = StallDetector()
+        self.restart_reason = None
+        self.running = False
+        self.stopping = False
+        self.replaced = False
+        self.cores = None
+
+    def as_dict(self):
+        return {
+            'key': self.key,
+            'job_ids': self.job_ids,
+            'pid': self.process.pid,
+            'running': self.running,
+            'stopping': self.stopping,
+            'retry_count': self.retry_count,
+            'restart_reason': self.restart_reason,
+            'uptime': round(time.time() - self.started_at, 1),
+            'cores': self.cores,
+            'log_lines': {'read': self.log_filter.lines_in, 'written': self.log_filter.lines_out},
+        }
+
+
+class Supervisor:
+    def __init__(self, max_retries=MAX_RETRIES):
+        self.max_retries = max_retries
+        self.processes = {}     # process key -> ManagedProcess
+        self.job_keys = {}      # job id -> process key
+        self.joining = {}       # process key -> {job id: log path} waiting for a rebuild
+        self.job_costs = {}     # job id -> estimated encoding cost, for CPU placement
+        self.job_inputs = {}    # job id -> input address, for the input circuit breakers
+        self.inputs = InputCache()
+        self.waiting = {}       # job id -> start arguments, held until the input is alive
+        self.events = EventBuffer()
+        self.placement_enabled = getattr(settings, 'CPU_PLACEMENT', True)
+        self.nodes = numa_nodes()
+
+    async def serve(self, host, port):
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"FFmpeg supervisor listening on {host}:{port}")
+        await self.recover_jobs()
+        asyncio.create_task(self.flush_logs())
+        asyncio.create_task(self.flush_events())
+        asyncio.create_task(self.monitor_health())
+        if getattr(settings, 'INPUT_PROBE', True):
+            asyncio.create_task(self.probe_inputs())
+        if local_node_name():
+            asyncio.create_task(self.send_heartbeats(local_node_name()))
+        async with server:
+            await server.serve_forever()
+
+    async def handle_client(self, reader, writer):
+        try:
+            line = await reader.readline()
+            request = json.loads(line)
+            reply = await self.dispatch(request)
+        except Exception as e:
+            reply = {'ok': False, 'error': str(e)}
+        writer.write(json.dumps(reply).encode() + b'\n')
+        await writer.drain()
+        writer.close()
+
+    async def dispatch(self, request):
+        cmd = request.get('cmd')
+        if cmd == 'start':
+            return await self.start_job(
+                request['job_id'], request['command'], request['log_file'],
+                request.get('retry_count', 0), request.get('share_key'), request.get('cost'),
+                request.get('input_address'),
+            )
+        if cmd == 'stop':
+            return await self.stop_job(request['job_id'])
+        if cmd == 'status':
+            return {'ok': True, 'jobs': [p.as_dict() for p in self.processes.values()]}
+        if cmd == 'stats':
+            managed = self.process_for(request['job_id'])
+            if managed is None:
+                return {'ok': False, 'error': f"Job {request['job_id']} is not running"}
+            return {'ok': True, 'stats': managed.progress.stats.as_dict()}
+        if cmd == 'inputs':
+            inputs = {address: self.inputs.get(address) for address in self.inputs.entries}
+            return {
+                'ok': True,
+                'inputs': {address: {'alive': r[0], 'error': r[1]} for address, r in inputs.items() if r},
+                'waiting': {job_id: start['input_address'] for job_id, start in self.waiting.items()},
+            }
+        if cmd == 'placement':
+            return {'ok': True, 'enabled': self.placement_enabled, 'nodes': self.nodes, 'processes': [
+                {**p.as_dict(), 'cost': self.process_cost(p)} for p in self.processes.values() if not p.replaced
+            ]}
+        return {'ok': False, 'error': f"Unknown command: {cmd}"}
+
+    def process_for(self, job_id):
+        return self.processes.get(self.job_keys.get(job_id))
+
+    def process_cost(self, managed):
+        return round(sum(self.job_costs.get(job_id, 1.0) for job_id in managed.job_ids), 3)
+
+    def rebalance(self):
+        """
+        Plan cores for all live processes, sized by the cost of their jobs
+        (see placement.py), and pin the ones whose cores changed.
+        """
+        if not self.placement_enabled:
+            return
+        live = {key: m for key, m in self.processes.items() if not m.replaced and m.process.returncode is None}
+        placement = plan({key: self.process_cost(m) for key, m in live.items()}, self.nodes)
+        for key, cores in placement.items():
+            managed = live[key]
+            if managed.cores != cores and pin(managed.process.pid, cores):
+                managed.cores = cores
+
+    async def start_job(self, job_id, command, log_file_path, retry_count=0, share_key=None, cost=None, input_address=None):
+        """
+        Launch a job's FFmpeg. A job on an input the prober found down waits
+        here until packets are seen again (see probe.py), one with the
+        `share_key` of a running process joins it.
+        """
+        if job_id in self.job_keys:
+            managed = self.process_for(job_id)
+            return {'ok': False, 'error': f"Job {job_id} already running", 'pid': managed.process.pid if managed else None}
+        if input_address and self.inputs.is_down(input_address):
+            # FFmpeg would only fail, launch once the prober sees the input again
+            self.waiting[job_id] = {
+                'job_id': job_id, 'command': command, 'log_file_path': log_file_path, 'retry_count': retry_count,
+                'share_key': share_key, 'cost': cost, 'input_address': input_address,
+            }
+            await _transition(
+                job_id, 'pending', LAUNCH_STATUSES, ffmpeg_pid=None, next_retry_at=None,
+                error_message=f"Waiting for input: {self.inputs.get(input_address)[1]}",
+            )
+            return {'ok': True, 'waiting': input_address}
+        if cost:
+            self.job_costs[job_id] = cost
+        if input_address:
+            self.job_inputs[job_id] = input_address
+
+        key = share_key or f"job:{job_id}"
+        if key in self.processes:
+            return await self.join(key, job_id, log_file_path)
+        return await self.spawn(key, {job_id: log_file_path}, command, retry_count)
+
+    async def spawn(self, key, log_files, command, retry_count=0):
+        for log_file_path in log_files.values():
+            os.makedirs(os.path.dirname(log_file_path), exist_ok=True)
+        try:
+            process = await asyncio.create_subprocess_exec(
+                *command,
+                stdin=asyncio.subprocess.DEVNULL,
+                stdout=asyncio.subprocess.PIPE,
+                stderr=asyncio.subprocess.PIPE,
+            )
+        except Exception as e:
+            for job_id in log_files:
+                self.job_keys.pop(job_id, None)
+                await _transition(job_id, 'error', ffmpeg_pid=None, error_message=f"Could not start FFmpeg: {e}")
+                self.events.add(job_id, 'error', message=f"Could not start FFmpeg: {e}")
+            return {'ok': False, 'error': str(e)}
+
+        managed = ManagedProcess(key, log_files, process, command, retry_count)
+        self.processes[key] = managed
+        for job_id in managed.job_ids:
+            self.job_keys[job_id] = key
+        self.rebalance()
+        for job_id in managed.job_ids:
+            await _transition(
+                job_id, 'pending', LAUNCH_STATUSES, ffmpeg_pid=process.pid, start_time=timezone.now(), end_time=None,
+                next_retry_at=None,
+            )
+            self.events.add(job_id, 'start', message=f"FFmpeg PID {process.pid}, retry {retry_count}")
+
+        asyncio.create_task(self.supervise(managed))
+        return {'ok': True, 'pid': process.pid}
+
+    async def join(self, key, job_id, log_file_path):
+        """
+        Add a job to the running process decoding the same input. The
+        process is rebuilt with the new member, which interrupts the output
+        of every channel already in it (SHARE_INPUTS is off by default).
+        """
+        self.job_keys[job_id] = key
+        joining = self.joining.setdefault(key, {})
+        joining[job_id] = log_file_path
+        if len(joining) == 1:
+            # Jobs of a bulk start or retry arrive together, rebuild once for all of them
+            asyncio.create_task(self.rebuild(key, SHARE_JOIN_DELAY))
+
+        pid = self.processes[key].process.pid
+        await _transition(job_id, 'pending', LAUNCH_STATUSES, ffmpeg_pid=pid, start_time=timezone.now(), end_time=None)
+        self.events.add(job_id, 'start', message=f"Joining shared FFmpeg {key}")
+        return {'ok': True, 'pid': pid, 'shared': key}
+
+    async def rebuild(self, key, delay=0):
+        await asyncio.sleep(delay)
+        managed = self.processes.get(key)
+        log_files = dict(managed.log_files) if managed else {}
+        log_files.update(self.joining.pop(key, {}))
+        # Jobs stopped in the meantime are no longer mapped to this key
+        log_files = {job_id: path for job_id, path in log_files.items() if self.job_keys.get(job_id) == key}
+        await self.replace(key, managed, log_files)
+
+    async def replace(self, key, managed, log_files):
+        """Swap `managed` for a process encoding `log_files` jobs from the same input, an outage for all of them."""
+        command = await _shared_command(sorted(log_files)) if log_files else None
+        retry_count = managed.retry_count if managed else 0
+        if managed is not None:
+            # Keep the key until the new process is registered, so a job starting
+            # in between joins it instead of starting a second FFmpeg
+            managed.stopping = managed.replaced = True
+            await self.terminate(managed)
+        if command:
+            await self.spawn(key, log_files, command, retry_count)
+        if managed is not None and self.processes.get(key) is managed:
+            del self.processes[key]
+
+    async def stop_job(self, job_id, mark_stopped=True):
+        """Stop a job's FFmpeg, leaving its status alone if not `mark_stopped`."""
+        key = self.job_keys.get(job_id)
+        if key is None and job_id not in self.waiting:
+            return {'ok': False, 'error': f"Job {job_id} is not running"}
+
+        managed = self.processes.get(key)
+        if self.waiting.pop(job_id, None):
+            pass    # waiting for its input, never launched
+        elif job_id in self.joining.get(key, {}) or managed is None:
+            # Not part of the FFmpeg yet, nothing to restart
+            self.joining.get(key, {}).pop(job_id, None)
+            del self.job_keys[job_id]
+        elif managed.job_ids == [job_id]:
+            managed.stopping = True
+            await self.terminate(managed)
+        else:
+            # Other channels still use this input, rebuild without this one
+            del self.job_keys[job_id]
+            await self.replace(key, managed, {j: p for j, p in managed.log_files.items() if j != job_id})
+        if mark_stopped:
+            await _transition(job_id, 'stopped', ffmpeg_pid=None, end_time=timezone.now())
+            self.events.add(job_id, 'stop')
+        await self.start_queued()
+        return {'ok': True}
+
+    async def probe_inputs(self):
+        """Probe the inputs of all channels and launch the jobs waiting on inputs that came back."""
+        while True:
+            try:
+                addresses = await _channel_inputs() | {start['input_address'] for start in self.waiting.values()}
+                # An input FFmpeg is encoding from is alive, no need to join it again
+                busy = {
+                    self.job_inputs[job_id] for managed in self.processes.values() if managed.running and not managed.replaced
+                    for job_id in managed.job_ids if job_id in self.job_inputs
+                }
+                results = await probe_all(addresses - busy)
+                results.update({address: (True, None) for address in busy})
+                for address, (alive, error) in results.items():
+                    self.inputs.set(address, alive, error)
+                await _save_input_states(results)
+                await self.start_waiting()
+            except Exception as e:
+                print(f"[Supervisor] Input probe failed: {e}")
+            await asyncio.sleep(setting('INPUT_PROBE_INTERVAL'))
+
+    async def start_waiting(self):
+        for job_id, start in list(self.waiting.items()):
+            if not self.inputs.is_down(start['input_address']) and self.waiting.pop(job_id, None):
+                print(f"[Supervisor] Input {start['input_address']} is back, starting job {job_id}")
+                await _update_job(job_id, error_message=None)
+                await self.start_job(**start)
+
+    async def start_queued(self):
+        """Give the capacity freed by a stop or a final failure to queued jobs (see admission.py)."""
+        for job_id in await _admit_queued():
+            print(f"[Supervisor] Capacity freed, started queued job {job_id}")
+
+    async def send_heartbeats(self, name):
+        """
+        Keep this host registered as node `name` and move the jobs of nodes
+        that stopped sending heartbeats (see nodes.py).
+        """
+        while True:
+            try:
+                moved = await _heartbeat(name, list(self.job_keys) + list(self.waiting))
+                # Jobs failed over while this node was unreachable run elsewhere now
+                for job_id in moved:
+                    if job_id in self.job_keys or job_id in self.waiting:
+                        print(f"[Supervisor] Job {job_id} was moved off this node, stopping it here")
+                        await self.stop_job(job_id, mark_stopped=False)
+            except Exception as e:
+                print(f"[Supervisor] Heartbeat failed: {e}")
+            await asyncio.sleep(getattr(settings, 'NODE_HEARTBEAT_INTERVAL', HEARTBEAT_INTERVAL))
+
+    async def terminate(self, managed):
+        process = managed.process
+        if process.returncode is not None:
+            return
+        try:
+            process.terminate()
+            await asyncio.wait_for(process.wait(), STOP_TIMEOUT)
+        except asyncio.TimeoutError:
+            print(f"FFmpeg {managed.key} did not exit after SIGTERM, forcing kill")
+            process.kill()
+            await process.wait()
+        except ProcessLookupError:
+            pass
+
+    async def read_lines(self, stream):
+        """Yield the complete lines of each chunk read from a child pipe, as bytes."""
+        # FFmpeg ends progress lines with \r, so split on both line endings
+        buffer = b''
+        while True:
+            chunk = await stream.read(65536)
+            if not chunk:
+                break
+            *lines, buffer = LINE_SPLIT.split(buffer + chunk)
+            yield [line.strip() for line in lines if line.strip()]
+        if buffer.strip():
+            yield [buffer.strip()]
+
+    async def flush_logs(self):
+        # One periodic flush for every channel log instead of a syscall per line
+        while True:
+            await asyncio.sleep(LOG_FLUSH_INTERVAL)
+            for managed in list(self.processes.values()):
+                if managed.log:
+                    managed.log.flush()
+
+    async def flush_events(self):
+        # Job history is written in batches, see history.py
+        while True:
+            await asyncio.sleep(getattr(settings, 'EVENT_FLUSH_INTERVAL', EVENT_FLUSH_INTERVAL))
+            events = self.events.drain()
+            try:
+                await _write_events(events)
+            except Exception as e:
+                print(f"[Supervisor] Could not write {len(events)} job events: {e}")
+
+    async def monitor_health(self):
+        # One loop checks every running job for stalls and degraded encoding
+        while True:
+            await asyncio.sleep(HEALTH_CHECK_INTERVAL)
+            for managed in list(self.processes.values()):
+                if not managed.running or managed.stopping or managed.restart_reason:
+                    continue
+                reason = managed.health.check(managed.progress.stats)
+                if reason:
+                    asyncio.create_task(self.restart(managed, reason))
+
+    async def restart(self, managed, reason):
+        """Kill a degraded FFmpeg and let handle_exit retry it through transcoding_start."""
+        managed.restart_reason = reason
+        managed.log.write(f"{reason}. Restarting FFmpeg")
+        for job_id in managed.job_ids:
+            # Back to pending with the reason, so the dashboard sees why the channel restarts
+            await _transition(job_id, 'pending', ['running'], error_message=reason)
+            self.events.add(job_id, 'stall', message=reason)
+        await self.terminate(managed)
+
+    async def supervise(self, managed):
+        if len(managed.log_files) == 1:
+            log = managed.log = ChannelLog(*managed.log_files.values())
+        else:
+            log = managed.log = SharedLog(managed.log_files.values())
+        log.write("=== Starting new FFmpeg job ===")
+        if len(managed.job_ids) > 1:
+            log.write(f"Sharing input with jobs {managed.job_ids}")
+        log.write(f"Command: {' '.join(managed.command)}")
+        watchdog = asyncio.create_task(self.watchdog(managed, log))
+
+        try:
+            await asyncio.gather(
+                self.read_log(managed, log),
+                self.read_progress(managed),
+            )
+            await managed.process.wait()
+            log.write_lines(managed.log_filter.finish())
+            log.write(f"--- FFmpeg exited with return code {managed.process.returncode} ---")
+            # Stops and rebuilds are recorded by the caller, this is FFmpeg exiting on its own
+            if not managed.stopping:
+                for job_id in managed.job_ids:
+                    self.events.add(job_id, 'exit', exit_code=managed.process.returncode, message=managed.restart_reason)
+        finally:
+            watchdog.cancel()
+            # A process replaced by a rebuild leaves its key and jobs to the new one
+            if not managed.replaced and self.processes.get(managed.key) is managed:
+                del self.processes[managed.key]
+                for job_id in managed.job_ids:
+                    if self.job_keys.get(job_id) == managed.key:
+                        del self.job_keys[job_id]
+                # Give the freed cores to the remaining processes
+                self.rebalance()
+
+        retrying = False
+        try:
+            if not managed.stopping:
+                retrying = await self.handle_exit(managed, log)
+        finally:
+            log.close()
+        # A job about to be retried keeps its share of the capacity
+        if not managed.replaced and not retrying:
+            await self.start_queued()
+
+    async def read_log(self, managed, log):
+        async for lines in self.read_lines(managed.process.stderr):
+            # Progress spam and repeated warnings are thinned out, see logfilter.py
+            log.write_lines(managed.log_filter.feed(lines))
+
+    async def read_progress(self, managed):
+        async for lines in self.read_lines(managed.process.stdout):
+            if not managed.progress.feed(lines):
+                continue
+            # Live status check, first progress block with encoded frames
+            if not managed.running and managed.progress.stats.frame:
+                managed.running = True
+                for job_id in managed.job_ids:
+                    # Running again, the next crash starts over at the first backoff
+                    await _transition(job_id, 'running', retry_count=0, next_retry_at=None)
+                    self.events.add(job_id, 'running')
+                # The input works again, channels waiting on it may retry
+                await _close_circuits({self.job_inputs[j] for j in managed.job_ids if j in self.job_inputs})
+
+    async def watchdog(self, managed, log):
+        """kill ffmpeg if no progress appears for certain time"""
+        await asyncio.sleep(PENDING_TIMEOUT)
+        if not managed.running and not managed.stopping:
+            log.write("No progress logs after timeout. Killing process")
+            managed.stopping = True
+            await self.terminate(managed)
+            for job_id in managed.job_ids:
+                if await _transition(
+                    job_id, 'error', ['pending'], ffmpeg_pid=None, end_time=timezone.now(),
+                    error_message=f"FFmpeg produced no progress within {PENDING_TIMEOUT}s",
+                ):
+                    self.events.add(job_id, 'error', message=f"FFmpeg produced no progress within {PENDING_TIMEOUT}s")
+
+    async def handle_exit(self, managed, log):
+        # Retry with backoff after the process ends on its own, the retry state is on
+        # the job and failures are counted per input (see retry.py). The status check
+        # is part of the update, so a job stopped or failed in the meantime is left
+        # alone. Jobs of a shared process are retried together and join up again.
+        # Returns True if any job will be retried
+        from .tasks import transcoding_start
+
+        retrying = False
+        for job_id in managed.job_ids:
+            outcome, delay = await _schedule_retry(job_id, self.job_inputs.get(job_id), self.max_retries)
+            if outcome == 'retry':
+                log.write(f"Retrying job {job_id} in {delay:.0f}s")
+                self.events.add(job_id, 'retry', message=f"Retrying in {delay:.0f}s")
+                transcoding_start.apply_async(args=[job_id, True], countdown=delay, **queue_options(local_node_name()))
+                retrying = True
+            elif outcome == 'exhausted' and await _transition(
+                job_id, 'error', ['pending', 'running'], ffmpeg_pid=None, end_time=timezone.now(),
+                error_message=f"FFmpeg exited with code {managed.process.returncode} after {self.max_retries} retries",
+            ):
+                log.write(f"Maximum retries ({self.max_retries}) reached for job {job_id}. No further restart attempts will be made.")
+                self.events.add(job_id, 'error', exit_code=managed.process.returncode, message=f"Gave up after {self.max_retries} retries")
+        return retrying
+
+    async def recover_jobs(self):
+        """Kill FFmpeg left behind by a previous supervisor and restart its jobs."""
+        from .tasks import is_ffmpeg_process, transcoding_start
+
+        # PIDs are only meaningful for the jobs of this host
+        jobs = await sync_to_async(list)(
+            local_jobs(TranscodingJob.objects.filter(status__in=['pending', 'running'])).values_list('id', 'ffmpeg_pid')
+        )
+        for job_id, pid in jobs:
+            if pid and is_ffmpeg_process(pid):
+                print(f"Killing orphaned FFmpeg {pid} for job {job_id}")
+                try:
+                    os.kill(pid, signal.SIGKILL)
+                except OSError:
+                    pass
+            await _update_job(job_id, ffmpeg_pid=None)
+            print(f"[Supervisor] Restarting job {job_id}")
+            transcoding_start.apply_async([job_id], **queue_options(local_node_name()))
+
+        # Retries are persisted, schedule them again in case their tasks were lost
+        now = timezone.now()
+        for job_id, retry_count, next_retry_at in await _waiting_retries():
+            print(f"[Supervisor] Rescheduling retry {retry_count} of job {job_id}")
+            transcoding_start.apply_async(
+                [job_id, True], countdown=max((next_retry_at - now).total_seconds(), 0), **queue_options(local_node_name())
+            )
+        await self.start_queued()
+
+
+def install_child_watcher(loop):
+    # Python 3.11 defaults to one waitpid thread per child, pidfd watches them all from the loop
+    if sys.version_info < (3, 12) and hasattr(asyncio, 'PidfdChildWatcher'):
+        watcher = asyncio.PidfdChildWatcher()
+        watcher.attach_loop(loop)
+        asyncio.set_child_watcher(watcher)
+
+
+def run():
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    install_child_watcher(loop)
+    host, port = supervisor_address()
+    loop.run_until_complete(Supervisor().serve(host, port))
@@ -1,3 +1,1327 @@
-from django.test import TestCase
+import asyncio, collections, dataclasses, itertools, json, sys, tempfile, time, os
+from datetime import timedelta
+from unittest import mock
+from asgiref.sync import async_to_sync, sync_to_async
+from channels.routing import URLRouter
+from channels.testing import WebsocketCommunicator
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from .consumers import StatusConsumer
+from .routing import websocket_urlpatterns
+from .metrics import MetricsSampler
+from .models import Channel, ABR, TranscodingJob, EncoderProfile, Node, InputCircuit, JobEvent, JobEventRollup
+from .supervisor import Supervisor, LINE_SPLIT
+from .logsink import ChannelLog, compressor, enforce_retention, open_segment, segments
+from .logread import read_after, search
+from .progress import ProgressParser, ProgressStats
+from .health import StallDetector
+from .logfilter import LogFilter, ERROR_LINE, PROGRESS_LINE
+from .placement import job_cost, parse_cpulist, plan
+from .admission import admit, admit_queued, headroom
+from .nodes import fail_over, heartbeat
+from .retry import backoff_delay, close_circuit, schedule_retry
+from .probe import InputCache, probe_hls, save_states
+from .history import rollup_events, write_events
+from .job_state import transition, ALL_STATUSES
+from .tasks import start_jobs, transcoding_start
+from .ffmpeg_builder import (
+    ABRSnapshot, ChannelSnapshot, EncoderSnapshot, OutputSnapshot, build_command, command_for_channel,
+    build_shared_command, default_encoder_threads,
+)
 
-# Create your tests here.
+IN_MEMORY_CHANNEL_LAYERS = {'default': {'BACKEND': 'channels.layers.InMemoryChannelLayer'}}
+
+
+def create_abr_channel(name, profiles=2):
+    channel = Channel.objects.create(
+        name=name,
+        input_type='udp',
+        input_multicast_ip='239.1.1.1:5000',
+        input_network='127.0.0.1',
+        is_abr=True,
+        resolution=None,
+        service_id=None,
+        video_pid=None,
+        audio_pid=None,
+        pmt_pid=None,
+        pcr_pid=None,
+    )
+    for i in range(profiles):
+        ABR.objects.create(
+            channel=channel,
+            output_type='udp',
+            output_multicast_ip=f'239.2.2.{i + 1}:5000',
+            output_network='127.0.0.1',
+            video_bitrate=2000000,
+            audio_bitrate=128000,
+            buffer_size=4000000,
+            resolution='1280x720',
+            service_id=i + 1,
+            video_pid=101,
+            audio_pid=102,
+            pmt_pid=4096,
+            pcr_pid=256,
+            muxrate=5000000,
+        )
+    return channel
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ChannelListQueryTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def count_list_queries(self):
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get('/api/channels/')
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response.json()
+
+    def test_query_count_is_constant(self):
+        for i in range(2):
+            create_abr_channel(f'small-{i}')
+        small_count, _ = self.count_list_queries()
+
+        for i in range(20):
+            create_abr_channel(f'large-{i}')
+        large_count, data = self.count_list_queries()
+
+        self.assertEqual(small_count, large_count)
+        self.assertEqual(len(data), 22)
+        self.assertTrue(all(len(c['abr_profiles']) == 2 for c in data))
+        self.assertTrue(all(c['status'] == 'stopped' and c['job_id'] for c in data))
+
+    def test_detail_query_count(self):
+        channel = create_abr_channel('detail')
+        with self.assertNumQueries(4):  # channel and job, ABR profiles, their extra outputs, input states
+            response = self.client.get(f'/api/channels/{channel.id}/')
+        self.assertEqual(response.json()['status'], 'stopped')
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class ListCachingTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.channels = [create_abr_channel(f'list-{i}') for i in range(12)]
+
+    def test_unchanged_poll_gets_304_without_loading_rows(self):
+        for url, queries in (('/api/channels/', 2), ('/api/channels/?fields=id,name', 1), ('/api/jobs/', 1)):
+            etag = self.client.get(url)['ETag']
+            with self.assertNumQueries(queries):  # the aggregates only
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response['ETag'], etag)
+
+    def test_etag_follows_job_and_channel_changes(self):
+        job = self.channels[0].jobs
+        channel_etag, jobs_etag = self.client.get('/api/channels/')['ETag'], self.client.get('/api/jobs/')['ETag']
+        config_etag = self.client.get('/api/channels/?fields=id,name')['ETag']
+        transition(job.id, 'pending')
+        self.assertNotEqual(self.client.get('/api/channels/')['ETag'], channel_etag)
+        self.assertNotEqual(self.client.get('/api/jobs/')['ETag'], jobs_etag)
+        # A status change leaves the list without job fields alone
+        self.assertEqual(self.client.get('/api/channels/?fields=id,name')['ETag'], config_etag)
+        self.channels[1].name = 'renamed'
+        self.channels[1].save()
+        self.assertNotEqual(self.client.get('/api/channels/?fields=id,name')['ETag'], config_etag)
+
+        # A save of some fields bumps the version too
+        jobs_etag = self.client.get('/api/jobs/')['ETag']
+        job = TranscodingJob.objects.get(id=job.id)
+        job.error_message = 'edited'
+        job.save(update_fields=['error_message'])
+        self.assertEqual(TranscodingJob.objects.get(id=job.id).version, job.version)
+        self.assertNotEqual(self.client.get('/api/jobs/')['ETag'], jobs_etag)
+
+    def test_sparse_fields(self):
+        with self.assertNumQueries(2):  # aggregates, channels and jobs
+            data = self.client.get('/api/channels/?fields=id,status').json()
+        self.assertEqual(data[0], {'id': self.channels[0].id, 'status': 'stopped'})
+        self.assertEqual(set(self.client.get('/api/jobs/?fields=id,status').json()[0]), {'id', 'status'})
+        self.assertEqual(self.client.get('/api/channels/?fields=id,bogus').status_code, 400)
+
+    def test_cursor_pages(self):
+        # Without page_size the list stays a plain array
+        self.assertEqual(len(self.client.get('/api/channels/').json()), 12)
+        ids, url = [], '/api/channels/?page_size=5&fields=id'
+        while url:
+            data = self.client.get(url).json()
+            ids += [channel['id'] for channel in data['results']]
+            url = data['next']
+        self.assertEqual(ids, [channel.id for channel in self.channels])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class StatusConsumerTests(TestCase):
+    def test_job_status_is_pushed(self):
+        job = create_abr_channel('ws').jobs
+
+        async def run():
+            communicator = WebsocketCommunicator(StatusConsumer.as_asgi(), '/ws/status/')
+            connected, _ = await communicator.connect()
+            self.assertTrue(connected)
+
+            job.status = 'error'
+            job.error_message = 'input lost'
+            await sync_to_async(job.save)()
+
+            message = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+            return message
+
+        message = async_to_sync(run)()
+        self.assertEqual(message['type'], 'job_status')
+        self.assertEqual(message['job_id'], job.id)
+        self.assertEqual(message['status'], 'error')
+        self.assertEqual(message['error_message'], 'input lost')
+
+
+NetCounters = collections.namedtuple('NetCounters', 'bytes_sent bytes_recv')
+
+
+class MetricsSamplerTests(TestCase):
+    def test_rates_and_history_window(self):
+        clock = {'monotonic': 100.0, 'time': 1000.0}
+        counters = {'eth0': NetCounters(0, 0), 'lo': NetCounters(0, 0)}
+        with mock.patch('transcoder.metrics.time') as fake_time, mock.patch('transcoder.metrics.psutil') as fake_psutil:
+            fake_time.monotonic.side_effect = lambda: clock['monotonic']
+            fake_time.time.side_effect = lambda: clock['time']
+            fake_psutil.net_io_counters.side_effect = lambda pernic: dict(counters)
+            fake_psutil.cpu_percent.return_value = 12.5
+            fake_psutil.virtual_memory.return_value.percent = 40.0
+
+            sampler = MetricsSampler(interval=1.0, history_size=10)
+            sampler.prime()
+            for step in range(1, 6):
+                clock['monotonic'] += 2
+                clock['time'] += 2
+                # eth0 receives 1 MiB and sends 0.5 MiB per 2s step, an interface appearing has no rate yet
+                counters['eth0'] = NetCounters(step * 512 * 1024, step * 1024 * 1024)
+                if step == 3:
+                    counters['wlan0'] = NetCounters(0, 0)
+                sample = sampler.sample()
+
+            self.assertEqual(sample['interfaces']['eth0'], {'in_mbps': 4.0, 'out_mbps': 2.0})
+            self.assertEqual(sample['interfaces']['lo'], {'in_mbps': 0.0, 'out_mbps': 0.0})
+            self.assertEqual(sample['network'], {'in_mbps': 4.0, 'out_mbps': 2.0})
+            self.assertEqual((sample['cpu_usage'], sample['ram_usage']), (12.5, 40.0))
+            self.assertIn('wlan0', sample['interfaces'])
+            self.assertNotIn('wlan0', list(sampler.samples)[2]['interfaces'])
+
+            # Samples at 1002..1010, the last 4 seconds hold the ones at 1006, 1008 and 1010
+            self.assertEqual([s['timestamp'] for s in sampler.history(4)], [1006.0, 1008.0, 1010.0])
+            self.assertEqual(len(sampler.history(3600)), 5)
+            self.assertIs(sampler.latest(), sample)
+
+            # Asked right after starting, the rates are zero instead of a spike over a few microseconds
+            counters['eth0'] = NetCounters(0, 0)
+            sampler = MetricsSampler(interval=1.0, history_size=10)
+            sampler.prime()
+            clock['monotonic'] += 0.001
+            counters['eth0'] = NetCounters(0, 64 * 1024)
+            sample = sampler.latest()
+            self.assertEqual((sample['network'], sample['cpu_usage']), ({'in_mbps': 0.0, 'out_mbps': 0.0}, 0.0))
+            self.assertEqual(len(sampler.samples), 0)
+            # The next sample measures from the primed baseline
+            clock['monotonic'] += 0.999
+            counters['eth0'] = NetCounters(0, 1024 * 1024)
+            self.assertEqual(sampler.sample()['network'], {'in_mbps': 8.0, 'out_mbps': 0.0})
+
+    @override_settings(ENCODE_CAPACITY=4)
+    def test_only_the_publisher_broadcasts(self):
+        for broadcast in (False, True):
+            sampler = MetricsSampler(interval=0, broadcast=broadcast)
+            sampler.prime()
+            # Leave the sampling loop after one sample
+            with mock.patch('transcoder.metrics.time.sleep', side_effect=[None, KeyboardInterrupt]), \
+                    mock.patch('transcoder.metrics.broadcast_metrics') as broadcast_metrics:
+                with self.assertRaises(KeyboardInterrupt):
+                    sampler.run()
+            self.assertEqual(broadcast_metrics.call_count, int(broadcast))
+        # Same fields as /api/metrics/
+        self.assertEqual(broadcast_metrics.call_args.args[0]['capacity']['available'], 4.0)
+
+    def test_capacity_is_refreshed_by_the_sampler(self):
+        sampler = MetricsSampler(interval=0, capacity_interval=0)
+        sampler.prime()
+        with mock.patch('transcoder.admission.headroom', side_effect=[{'available': 1.0}, {'available': 0.5}]) as headroom:
+            # Computed on first use, then only on the sampler's ticks
+            self.assertEqual(sampler.capacity(), {'available': 1.0})
+            self.assertEqual(sampler.capacity(), {'available': 1.0})
+            with mock.patch('transcoder.metrics.time.sleep', side_effect=[None, KeyboardInterrupt]):
+                with self.assertRaises(KeyboardInterrupt):
+                    sampler.run()
+            self.assertEqual(sampler.capacity(), {'available': 0.5})
+        self.assertEqual(headroom.call_count, 2)
+
+
+# Stands in for FFmpeg: prints one progress line, then keeps running
+FAKE_FFMPEG = [sys.executable, '-c', (
+    "import sys, time\n"
+    "sys.stderr.write('frame=1 fps=25 bitrate=1k\\r'); sys.stderr.flush()\n"
+    "print('frame=1\\nfps=25.0\\nbitrate=1024.0kbits/s\\nspeed=1.01x\\nprogress=continue', flush=True)\n"
+    "time.sleep(30)"
+)]
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class SupervisorTests(TestCase):
+    def test_start_running_and_stop(self):
+        job = create_abr_channel('supervised').jobs
+        log_file = os.path.join(tempfile.mkdtemp(), 'supervised.log')
+
+        async def run():
+            supervisor = Supervisor()
+            reply = await supervisor.start_job(job.id, FAKE_FFMPEG, log_file)
+            self.assertTrue(reply['ok'])
+
+            # Wait for the progress line to flip the job to running
+            for _ in range(50):
+                if supervisor.process_for(job.id).running:
+                    break
+                await asyncio.sleep(0.1)
+            status = await sync_to_async(lambda: TranscodingJob.objects.get(id=job.id).status)()
+            self.assertEqual(status, 'running')
+
+            reply = await supervisor.dispatch({'cmd': 'stats', 'job_id': job.id})
+            self.assertEqual(reply['stats']['frame'], 1)
+            self.assertEqual(reply['stats']['speed'], 1.01)
+            self.assertEqual(reply['stats']['bitrate_kbps'], 1024.0)
+
+            reply = await supervisor.stop_job(job.id)
+            self.assertTrue(reply['ok'])
+            await asyncio.sleep(0.1)
+            self.assertIsNone(supervisor.process_for(job.id))
+            await sync_to_async(write_events)(supervisor.events.drain())
+
+        async_to_sync(run)()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'stopped')
+        self.assertIsNone(job.ffmpeg_pid)
+        with open(log_file) as f:
+            self.assertIn('frame=1 fps=25', f.read())
+        self.assertEqual(
+            list(JobEvent.objects.filter(channel=job.channel).order_by('id').values_list('kind', flat=True)),
+            ['start', 'running', 'stop'],
+        )
+
+    @mock.patch('transcoder.tasks.transcoding_start.apply_async')
+    def test_restart_broadcasts_its_reason(self, apply_async):
+        job = create_abr_channel('stalled').jobs
+        log_file = os.path.join(tempfile.mkdtemp(), 'stalled.log')
+
+        async def run():
+            supervisor = Supervisor()
+            await supervisor.start_job(job.id, FAKE_FFMPEG, log_file)
+            for _ in range(50):
+                if supervisor.process_for(job.id).running:
+                    break
+                await asyncio.sleep(0.1)
+            managed = supervisor.process_for(job.id)
+            with mock.patch('transcoder.job_state.broadcast_job_status') as broadcast:
+                await supervisor.restart(managed, 'Stalled: no new frames for 10s')
+                for _ in range(50):
+                    if supervisor.process_for(job.id) is None and apply_async.called:
+                        break
+                    await asyncio.sleep(0.1)
+            return broadcast
+
+        broadcast = async_to_sync(run)()
+        broadcast.assert_any_call(job.id, 'pending', error_message='Stalled: no new frames for 10s')
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.retry_count), ('stopped', 1))
+        self.assertIsNotNone(job.next_retry_at)
+
+    @mock.patch('transcoder.tasks.transcoding_start.apply_async')
+    def test_running_resets_the_retry_count(self, apply_async):
+        job = create_abr_channel('recovered').jobs
+        TranscodingJob.objects.filter(id=job.id).update(retry_count=3)
+        log_file = os.path.join(tempfile.mkdtemp(), 'recovered.log')
+
+        async def run():
+            supervisor = Supervisor()
+            await supervisor.start_job(job.id, FAKE_FFMPEG, log_file, retry_count=3)
+            for _ in range(50):
+                if supervisor.process_for(job.id).running:
+                    break
+                await asyncio.sleep(0.1)
+            self.assertEqual(await sync_to_async(lambda: TranscodingJob.objects.get(id=job.id).retry_count)(), 0)
+            # FFmpeg crashes after running
+            supervisor.process_for(job.id).process.kill()
+            for _ in range(50):
+                if apply_async.called:
+                    break
+                await asyncio.sleep(0.1)
+
+        async_to_sync(run)()
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.retry_count), ('stopped', 1))
+        # First backoff again, not the fourth
+        self.assertLessEqual((job.next_retry_at - timezone.now()).total_seconds(), 10)
+
+    def test_inputs_are_not_shared_by_default(self):
+        # Sharing restarts the process for every member on a join or leave, it is opt-in
+        job = create_abr_channel('unshared').jobs
+        with mock.patch('transcoder.tasks.send_command', return_value={'ok': True, 'pid': 1}) as send:
+            transcoding_start(job.id)
+            self.assertIsNone(send.call_args.kwargs['share_key'])
+            with override_settings(SHARE_INPUTS=True):
+                transcoding_start(job.id)
+            self.assertTrue(send.call_args.kwargs['share_key'].startswith('input:'))
+
+    @mock.patch('transcoder.supervisor.SHARE_JOIN_DELAY', 0.1)
+    @mock.patch('transcoder.supervisor._shared_command', new=mock.AsyncMock(return_value=FAKE_FFMPEG))
+    def test_jobs_with_same_input_share_one_process(self):
+        first, second = create_abr_channel('shared-a').jobs, create_abr_channel('shared-b').jobs
+        log_dir = tempfile.mkdtemp()
+        logs = {job.id: os.path.join(log_dir, f'{job.id}.log') for job in (first, second)}
+
+        async def wait_for(condition):
+            for _ in range(50):
+                if condition():
+                    return
+                await asyncio.sleep(0.1)
+            self.fail("condition not reached")
+
+        async def run():
+            supervisor = Supervisor()
+            await supervisor.start_job(first.id, FAKE_FFMPEG, logs[first.id], share_key='input:abc')
+            reply = await supervisor.start_job(second.id, FAKE_FFMPEG, logs[second.id], share_key='input:abc')
+            self.assertEqual(reply['shared'], 'input:abc')
+
+            # One process for both jobs once the join is rebuilt
+            await wait_for(lambda: len(supervisor.processes['input:abc'].job_ids) == 2)
+            self.assertEqual(len(supervisor.processes), 1)
+            await wait_for(lambda: supervisor.processes['input:abc'].running)
+
+            # Stopping one job keeps the other encoding
+            await supervisor.stop_job(first.id)
+            managed = supervisor.process_for(second.id)
+            self.assertEqual(managed.job_ids, [second.id])
+            self.assertIsNone(supervisor.process_for(first.id))
+            await wait_for(lambda: managed.running)
+            await supervisor.stop_job(second.id)
+
+        async_to_sync(run)()
+        first.refresh_from_db()
+        self.assertEqual(first.status, 'stopped')
+        for path in logs.values():
+            with open(path) as f:
+                self.assertIn('Sharing input with jobs', f.read())
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class PlacementTests(TestCase):
+    def test_cost_model(self):
+        self.assertEqual(job_cost('libx264', 25, ['1920x1080']), 1.0)
+        self.assertEqual(job_cost('libx265', 50, ['1920x1080']), 6.0)
+        self.assertEqual(parse_cpulist('0-3,8,10-11\n'), [0, 1, 2, 3, 8, 10, 11])
+
+    def test_plan_sizes_core_sets_by_cost_within_a_node(self):
+        nodes = [list(range(0, 8)), list(range(8, 16))]
+        placement = plan({'uhd': 6.0, 'hd': 1.0, 'sd': 0.5, 'sd2': 0.5}, nodes)
+        self.assertEqual(placement['uhd'], nodes[0])  # wants 12 cores, capped by its node
+        # The small jobs go to the node the big one left free
+        self.assertEqual(placement['hd'], [8, 9])
+        self.assertEqual(placement['sd'] + placement['sd2'], [10, 11])
+
+        # More processes than cores share the least loaded ones
+        placement = plan({i: 1.0 for i in range(6)}, [[0, 1], [2, 3]])
+        used = sorted(c for cores in placement.values() for c in cores)
+        self.assertEqual(sorted(set(used)), [0, 1, 2, 3])
+        self.assertLessEqual(max(used.count(c) for c in used), 2)
+
+    @mock.patch('transcoder.supervisor.pin', return_value=True)
+    def test_supervisor_rebalances_on_start_and_stop(self, pin):
+        first, second = create_abr_channel('placed-a').jobs, create_abr_channel('placed-b').jobs
+        log_dir = tempfile.mkdtemp()
+
+        async def run():
+            supervisor = Supervisor()
+            supervisor.placement_enabled, supervisor.nodes = True, [[0, 1, 2, 3]]
+            await supervisor.start_job(first.id, FAKE_FFMPEG, os.path.join(log_dir, 'a.log'), cost=1.0)
+            self.assertEqual(supervisor.process_for(first.id).cores, [0, 1, 2, 3])
+
+            await supervisor.start_job(second.id, FAKE_FFMPEG, os.path.join(log_dir, 'b.log'), cost=3.0)
+            self.assertEqual(len(supervisor.process_for(second.id).cores), 3)
+            self.assertEqual(len(supervisor.process_for(first.id).cores), 1)
+            reply = await supervisor.dispatch({'cmd': 'placement'})
+            self.assertEqual(sorted(p['cost'] for p in reply['processes']), [1.0, 3.0])
+
+            await supervisor.stop_job(second.id)
+            await asyncio.sleep(0.1)
+            self.assertEqual(supervisor.process_for(first.id).cores, [0, 1, 2, 3])
+            await supervisor.stop_job(first.id)
+            await asyncio.sleep(0.1)
+
+        async_to_sync(run)()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class InputProbeTests(TestCase):
+    ADDRESS = 'udp://239.1.1.1:5000?localaddr=127.0.0.1'
+
+    def test_cache_expires(self):
+        cache = InputCache(ttl=10)
+        with mock.patch('transcoder.probe.time.monotonic', return_value=100):
+            cache.set(self.ADDRESS, False, 'No packets within 2s')
+        with mock.patch('transcoder.probe.time.monotonic', return_value=105):
+            self.assertTrue(cache.is_down(self.ADDRESS))
+        with mock.patch('transcoder.probe.time.monotonic', return_value=111):
+            self.assertIsNone(cache.get(self.ADDRESS))
+            self.assertFalse(cache.is_down(self.ADDRESS))
+
+    def test_hls_manifest(self):
+        manifest = os.path.join(tempfile.mkdtemp(), 'index.m3u8')
+        with open(manifest, 'w') as f:
+            f.write('#EXTM3U\n#EXT-X-VERSION:3\n')
+        self.assertEqual(async_to_sync(probe_hls)('file://' + manifest, 1), (True, None))
+        with open(manifest, 'w') as f:
+            f.write('<html>')
+        self.assertEqual(async_to_sync(probe_hls)('file://' + manifest, 1), (False, 'Not an HLS manifest'))
+
+    def test_input_state_on_channel_api(self):
+        channel = create_abr_channel('probed')
+        save_states({self.ADDRESS: (False, 'No packets within 2s')})
+        data = APIClient().get(f'/api/channels/{channel.id}/').json()
+        self.assertEqual(data['input_state']['state'], 'down')
+        self.assertEqual(data['input_state']['error'], 'No packets within 2s')
+
+        save_states({self.ADDRESS: (True, None)})
+        self.assertEqual(APIClient().get('/api/channels/').json()[0]['input_state']['state'], 'up')
+
+    def test_start_waits_for_input(self):
+        job = create_abr_channel('waiting').jobs
+        log_file = os.path.join(tempfile.mkdtemp(), 'waiting.log')
+
+        async def run():
+            supervisor = Supervisor()
+            supervisor.inputs.set(self.ADDRESS, False, 'No packets within 2s')
+            reply = await supervisor.start_job(job.id, FAKE_FFMPEG, log_file, input_address=self.ADDRESS)
+            self.assertEqual(reply, {'ok': True, 'waiting': self.ADDRESS})
+            self.assertIsNone(supervisor.process_for(job.id))
+
+            # Still down, nothing launched
+            await supervisor.start_waiting()
+            self.assertIn(job.id, supervisor.waiting)
+
+            supervisor.inputs.set(self.ADDRESS, True)
+            await supervisor.start_waiting()
+            self.assertEqual(supervisor.waiting, {})
+            self.assertIsNotNone(supervisor.process_for(job.id))
+            await supervisor.stop_job(job.id)
+
+            # A waiting job can be stopped
+            supervisor.inputs.set(self.ADDRESS, False, 'No packets within 2s')
+            await supervisor.start_job(job.id, FAKE_FFMPEG, log_file, input_address=self.ADDRESS)
+            self.assertTrue((await supervisor.stop_job(job.id))['ok'])
+            self.assertEqual(supervisor.waiting, {})
+            await asyncio.sleep(0.1)
+
+        async_to_sync(run)()
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'stopped')
+
+
+class ChannelLogTests(TestCase):
+    def test_batches_and_rotates_without_stat(self):
+        path = os.path.join(tempfile.mkdtemp(), 'channels', 'test.log')
+        log = ChannelLog(path, max_size=1000)
+        log.write_lines([b'frame=1 fps=25', b'frame=2 fps=25'])
+        self.assertEqual(os.path.getsize(path), 0)  # still buffered
+
+        log.flush()
+        self.assertEqual(log.size, os.path.getsize(path))
+
+        for i in range(6):
+            log.write_lines([b'%d' % i * 100] * 5)
+            log.flush()
+        log.close()
+        compressor.join()
+        self.assertEqual(log.size, os.path.getsize(path))
+        self.assertLessEqual(log.size, 1000)
+
+        # Nothing is lost, older lines are in compressed segments
+        rotated = segments(path)
+        self.assertTrue(rotated and all(p.endswith('.gz') for p in rotated))
+        text = b''.join(open_segment(p).read() for p in rotated + [path])
+        self.assertIn(b'frame=1 fps=25', text)
+        self.assertEqual(text.count(b'5' * 100), 5)
+
+    def test_rotates_when_period_ends(self):
+        path = os.path.join(tempfile.mkdtemp(), 'daily.log')
+        log = ChannelLog(path, rotate_interval=60)
+        log.write('first')
+        log.flush()
+        with mock.patch('transcoder.logsink.time.time', return_value=time.time() + 60):
+            log.write('second')
+            log.flush()
+        log.close()
+        compressor.join()
+        self.assertEqual(len(segments(path)), 1)
+        with open(path) as f:
+            self.assertNotIn('first', f.read())
+
+    @override_settings(LOG_RETENTION_BYTES=200, LOG_TOTAL_BYTES=300)
+    def test_retention_budgets(self):
+        log_dir = tempfile.mkdtemp()
+        now = time.time()
+
+        def segment(name, age, size=100):
+            path = os.path.join(log_dir, name)
+            with open(path, 'wb') as f:
+                f.write(b'x' * size)
+            os.utime(path, (now - age, now - age))
+            return path
+
+        old = [segment(f'a.log.2026010{i}-000000-000000.gz', 100 - i) for i in range(3)]
+        expired = segment('b.log.20250101-000000-000000.gz', 30 * 86400)
+        other = segment('c.log.20260101-000000-000000.gz', 500)
+        enforce_retention(os.path.join(log_dir, 'a.log'), now)
+        # The channel keeps its newest 200 bytes
+        self.assertEqual([os.path.exists(p) for p in old], [False, True, True])
+        # That leaves 400 bytes overall, the oldest segment of any channel goes
+        self.assertFalse(os.path.exists(expired))
+        self.assertTrue(os.path.exists(other))
+
+
+class CountingFile:
+    """File wrapper counting the bytes read through it."""
+    read_bytes = 0
+
+    def __init__(self, f):
+        self.f = f
+
+    def read(self, *args):
+        data = self.f.read(*args)
+        CountingFile.read_bytes += len(data)
+        return data
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.f.close()
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, LOG_INDEX_SPACING=4096)
+class LogReadTests(TestCase):
+    START = 1_750_000_000
+
+    def write_log(self, path, count, max_size=None):
+        log = ChannelLog(path, max_size=max_size)
+        for i in range(count):
+            line = b'[h264 @ 0x55d0] error while decoding MB %d' % i if i % 100 == 0 else b'frame=%d fps=25 time=00:00:01.00' % i
+            log.write_lines([line], self.START + i)
+            if i % 10 == 9:
+                log.flush()
+        log.close()
+        compressor.join()
+
+    def test_tail_and_since_read_a_few_blocks(self):
+        path = os.path.join(tempfile.mkdtemp(), 'big.log')
+        self.write_log(path, 20000)
+        size = os.path.getsize(path)
+
+        CountingFile.read_bytes = 0
+        with mock.patch('transcoder.logread.open', lambda *a: CountingFile(open(*a))):
+            lines, (inode, offset) = search(path, tail=5)
+        self.assertEqual((inode, offset), (os.stat(path).st_ino, size))
+        self.assertEqual([line.split(b' - ')[1] for line in lines], [b'frame=%d fps=25 time=00:00:01.00' % i for i in range(19995, 20000)])
+        self.assertLess(CountingFile.read_bytes, 10 * 1024)
+        self.assertGreater(size, 800 * 1024)
+
+        CountingFile.read_bytes = 0
+        with mock.patch('transcoder.logread.open', lambda *a: CountingFile(open(*a))):
+            lines, _ = search(path, tail=1000, since=self.START + 19990)
+        self.assertEqual(len(lines), 10)
+        self.assertLess(CountingFile.read_bytes, 10 * 1024)
+
+        lines, _ = search(path, tail=3, level='error', q='MB 19')
+        self.assertEqual([line.split(b' - ')[1] for line in lines], [b'[h264 @ 0x55d0] error while decoding MB %d' % i for i in (19700, 19800, 19900)])
+
+    def test_tail_reaches_into_rotated_segments(self):
+        path = os.path.join(tempfile.mkdtemp(), 'rotated.log')
+        self.write_log(path, 300, max_size=4000)
+        self.assertGreater(len(segments(path)), 2)
+        lines, _ = search(path, tail=300)
+        self.assertEqual([line.split(b' - ')[1].split(b' ')[0] for line in lines][1:4], [b'frame=1', b'frame=2', b'frame=3'])
+        self.assertEqual(len(lines), 300)
+
+    def test_read_after_a_position(self):
+        path = os.path.join(tempfile.mkdtemp(), 'polled.log')
+        with open(path, 'wb') as f:
+            f.write(b'one\ntwo\n')
+        lines, position = search(path, tail=1)
+        self.assertEqual(lines, [b'two'])
+        self.assertEqual(read_after(path, position), ([], position))
+
+        # A line still being written waits for the next read
+        with open(path, 'ab') as f:
+            f.write(b'three\nfour\nfi')
+        lines, position = read_after(path, position)
+        self.assertEqual(lines, [b'three', b'four'])
+        self.assertEqual(position[1], len(b'one\ntwo\nthree\nfour\n'))
+
+        # Rotated, the new log is read from its start
+        os.rename(path, path + '.1')
+        with open(path, 'wb') as f:
+            f.write(b'six\nseven\n')
+        self.assertEqual(read_after(path, position)[0], [b'six', b'seven'])
+        self.assertEqual(read_after(path, position, max_read=5)[0], [b'six'])
+
+    def test_log_api(self):
+        channel = create_abr_channel('Logged channel')
+        log_dir = tempfile.mkdtemp()
+        with override_settings(CHANNEL_LOG_DIR=log_dir):
+            path = os.path.join(log_dir, 'Logged_channel.log')
+            self.write_log(path, 250)
+            response = APIClient().get(f'/api/channels/{channel.id}/logs/?tail=2&level=error')
+            self.assertEqual(response.json()['count'], 2)
+            self.assertTrue(response.json()['lines'][1].endswith('error while decoding MB 200'))
+            self.assertEqual(APIClient().get(f'/api/channels/{channel.id}/logs/?level=debug').status_code, 400)
+            self.assertEqual(APIClient().get(f'/api/channels/{channel.id}/logs/?after=end').status_code, 400)
+
+            # Polling returns only the lines written since the previous response
+            after = APIClient().get(f'/api/channels/{channel.id}/logs/?tail=1').json()['after']
+            response = APIClient().get(f'/api/channels/{channel.id}/logs/?after={after}')
+            self.assertEqual((response.json()['count'], response.json()['after']), (0, after))
+            with open(path, 'ab') as f:
+                f.write(b'2026-10-18 07:01:12,408 - frame=250 fps=25 time=00:00:01.00\n')
+            response = APIClient().get(f'/api/channels/{channel.id}/logs/?after={after}')
+            self.assertEqual(response.json()['lines'], ['2026-10-18 07:01:12,408 - frame=250 fps=25 time=00:00:01.00'])
+
+    def test_log_websocket_follows(self):
+        channel = create_abr_channel('Followed channel')
+        log_dir = tempfile.mkdtemp()
+        path = os.path.join(log_dir, 'Followed_channel.log')
+        self.write_log(path, 250)
+        application = URLRouter(websocket_urlpatterns)
+
+        async def run():
+            communicator = WebsocketCommunicator(application, f'/ws/channels/{channel.id}/logs/?tail=2&level=error')
+            self.assertTrue((await communicator.connect())[0])
+            tail = await communicator.receive_json_from(timeout=2)
+            with open(path, 'ab') as f:
+                f.write(b'2026-10-18 07:01:12,408 - frame=250 fps=25\n2026-10-18 07:01:12,409 - [h264 @ 0x55d0] error while decoding MB 250\n')
+            new = await communicator.receive_json_from(timeout=2)
+            await communicator.disconnect()
+
+            rejected = WebsocketCommunicator(application, f'/ws/channels/{channel.id}/logs/?level=debug')
+            self.assertEqual(await rejected.connect(), (False, 4400))
+            return tail, new
+
+        with override_settings(CHANNEL_LOG_DIR=log_dir, LOG_FOLLOW_INTERVAL=0.05):
+            tail, new = async_to_sync(run)()
+        self.assertEqual(len(tail['lines']), 2)
+        self.assertTrue(tail['lines'][1].endswith('error while decoding MB 200'))
+        self.assertEqual(new['lines'], ['2026-10-18 07:01:12,409 - [h264 @ 0x55d0] error while decoding MB 250'])
+
+
+class LogFilterTests(TestCase):
+    def test_samples_progress_and_collapses_repeats(self):
+        log_filter = LogFilter(progress_interval=10, repeat_window=30)
+        self.assertEqual(log_filter.feed([b'frame=1 fps=25 time=00:00:00.04 speed=1x'], now=0), [b'frame=1 fps=25 time=00:00:00.04 speed=1x'])
+        self.assertEqual(log_filter.feed([b'frame=2 fps=25 time=00:00:00.08 speed=1x'], now=5), [])
+        warning = [b'[mpegts @ 0x55d0] PES packet size mismatch', b'[mpegts @ 0x55e1] PES packet size mismatch']
+        self.assertEqual(log_filter.feed(warning, now=6), warning[:1])
+        self.assertEqual(log_filter.feed(warning, now=7), [])
+        # Errors and state changes are always kept
+        lines = [b'[udp @ 0x55d0] Connection refused', b'Stream mapping:']
+        self.assertEqual(log_filter.feed(lines, now=8), lines)
+        self.assertEqual(log_filter.feed([], now=40), [b'Last message repeated 3 times: [mpegts @ 0x55e1] PES packet size mismatch'])
+        self.assertEqual(log_filter.finish(), [b'frame=2 fps=25 time=00:00:00.08 speed=1x'])
+
+    def test_log_volume_on_recorded_stderr(self):
+        # 40 s of FFmpeg stderr at -stats_period 0.25 from a corrupted input
+        with open(os.path.join(os.path.dirname(__file__), 'testdata', 'ffmpeg_stderr.log'), 'rb') as f:
+            lines = [line.strip() for line in LINE_SPLIT.split(f.read()) if line.strip()]
+        log_filter, now, kept = LogFilter(progress_interval=10, repeat_window=30), 0, []
+        for line in lines:
+            if PROGRESS_LINE.match(line):
+                now += 0.25
+            kept += log_filter.feed([line], now)
+        kept += log_filter.finish()
+
+        size = lambda lines: sum(len(line) + 1 for line in lines)
+        self.assertLess(size(kept), size(lines) / 2)
+        self.assertLessEqual(sum(1 for line in kept if PROGRESS_LINE.match(line)), 6)
+        self.assertEqual(
+            [line for line in kept if ERROR_LINE.search(line) and not line.startswith(b'Last')],
+            [line for line in lines if ERROR_LINE.search(line)],
+        )
+        # The final stats line gets through
+        last_progress = [line for line in lines if PROGRESS_LINE.match(line)][-1]
+        self.assertEqual([line for line in kept if PROGRESS_LINE.match(line)][-1], last_progress)
+
+
+class ProgressParserTests(TestCase):
+    def test_parses_blocks(self):
+        parser = ProgressParser()
+        self.assertFalse(parser.feed([b'frame=250', b'fps=N/A']))
+        self.assertTrue(parser.feed([
+            b'bitrate=2048.5kbits/s', b'out_time_us=10000000', b'dup_frames=2',
+            b'drop_frames=5', b'speed=0.85x', b'progress=continue',
+        ]))
+        stats = parser.stats.as_dict()
+        self.assertEqual(stats['frame'], 250)
+        self.assertIsNone(stats['fps'])
+        self.assertEqual(stats['bitrate_kbps'], 2048.5)
+        self.assertEqual(stats['out_time'], 10.0)
+        self.assertEqual(stats['drop_frames'], 5)
+        self.assertEqual(stats['speed'], 0.85)
+        self.assertFalse(stats['ended'])
+
+    def test_padded_lines(self):
+        parser = ProgressParser()
+        self.assertTrue(parser.feed([b' frame = 10\r', b'\rprogress=end\r']))
+        self.assertEqual(parser.stats.frame, 10)
+        self.assertTrue(parser.stats.ended)
+
+
+class StallDetectorTests(TestCase):
+    def progress(self, frame, speed=1.0, drops=0, now=0):
+        stats = ProgressStats()
+        stats.update({'frame': str(frame), 'speed': f'{speed}x', 'drop_frames': str(drops), 'dup_frames': '0'})
+        stats.updated_at = now
+        return stats
+
+    def test_frames_not_advancing(self):
+        detector = StallDetector()
+        self.assertIsNone(detector.check(self.progress(100), now=0))
+        self.assertIsNone(detector.check(self.progress(100), now=5))
+        self.assertIn('Stalled', detector.check(self.progress(100), now=10))
+
+    def test_slow_encoding(self):
+        detector = StallDetector()
+        for second in range(0, 30, 2):
+            self.assertIsNone(detector.check(self.progress(second * 25, speed=0.8), now=second))
+        self.assertIn('0.8x', detector.check(self.progress(750, speed=0.8), now=30))
+
+    def test_recovered_speed_resets(self):
+        detector = StallDetector()
+        detector.check(self.progress(0, speed=0.8), now=0)
+        detector.check(self.progress(25, speed=1.0), now=20)
+        self.assertIsNone(detector.check(self.progress(50, speed=0.8), now=40))
+
+    def test_rising_drops(self):
+        detector = StallDetector()
+        self.assertIsNone(detector.check(self.progress(0, drops=0), now=0))
+        self.assertIn('dropped', detector.check(self.progress(25, drops=300), now=2))
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class JobStateTests(TestCase):
+    def test_compare_and_set(self):
+        job = create_abr_channel('state').jobs
+
+        # stopped -> running is not a valid transition
+        self.assertFalse(transition(job.id, 'running'))
+        self.assertTrue(transition(job.id, 'pending', ffmpeg_pid=1234))
+        # Started once, a second start must not admit it again
+        self.assertFalse(transition(job.id, 'pending'))
+        self.assertTrue(transition(job.id, 'running'))
+
+        # A late watchdog must not overwrite running
+        self.assertFalse(transition(job.id, 'error', ['pending'], error_message='timeout'))
+
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'running')
+        self.assertEqual(job.ffmpeg_pid, 1234)
+        self.assertIsNone(job.error_message)
+
+    def test_single_query(self):
+        job = create_abr_channel('state-query').jobs
+        with self.assertNumQueries(1):
+            transition(job.id, 'pending', ffmpeg_pid=1)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class BulkJobActionTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+        self.channels = [create_abr_channel(f'bulk-{i}') for i in range(3)]
+        Channel.objects.filter(id__in=[c.id for c in self.channels[:2]]).update(group='news')
+
+    @mock.patch('transcoder.views.start_jobs')
+    @override_settings(ENCODE_CAPACITY=100)
+    def test_start_by_group(self, start):
+        transition(self.channels[0].jobs.id, 'pending')
+        # Validation, the jobs with their ABR profiles, then in a savepoint: live nodes, the job rows locked
+        # (no nodes), the used budget and one status update per started job
+        with self.assertNumQueries(10):
+            response = self.client.post('/api/jobs/bulk/start/', {'group': 'news'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['job_ids'], [self.channels[1].jobs.id])
+        self.assertEqual(response.json()['skipped'], [self.channels[0].jobs.id])
+        start.assert_called_once_with([self.channels[1].jobs.id])
+
+    @mock.patch('transcoder.views.stop_jobs')
+    def test_unknown_ids(self, stop):
+        response = self.client.post('/api/jobs/bulk/stop/', {'job_ids': [self.channels[0].jobs.id, 9999]}, format='json')
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(response.json()['job_ids'], [9999])
+        stop.assert_not_called()
+
+    @mock.patch('transcoder.views.start_jobs')
+    @override_settings(ENCODE_CAPACITY=1.5)
+    def test_start_beyond_capacity(self, start):
+        # Two 720p30 profiles cost 1.067 1080p25 encodes, so one channel fits
+        job_ids = [c.jobs.id for c in self.channels]
+        response = self.client.post('/api/jobs/bulk/start/', {'job_ids': job_ids}, format='json')
+        self.assertEqual(response.json()['job_ids'], job_ids[:1])
+        self.assertEqual(response.json()['rejected'], job_ids[1:])
+
+        response = self.client.post('/api/jobs/bulk/start/', {'job_ids': job_ids[1:]}, format='json')
+        self.assertEqual(response.status_code, 409)
+
+        with mock.patch('transcoder.views.transcoding_start') as start_one:
+            response = self.client.post(f'/api/job/{job_ids[1]}/start/?queue=true')
+            self.assertEqual(response.status_code, 202)
+            self.assertEqual(response.json()['position'], 1)
+            response = self.client.post(f'/api/job/{job_ids[2]}/start/')
+            self.assertEqual(response.status_code, 409)
+            start_one.delay.assert_not_called()
+        sampler = MetricsSampler()
+        sampler.prime()
+        with mock.patch('transcoder.views.get_sampler', return_value=sampler):
+            self.assertEqual(self.client.get('/api/metrics/').json()['capacity']['available'], 0.433)
+
+        # The running channel stops, the queued one takes its place
+        transition(job_ids[0], 'stopped')
+        self.assertEqual(admit_queued(), [job_ids[1]])
+        self.assertEqual(TranscodingJob.objects.get(id=job_ids[1]).status, 'pending')
+        self.assertEqual(admit_queued(), [])
+
+    @override_settings(ENCODE_CAPACITY=100)
+    def test_admitted_once(self):
+        job = TranscodingJob.objects.select_related('channel').get(id=self.channels[0].jobs.id)
+        self.assertEqual(admit(job)[0], 'admitted')
+        # A second start racing the first finds the job pending and reserves nothing
+        self.assertEqual(admit(job)[0], 'rejected')
+        self.assertEqual(headroom()['used'], 1.067)
+
+    def test_requires_a_filter(self):
+        response = self.client.post('/api/jobs/bulk/start/', {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_start_is_staggered(self):
+        with mock.patch('celery.group.apply_async', autospec=True) as apply_async:
+            start_jobs([1, 2, 3], rate=2)
+        tasks = apply_async.call_args[0][0].tasks
+        self.assertEqual([t.args for t in tasks], [(1,), (2,), (3,)])
+        self.assertEqual([t.options['countdown'] for t in tasks], [0, 0.5, 1])
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class NodeSchedulingTests(TestCase):
+    def setUp(self):
+        # Each channel costs 1.067 (two 720p30 profiles)
+        self.channels = [create_abr_channel(f'node-{i}') for i in range(3)]
+        self.big = Node.objects.create(name='big', capacity=3.0, last_heartbeat=timezone.now())
+        self.small = Node.objects.create(name='small', capacity=2.0, last_heartbeat=timezone.now())
+
+    @mock.patch('transcoder.views.transcoding_start')
+    def test_start_goes_to_least_loaded_node(self, start):
+        transition(self.channels[0].jobs.id, 'running', ALL_STATUSES, node=self.big)
+        job_id = self.channels[1].jobs.id
+        response = APIClient().post(f'/api/job/{job_id}/start/')
+        self.assertEqual(response.json()['node'], 'small')  # 1.067 of 2.0 beats 2.133 of 3.0
+        start.apply_async.assert_called_once_with([job_id], queue='node.small')
+        self.assertEqual(TranscodingJob.objects.get(id=job_id).node, self.small)
+
+        nodes = {n['name']: n for n in APIClient().get('/api/nodes/').json()}
+        self.assertEqual(nodes['big']['active_jobs'], 1)
+        self.assertEqual(nodes['small']['available'], 0.933)
+
+    def test_fail_over_when_heartbeat_expires(self):
+        Node.objects.filter(id=self.small.id).update(capacity=1.5)
+        for channel in self.channels:
+            transition(channel.jobs.id, 'running', ALL_STATUSES, node=self.big, ffmpeg_pid=1234)
+        Node.objects.filter(id=self.big.id).update(last_heartbeat=timezone.now() - timedelta(minutes=5))
+
+        job_ids = [c.jobs.id for c in self.channels]
+        self.assertEqual(fail_over(), job_ids[:1])  # only one fits on the remaining node
+        self.assertEqual(fail_over(), [])
+        jobs = TranscodingJob.objects.in_bulk(job_ids)
+        self.assertEqual((jobs[job_ids[0]].status, jobs[job_ids[0]].node), ('pending', self.small))
+        self.assertEqual([jobs[j].status for j in job_ids[1:]], ['queued', 'queued'])
+        self.assertIsNone(jobs[job_ids[0]].ffmpeg_pid)
+        self.assertEqual(Node.objects.get(id=self.big.id).status, 'down')
+
+        # The node comes back and drops the jobs that moved away
+        self.assertEqual(sorted(heartbeat('big', job_ids)), job_ids)
+        self.assertEqual(Node.objects.get(id=self.big.id).status, 'up')
+
+    @override_settings(NODE_SUPERVISOR_HOST='10.0.0.2', SUPERVISOR_PORT=7801)
+    def test_supervisor_of_the_job_node_is_asked(self):
+        heartbeat('small')
+        transition(self.channels[0].jobs.id, 'running', ALL_STATUSES, node=self.small)
+        with mock.patch('transcoder.views.send_command', return_value={'ok': True, 'stats': {'frame': 1}}) as send:
+            response = APIClient().get(f'/api/jobs/{self.channels[0].jobs.id}/stats/')
+            self.assertEqual(response.json()['node'], 'small')
+            send.assert_called_once_with('stats', address=('10.0.0.2', 7801), job_id=self.channels[0].jobs.id)
+
+            APIClient().get('/api/placement/?node=small')
+            send.assert_called_with('placement', address=('10.0.0.2', 7801))
+            self.assertEqual(APIClient().get('/api/placement/?node=nowhere').status_code, 404)
+            # The local supervisor for this host's own node
+            with override_settings(NODE_NAME='small'):
+                APIClient().get('/api/placement/?node=small')
+            send.assert_called_with('placement', address=None)
+
+    def test_tasks_routed_to_node_queue(self):
+        transition(self.channels[0].jobs.id, 'pending', ALL_STATUSES, node=self.small)
+        with mock.patch('celery.group.apply_async', autospec=True) as apply_async:
+            start_jobs([self.channels[0].jobs.id, self.channels[1].jobs.id])
+        tasks = apply_async.call_args[0][0].tasks
+        self.assertEqual(tasks[0].options['queue'], 'node.small')
+        self.assertNotIn('queue', tasks[1].options)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS, RETRY_BASE_DELAY=10, RETRY_MAX_DELAY=300)
+class RetryTests(TestCase):
+    ADDRESS = 'udp://239.1.1.1:5000?localaddr=127.0.0.1'
+
+    def test_backoff_is_capped_with_jitter(self):
+        for attempt in range(1, 10):
+            delay = min(300, 10 * 2 ** (attempt - 1))
+            self.assertEqual(backoff_delay(attempt, mock.Mock(uniform=lambda a, b: a)), delay / 2)
+            self.assertEqual(backoff_delay(attempt, mock.Mock(uniform=lambda a, b: b)), delay)
+
+    def test_retry_state_is_persisted_until_exhausted(self):
+        job = create_abr_channel('retry').jobs
+        for attempt in (1, 2):
+            transition(job.id, 'running', ALL_STATUSES, ffmpeg_pid=1234)
+            outcome, delay = schedule_retry(job.id, max_retries=2)
+            self.assertEqual(outcome, 'retry')
+            job.refresh_from_db()
+            self.assertEqual((job.status, job.retry_count, job.ffmpeg_pid), ('stopped', attempt, None))
+            self.assertAlmostEqual((job.next_retry_at - timezone.now()).total_seconds(), delay, delta=1)
+
+        transition(job.id, 'running', ALL_STATUSES)
+        self.assertEqual(schedule_retry(job.id, max_retries=2), ('exhausted', None))
+        # A stopped job is not retried
+        transition(job.id, 'stopped', ALL_STATUSES)
+        self.assertEqual(schedule_retry(job.id, max_retries=5), (None, None))
+
+    def test_channels_on_one_input_share_a_circuit(self):
+        first, second = create_abr_channel('circuit-a').jobs, create_abr_channel('circuit-b').jobs
+        for job in (first, second):
+            transition(job.id, 'running', ALL_STATUSES)
+        schedule_retry(first.id, self.ADDRESS)
+        _, second_delay = schedule_retry(second.id, self.ADDRESS)
+        # One outage counts once and the second channel waits for the circuit
+        circuit = InputCircuit.objects.get(address=self.ADDRESS)
+        self.assertEqual(circuit.failures, 1)
+        self.assertGreaterEqual(second_delay, (circuit.opened_until - timezone.now()).total_seconds() - 1)
+
+        # The retry task of a channel whose input failed again waits for the circuit
+        TranscodingJob.objects.filter(id=first.id).update(next_retry_at=timezone.now())
+        with mock.patch('transcoder.tasks.send_command') as send, \
+                mock.patch.object(transcoding_start, 'apply_async') as apply_async:
+            transcoding_start(first.id, True)
+        send.assert_not_called()
+        self.assertGreater(apply_async.call_args.kwargs['countdown'], 0)
+
+        close_circuit(self.ADDRESS)
+        circuit.refresh_from_db()
+        self.assertEqual((circuit.failures, circuit.opened_until), (0, None))
+
+    @mock.patch('transcoder.views.transcoding_stop')
+    def test_stop_cancels_a_scheduled_retry(self, stop):
+        job = create_abr_channel('retry-stop').jobs
+        transition(job.id, 'running', ALL_STATUSES)
+        schedule_retry(job.id)
+        APIClient().post(f'/api/job/{job.id}/stop/')
+        with mock.patch('transcoder.tasks.send_command') as send:
+            transcoding_start(job.id, True)
+        send.assert_not_called()
+        self.assertIsNone(TranscodingJob.objects.get(id=job.id).next_retry_at)
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class JobEventTests(TestCase):
+    def add_events(self, job, count, start, kind='start'):
+        write_events([(job.id, kind, start + timedelta(seconds=i // 2), None, None) for i in range(count)])
+
+    def test_keyset_pages_cover_every_event_once(self):
+        job = create_abr_channel('events').jobs
+        # Pairs of events share a timestamp, the id breaks the tie
+        self.add_events(job, 25, timezone.now() - timedelta(hours=1))
+        client, seen = APIClient(), []
+        url = f'/api/channels/{job.channel.id}/events/?limit=10'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                data = client.get(url).json()
+            self.assertEqual(len(queries), 2)
+            seen += [event['id'] for event in data['events']]
+            url = data['next']
+        self.assertEqual(seen, list(JobEvent.objects.order_by('-timestamp', '-id').values_list('id', flat=True)))
+
+    def test_filters_and_errors(self):
+        job = create_abr_channel('events-filter').jobs
+        now = timezone.now()
+        self.add_events(job, 4, now - timedelta(days=8))
+        self.add_events(job, 3, now - timedelta(days=2), kind='exit')
+        self.add_events(job, 2, now - timedelta(hours=1), kind='stop')
+        client, url = APIClient(), f'/api/channels/{job.channel.id}/events/'
+
+        data = client.get(url, {'kind': 'exit,stop', 'since': (now - timedelta(days=7)).timestamp()}).json()
+        self.assertEqual([event['kind'] for event in data['events']], ['stop'] * 2 + ['exit'] * 3)
+        self.assertIsNone(data['next'])
+        self.assertEqual(client.get(url, {'until': (now - timedelta(days=7)).isoformat()}).json()['count'], 4)
+        self.assertEqual(client.get(url, {'kind': 'crash'}).status_code, 400)
+        self.assertEqual(client.get(url, {'cursor': 'nope'}).status_code, 400)
+        self.assertEqual(client.get('/api/channels/999999/events/').status_code, 404)
+
+    def test_rollup_keeps_daily_counts(self):
+        job = create_abr_channel('events-rollup').jobs
+        now = timezone.now()
+        old = now - timedelta(days=100)
+        self.add_events(job, 5, old)
+        self.add_events(job, 2, old, kind='exit')
+        self.add_events(job, 3, now - timedelta(days=1))
+
+        self.assertEqual(rollup_events(now, retention_days=90, batch=3), 7)
+        self.assertEqual(JobEvent.objects.count(), 3)
+        counts = dict(JobEventRollup.objects.filter(channel=job.channel).values_list('kind', 'count'))
+        self.assertEqual(counts, {'start': 5, 'exit': 2})
+        # A second run over new old events adds to the same day
+        self.add_events(job, 1, old)
+        rollup_events(now, retention_days=90)
+        self.assertEqual(JobEventRollup.objects.get(channel=job.channel, kind='start').count, 6)
+
+
+GOLDEN_COMMANDS = os.path.join(os.path.dirname(__file__), 'testdata', 'ffmpeg_commands.json')
+
+
+def make_profile(output_type, resolution='1280x720', index=0):
+    return ABRSnapshot(
+        output_type=output_type,
+        output_url=f'/var/www/hls/{resolution}/index.m3u8' if output_type == 'hls' else f'{output_type}://out/{index}',
+        output_multicast_ip=f'239.2.2.{index + 1}:5000',
+        output_network='10.0.0.1',
+        video_bitrate=2000000 + index,
+        audio_bitrate=128000,
+        buffer_size=4000000,
+        resolution=resolution,
+        service_id=index + 1,
+        video_pid=101,
+        audio_pid=102,
+        pmt_pid=4096,
+        pcr_pid=256,
+    )
+
+
+def make_snapshot(input_type='udp', profiles=(), video_codec='libx264', scan_type='progressive',
+                  logo_path=None, bitrate_mode='vbr', name='Golden'):
+    return ChannelSnapshot(
+        name=name,
+        input_type=input_type,
+        input_url='http://origin/live.m3u8',
+        input_multicast_ip='239.1.1.1:5000',
+        input_network='10.0.0.2',
+        input_file='/media/input.ts',
+        is_abr=True,
+        video_codec=video_codec,
+        audio='aac',
+        audio_gain=1.5,
+        bitrate_mode=bitrate_mode,
+        scan_type=scan_type,
+        aspect_ratio='16:9',
+        frame_rate=25,
+        logo_path=logo_path,
+        logo_position='x=W-w-10:y=10',
+        logo_opacity=0.8,
+        profiles=tuple(profiles),
+    )
+
+
+def golden_cases():
+    cases = {}
+    for input_type, output_type, codec, scan in itertools.product(
+        ['hls', 'udp', 'file'], ['udp', 'hls', 'rtmp', 'file'], ['libx264', 'libx265', 'mpeg2video'], ['progressive', 'interlaced'],
+    ):
+        cases[f'{input_type}-{output_type}-{codec}-{scan}'] = make_snapshot(
+            input_type, [make_profile(output_type)], codec, scan,
+        )
+    ladder = [make_profile('udp', r, i) for i, r in enumerate(['1920x1080', '1280x720', '1280x720', '640x360'])]
+    for scan in ['progressive', 'interlaced']:
+        cases[f'ladder-logo-{scan}'] = make_snapshot(profiles=ladder, scan_type=scan, logo_path='/media/logo.png')
+    cases['ladder-cbr'] = make_snapshot(profiles=ladder, bitrate_mode='cbr')
+    extra = (
+        OutputSnapshot('hls', '/var/www/hls/main/index.m3u8', None, None),
+        OutputSnapshot('udp', None, '239.3.3.1:5000', '10.0.0.3'),
+    )
+    cases['rtmp-extra-outputs'] = make_snapshot(profiles=[dataclasses.replace(make_profile('rtmp'), outputs=extra)])
+    encoder = EncoderSnapshot(preset='veryfast', tune='zerolatency', threads=4, lookahead_threads=2, rc_lookahead=20, slices=4)
+    for codec in ['libx264', 'libx265', 'mpeg2video']:
+        cases[f'encoder-profile-{codec}'] = dataclasses.replace(
+            make_snapshot(profiles=ladder[:2], video_codec=codec, scan_type='interlaced'), encoder=encoder,
+        )
+    return cases
+
+
+@override_settings(CHANNEL_LAYERS=IN_MEMORY_CHANNEL_LAYERS)
+class CommandBuilderTests(TestCase):
+    def test_golden_commands(self):
+        commands = {name: ' '.join(build_command(snapshot)) for name, snapshot in golden_cases().items()}
+        if os.environ.get('UPDATE_GOLDEN'):
+            with open(GOLDEN_COMMANDS, 'w') as f:
+                json.dump(commands, f, indent=2, sort_keys=True)
+                f.write('\n')
+        with open(GOLDEN_COMMANDS) as f:
+            expected = json.load(f)
+        self.assertEqual(sorted(commands), sorted(expected))
+        for name, command in commands.items():
+            self.assertEqual(command, expected[name], name)
+
+    def test_cached_until_channel_changes(self):
+        channel = create_abr_channel('cached')
+        channel = Channel.objects.get(id=channel.id)
+        first = command_for_channel(channel)
+        with self.assertNumQueries(0):
+            self.assertEqual(command_for_channel(channel), first)
+
+        channel.frame_rate = 50
+        channel.save()
+        with self.assertNumQueries(2):  # ABR profiles and their outputs
+            self.assertIn('50', command_for_channel(channel))
+
+    @override_settings(ENCODER_CORES=16)
+    def test_start_reuses_the_snapshot_and_batch_threads(self):
+        jobs = [create_abr_channel(f'batch-{i}', profiles=2).jobs for i in range(2)]
+        with mock.patch('celery.group.apply_async', autospec=True) as apply_async:
+            start_jobs([job.id for job in jobs])
+        tasks = apply_async.call_args[0][0].tasks
+        self.assertEqual([t.kwargs['threads'] for t in tasks], [4, 4])  # 16 cores over 4 new encoders
+
+        with mock.patch('transcoder.tasks.send_command', return_value={'ok': True, 'pid': 1}) as send:
+            transcoding_start(jobs[0].id, threads=4)
+            # Only the job is read once the snapshot is cached, no ABR or running count query
+            with self.assertNumQueries(1):
+                transcoding_start(jobs[0].id, threads=4)
+        self.assertIn('-threads:v 4', ' '.join(send.call_args.kwargs['command']))
+        self.assertEqual(send.call_args.kwargs['cost'], 1.067)
+
+    @override_settings(ENCODER_CORES=16)
+    def test_encoder_profile_and_default_threads(self):
+        busy = create_abr_channel('busy', profiles=2)
+        busy.jobs.status = 'running'
+        busy.jobs.save()
+        self.assertEqual(default_encoder_threads(2), 4)  # 16 cores over 2 running and 2 new encoders
+        self.assertEqual(default_encoder_threads(2, [busy.id]), 8)
+
+        channel = create_abr_channel('tuned', profiles=1)
+        channel = Channel.objects.get(id=channel.id)
+        command = ' '.join(command_for_channel(channel, threads=8))
+        self.assertIn('-preset fast -threads:v 8 ', command)
+
+        EncoderProfile.objects.create(channel=channel, preset='slow', threads=2, rc_lookahead=10)
+        channel = Channel.objects.select_related('encoder_profile').get(id=channel.id)
+        command = ' '.join(command_for_channel(channel, threads=8))
+        self.assertIn('-preset slow -threads:v 2 ', command)  # set threads win over the default
+        self.assertIn('-x264-params rc-lookahead=10 ', command)
+
+
+    def test_encoder_profile_via_api(self):
+        payload = {
+            'name': 'tuned', 'input_type': 'udp', 'input_multicast_ip': '239.1.1.1:5000', 'input_network': '127.0.0.1',
+            'is_abr': True, 'resolution': None, 'service_id': None, 'video_pid': None, 'audio_pid': None,
+            'pmt_pid': None, 'pcr_pid': None, 'encoder_profile': {'preset': 'veryfast', 'tune': 'film'},
+            'abr_profiles': [{
+                'output_type': 'udp', 'output_multicast_ip': '239.2.2.1:5000', 'output_network': '127.0.0.1',
+                'video_bitrate': 2000000, 'audio_bitrate': 128000, 'buffer_size': 4000000, 'resolution': '1280x720',
+                'service_id': 1, 'video_pid': 101, 'audio_pid': 102, 'pmt_pid': 4096, 'pcr_pid': 256, 'muxrate': 5000000,
+            }],
+        }
+        response = APIClient().post('/api/channels/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['encoder_profile']['tune'], 'film')
+        channel = Channel.objects.get(name='tuned')
+        self.assertIn('-preset veryfast -tune film', ' '.join(command_for_channel(channel)))
+
+        payload['encoder_profile'] = None
+        response = APIClient().put(f'/api/channels/{channel.id}/', payload, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertIsNone(response.json()['encoder_profile'])
+        self.assertFalse(EncoderProfile.objects.filter(channel=channel).exists())
+
+        payload['encoder_profile'] = {'threads': 0}
+        response = APIClient().put(f'/api/channels/{channel.id}/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_ladder_scales_once_per_resolution_and_shares_audio(self):
+        ladder = [make_profile('udp', r, i) for i, r in enumerate(['1920x1080', '1280x720', '1280x720', '640x360'])]
+        command = build_command(make_snapshot(profiles=ladder))
+        graph = command[command.index('-filter_complex') + 1]
+        self.assertEqual(graph.count('scale='), 3)
+        self.assertEqual(graph.count('volume='), 1)
+        # UDP renditions keep their own service name, only the two 720p ones share a tee output
+        self.assertEqual(command.count('-b:a:0'), 3)
+        self.assertEqual(command[command.index('tee') - 1], '-f')
+        for height in ['1080', '720', '360']:
+            self.assertIn(f'service_name=Golden@{height}', command)
+
+        # Outputs without service metadata share one audio encode for the whole ladder
+        hls = [make_profile('hls', r, i) for i, r in enumerate(['1920x1080', '1280x720', '640x360'])]
+        command = build_command(make_snapshot(profiles=hls))
+        self.assertEqual(command.count('-b:a:0'), 1)
+        self.assertNotIn('-metadata', command)
+
+        # Different audio settings get their own output and encode
+        hls[2] = dataclasses.replace(hls[2], audio_bitrate=64000)
+        command = build_command(make_snapshot(profiles=hls))
+        graph = command[command.index('-filter_complex') + 1]
+        self.assertIn('volume=1.5,asplit=2[aout0][aout1]', graph)
+        self.assertEqual(command.count('-b:a:0'), 2)
+
+    def test_extra_outputs_via_api(self):
+        payload = {
+            'name': 'dual', 'input_type': 'udp', 'input_multicast_ip': '239.1.1.1:5000', 'input_network': '127.0.0.1',
+            'is_abr': True, 'resolution': None, 'service_id': None, 'video_pid': None, 'audio_pid': None,
+            'pmt_pid': None, 'pcr_pid': None,
+            'abr_profiles': [{
+                'output_type': 'udp', 'output_multicast_ip': '239.2.2.1:5000', 'output_network': '127.0.0.1',
+                'video_bitrate': 2000000, 'audio_bitrate': 128000, 'buffer_size': 4000000, 'resolution': '1280x720',
+                'service_id': 1, 'video_pid': 101, 'audio_pid': 102, 'pmt_pid': 4096, 'pcr_pid': 256, 'muxrate': 5000000,
+                'outputs': [{'output_type': 'hls', 'output_url': '/var/www/hls/dual/index.m3u8'}],
+            }],
+        }
+        response = APIClient().post('/api/channels/', payload, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        self.assertEqual(response.json()['abr_profiles'][0]['outputs'][0]['output_type'], 'hls')
+
+        command = ' '.join(command_for_channel(Channel.objects.get(name='dual')))
+        self.assertIn('-f tee ', command)
+        self.assertIn('onfail=ignore:hls_time=10', command)
+        self.assertEqual(command.count('-c:v'), 1)  # one encode for both destinations
+
+        payload['name'] = 'dual-invalid'
+        payload['abr_profiles'][0]['outputs'] = [{'output_type': 'udp', 'output_url': 'udp://x'}]
+        response = APIClient().post('/api/channels/', payload, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_shared_command_decodes_input_once(self):
+        plain = make_snapshot(profiles=[make_profile('udp', '1280x720', 0)], name='Plain')
+        logo = make_snapshot(profiles=[make_profile('udp', '640x360', 1)], logo_path='/media/logo.png', name='Logo')
+        command = build_shared_command([plain, logo])
+
+        self.assertEqual(command.count('-i'), 2)  # shared input and the logo
+        self.assertEqual(command[command.index('-i') + 1], 'udp://239.1.1.1:5000?localaddr=10.0.0.2')
+        graph = command[command.index('-filter_complex') + 1]
+        self.assertTrue(graph.startswith('[0:v]split=2[c0_in_v][c1_in_v];[0:a]asplit=2[c0_in_a][c1_in_a]'))
+        self.assertIn('[1:v]format=rgba', graph)
+        self.assertEqual(command.count('-map'), 4)
+        self.assertIn('[c1_vout0]', command)
+        self.assertEqual(build_shared_command([plain]), build_command(plain))
+
+        with self.assertRaises(ValueError):
+            build_shared_command([plain, make_snapshot(input_type='hls', profiles=plain.profiles)])
@@ -1,14 +1,21 @@
 from django.urls import path
-from .views import TranscodingJobListView,TranscodingJobDetailView,ChannelListCreateView,ChannelDetailView,StartTranscodingJob,StopTranscodingJob,NetworkInterfaceView,SystemMetricsView
+from .views import TranscodingJobListView,TranscodingJobDetailView,TranscodingJobStatsView,ChannelListCreateView,ChannelDetailView,StartTranscodingJob,StopTranscodingJob,BulkStartTranscodingJobs,BulkStopTranscodingJobs,NetworkInterfaceView,SystemMetricsView,PlacementView,NodeListView,ChannelLogView,ChannelEventView
 
 urlpatterns=[
     path('jobs/', TranscodingJobListView.as_view(), name='tarnscodingjob_list'),
     path('jobs/<int:pk>/',TranscodingJobDetailView.as_view()  ,name='tarnscodingjob_detail'),
+    path('jobs/bulk/start/', BulkStartTranscodingJobs.as_view(), name='bulk-start-jobs'),
+    path('jobs/bulk/stop/', BulkStopTranscodingJobs.as_view(), name='bulk-stop-jobs'),
+    path('jobs/<int:pk>/stats/', TranscodingJobStatsView.as_view(), name='transcodingjob-stats'),
     path('job/<int:pk>/start/', StartTranscodingJob.as_view(), name='start-job'),
     path('job/<int:pk>/stop/', StopTranscodingJob.as_view(), name='stop-job'),
     path('channels/',ChannelListCreateView.as_view(), name='Channel'),
     path('channels/<int:pk>/',ChannelDetailView.as_view(), name='ChannelDetails'),
+    path('channels/<int:pk>/logs/', ChannelLogView.as_view(), name='channel-logs'),
+    path('channels/<int:pk>/events/', ChannelEventView.as_view(), name='channel-events'),
     path('netiface/', NetworkInterfaceView.as_view(), name='network-interfaces'),
     path('metrics/', SystemMetricsView.as_view(), name='system-metrics'),
+    path('placement/', PlacementView.as_view(), name='cpu-placement'),
+    path('nodes/', NodeListView.as_view(), name='node-list'),
 ]
 
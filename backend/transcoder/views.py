@@ -1,18 +1,56 @@
-import psutil, time
+import base64, os, psutil
+from datetime import datetime, timezone as dt_timezone
 from rest_framework import generics, status
 from rest_framework.views import APIView
 from rest_framework.permissions import IsAuthenticatedOrReadOnly
 from rest_framework.response import Response
-from .models import TranscodingJob, Channel
-from .serializers import TranscodingJobSerializer, ChannelSerializer
-from .tasks import transcoding_start,transcoding_stop
+from .models import TranscodingJob, Channel, Node, JobEvent
+from django.db.models import Count, Max, Q, Sum
+from .serializers import TranscodingJobSerializer, ChannelSerializer, BulkJobActionSerializer, JobEventSerializer
+from .tasks import transcoding_start,transcoding_stop,start_jobs,stop_jobs
+from .metrics import get_sampler
+from .supervisor import send_command, SupervisorError
+from .admission import admit, admit_many, node_headroom, queue_position, ACTIVE_STATUSES
+from .nodes import node_supervisor, queue_options
+from .retry import cancel_retries
+from .logsink import channel_log_path
+from .logread import LEVELS, MAX_TAIL, read_after, search
+from .listing import CachedListMixin
+from .probe import input_states_version
+from django.conf import settings
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.utils.urls import replace_query_param
 
-# List all transcoding jobs
-class TranscodingJobListView(generics.ListCreateAPIView):
+
+def wants_queue(value):
+    # Explicit ?queue=true/false or body flag, else the ADMISSION_QUEUE default
+    if value is None:
+        return getattr(settings, 'ADMISSION_QUEUE', False)
+    return str(value).lower() in ('1', 'true', 'yes')
+
+
+def parse_time(value):
+    """Aware datetime from a unix time or an ISO 8601 date, ValueError if it is neither."""
+    try:
+        return datetime.fromtimestamp(float(value), dt_timezone.utc)
+    except (ValueError, OverflowError, OSError):
+        pass
+    parsed = parse_datetime(value)
+    if parsed is None:
+        raise ValueError(value)
+    return timezone.make_aware(parsed) if timezone.is_naive(parsed) else parsed
+
+# List all transcoding jobs, with ?fields=, ?page_size= and ETags (see listing.py)
+class TranscodingJobListView(CachedListMixin, generics.ListCreateAPIView):
     #permission_classes = [IsAuthenticatedOrReadOnly]
     queryset = TranscodingJob.objects.all()  # Query all transcoding jobs
     serializer_class = TranscodingJobSerializer  # Use the serializer for response
 
+    def etag_parts(self, fields):
+        # Every job write bumps its version
+        return [TranscodingJob.objects.aggregate(Count('id'), Max('id'), Sum('version'))]
+
     def get(self, request, *args, **kwargs):
         # Handle GET requests to list all jobs
         return self.list(request, *args, **kwargs)
@@ -26,15 +64,61 @@ class TranscodingJobDetailView(generics.RetrieveAPIView):
     queryset = TranscodingJob.objects.all()
     serializer_class = TranscodingJobSerializer
 
-#List all Channels or create a new one
-class ChannelListCreateView(generics.ListCreateAPIView):
+#Live FFmpeg progress for a running job, kept in memory by the supervisor
+class TranscodingJobStatsView(APIView):
+    def get(self, request, pk):
+        try:
+            job = TranscodingJob.objects.select_related('node').get(pk=pk)
+        except TranscodingJob.DoesNotExist:
+            return Response({'error': 'Transcoding job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        # Asked of the supervisor of the node running the job
+        try:
+            reply = send_command('stats', address=node_supervisor(job.node), job_id=job.id)
+        except SupervisorError as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
+
+        return Response({
+            'job_id': job.id,
+            'status': job.status,
+            'node': job.node.name if job.node else None,
+            'stats': reply.get('stats'),
+        })
+
+#List all Channels or create a new one, with ?fields=, ?page_size= and ETags (see listing.py)
+class ChannelListCreateView(CachedListMixin, generics.ListCreateAPIView):
     #permission_classes = [IsAuthenticatedOrReadOnly]
     queryset = Channel.objects.all()
     serializer_class = ChannelSerializer
+    job_fields = {'status', 'job_id', 'error_message'}
+
+    def get_queryset(self):
+        # Job and ABR profiles are loaded up front so the serializer never queries per channel,
+        # and not at all when ?fields= leaves them out
+        fields = set(self.requested_fields() or self.serializer_class().fields)
+        queryset = super().get_queryset()
+        if fields & self.job_fields:
+            queryset = queryset.select_related('jobs')
+        if 'encoder_profile' in fields:
+            queryset = queryset.select_related('encoder_profile')
+        if 'abr_profiles' in fields:
+            queryset = queryset.prefetch_related('abr__outputs')
+        return queryset
+
+    def etag_parts(self, fields):
+        # ABR and encoder profile changes touch the channel's updated_at
+        fields = set(fields or self.serializer_class().fields)
+        aggregates = {'count': Count('id'), 'last_id': Max('id'), 'updated': Max('updated_at')}
+        if fields & self.job_fields:
+            aggregates['jobs'] = Sum('jobs__version')
+        parts = [Channel.objects.aggregate(**aggregates)]
+        if 'input_state' in fields:
+            parts.append(input_states_version())
+        return parts
 
 # List Channel based on channel id
 class ChannelDetailView(generics.RetrieveUpdateDestroyAPIView):
-    queryset = Channel.objects.all()
+    queryset = Channel.objects.select_related('jobs', 'encoder_profile').prefetch_related('abr__outputs')
     serializer_class = ChannelSerializer
 
 # Start Channel vai API Endpoint
@@ -43,24 +127,109 @@ class StartTranscodingJob(APIView):
         #Start the Transcoding job by id
         try:
             #Retrieve Job by ID
-            job = TranscodingJob.objects.get(pk=pk)
-
-            #call the transcoding start function
-            transcoding_start.delay(pk)
-            return Response({'message': f'Job {pk} started'}, status=status.HTTP_200_OK)
-        
+            job = TranscodingJob.objects.select_related('channel', 'node').get(pk=pk)
         except TranscodingJob.DoesNotExist:
             return Response({'error': 'Transcoding job not found'}, status=status.HTTP_404_NOT_FOUND)
-        
+
+        if job.status == 'queued':
+            return Response({'message': f'Job {pk} already queued', 'position': queue_position(job)}, status=status.HTTP_202_ACCEPTED)
+
+        # Already active jobs go straight to the supervisor, which refuses duplicates
+        if job.status not in ACTIVE_STATUSES:
+            decision, cost, room = admit(job, wants_queue(request.query_params.get('queue')))
+            if decision == 'rejected':
+                return Response({
+                    'error': 'Not enough encoding capacity to start this channel',
+                    'cost': cost,
+                    'headroom': room,
+                }, status=status.HTTP_409_CONFLICT)
+            if decision == 'queued':
+                job.refresh_from_db()
+                return Response({
+                    'message': f'Job {pk} queued until capacity frees up',
+                    'cost': cost,
+                    'position': queue_position(job),
+                }, status=status.HTTP_202_ACCEPTED)
+
+        #call the transcoding start function on the job's node
+        node = job.node.name if job.node else None
+        transcoding_start.apply_async([pk], **queue_options(node))
+        return Response({'message': f'Job {pk} started', 'node': node}, status=status.HTTP_200_OK)
+
 class StopTranscodingJob(APIView):
     def post(self,request,pk):
         try:
-            job = TranscodingJob.objects.get(pk=pk)
-            transcoding_stop.delay(pk)
+            job = TranscodingJob.objects.select_related('node').get(pk=pk)
+            cancel_retries([pk])
+            transcoding_stop.apply_async([pk], **queue_options(job.node.name if job.node else None))
             return Response({'message': f'Job {pk} Stopped'}, status=status.HTTP_200_OK)
         except TranscodingJob.DoesNotExist:
             return Response({'error': 'Transcoding job not found'}, status=status.HTTP_404_NOT_FOUND)
         
+# Start/Stop many jobs in one request, selected by job ids, channel ids or channel group
+def bulk_job_action(request, skip_statuses, dispatch_jobs):
+    """
+    Select jobs by id, channel and/or group and pass the ones not in
+    `skip_statuses` to dispatch_jobs(job_ids, data), which returns the
+    response fields, job_ids being the jobs acted on.
+    """
+    serializer = BulkJobActionSerializer(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    data = serializer.validated_data
+
+    # Validate everything in one query
+    query = Q()
+    if data.get('job_ids'):
+        query |= Q(id__in=data['job_ids'])
+    if data.get('channel_ids'):
+        query |= Q(channel_id__in=data['channel_ids'])
+    if data.get('group'):
+        query |= Q(channel__group=data['group'])
+    jobs = list(TranscodingJob.objects.filter(query).values_list('id', 'channel_id', 'status'))
+
+    missing_jobs = set(data.get('job_ids', [])) - {job_id for job_id, _, _ in jobs}
+    missing_channels = set(data.get('channel_ids', [])) - {channel_id for _, channel_id, _ in jobs}
+    if missing_jobs or missing_channels or not jobs:
+        return Response({
+            'error': 'Transcoding jobs not found',
+            'job_ids': sorted(missing_jobs),
+            'channel_ids': sorted(missing_channels),
+        }, status=status.HTTP_404_NOT_FOUND)
+
+    job_ids = sorted(job_id for job_id, _, job_status in jobs if job_status not in skip_statuses)
+    skipped = sorted(job_id for job_id, _, job_status in jobs if job_status in skip_statuses)
+    result = {'job_ids': job_ids}
+    if job_ids:
+        result = dispatch_jobs(job_ids, data)
+    if job_ids and not result['job_ids'] and not result.get('queued'):
+        return Response({'error': 'Not enough encoding capacity to start these channels', **result, 'skipped': skipped},
+                        status=status.HTTP_409_CONFLICT)
+    return Response({**result, 'skipped': skipped}, status=status.HTTP_200_OK)
+
+class BulkStartTranscodingJobs(APIView):
+    def post(self, request):
+        return bulk_job_action(request, ('queued', 'pending', 'running'), self.start)
+
+    def start(self, job_ids, data):
+        # Admitted in id order until the budget is used up, the rest queued or rejected
+        jobs = TranscodingJob.objects.filter(id__in=job_ids).select_related('channel').prefetch_related('channel__abr')
+        decisions = admit_many(sorted(jobs, key=lambda j: j.id), wants_queue(data.get('queue')))
+        if decisions['admitted']:
+            start_jobs(decisions['admitted'])
+        return {'job_ids': decisions['admitted'], 'queued': decisions['queued'], 'rejected': decisions['rejected']}
+
+class BulkStopTranscodingJobs(APIView):
+    def post(self, request):
+        # Stopped jobs waiting for a retry are skipped, but stay stopped
+        response = bulk_job_action(request, ('stopped',), self.stop)
+        if response.status_code == status.HTTP_200_OK:
+            cancel_retries(response.data['skipped'])
+        return response
+
+    def stop(self, job_ids, data):
+        stop_jobs(job_ids)
+        return {'job_ids': job_ids}
+
 
 class NetworkInterfaceView(APIView):
     def get(self, request):
@@ -81,31 +250,166 @@ class NetworkInterfaceView(APIView):
 
         return Response(data)
 
-class SystemMetricsView(APIView):
+#Cores each FFmpeg process is pinned to, kept by the supervisor
+class PlacementView(APIView):
     def get(self, request):
-        #CPU Usage
-        cpu_usage = psutil.cpu_percent(interval=0.5)
+        # ?node=<name> for the placement of another node, this host's supervisor by default
+        node = None
+        if request.query_params.get('node'):
+            node = Node.objects.filter(name=request.query_params['node']).first()
+            if node is None:
+                return Response({'error': 'Node not found'}, status=status.HTTP_404_NOT_FOUND)
+        try:
+            reply = send_command('placement', address=node_supervisor(node))
+        except SupervisorError as e:
+            return Response({'error': str(e)}, status=status.HTTP_503_SERVICE_UNAVAILABLE)
 
-        #RAM Usage
-        mem = psutil.virtual_memory()
-        ram_usage = mem.percent
+        return Response({
+            'node': node.name if node else getattr(settings, 'NODE_NAME', None),
+            'enabled': reply.get('enabled'),
+            'nodes': reply.get('nodes'),
+            'processes': reply.get('processes'),
+        })
 
-        #Network Bandwidth
-        net1 = psutil.net_io_counters()
-        time.sleep(1)
-        net2 = psutil.net_io_counters()
+#Registered transcoder nodes with their encode budget
+class NodeListView(APIView):
+    def get(self, request):
+        live = node_headroom()
+        nodes = Node.objects.annotate(
+            active_jobs=Count('transcoding_jobs', filter=Q(transcoding_jobs__status__in=ACTIVE_STATUSES))
+        ).order_by('name')
+        return Response([{
+            'name': node.name,
+            'status': node.status if node in live else 'down',
+            'last_heartbeat': node.last_heartbeat,
+            'cores': node.cores,
+            'queue': node.queue,
+            'active_jobs': node.active_jobs,
+            **live.get(node, {'capacity': node.capacity, 'used': None, 'available': None}),
+        } for node in nodes])
 
-        in_bytes = net2.bytes_recv - net1.bytes_recv
-        out_bytes = net2.bytes_sent - net1.bytes_sent
+# Tail and search a channel's FFmpeg log. Followed over ws/channels/<id>/logs/ (see consumers.py),
+# or by polling with ?after=, which returns the lines written since the last response
+class ChannelLogView(APIView):
+    max_tail = MAX_TAIL
+
+    def get(self, request, pk):
+        try:
+            channel = Channel.objects.only('name').get(pk=pk)
+        except Channel.DoesNotExist:
+            return Response({'error': 'Channel not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        params = request.query_params
+        try:
+            tail = min(max(int(params.get('tail', 100)), 1), self.max_tail)
+        except ValueError:
+            return Response({'error': 'tail must be a number of lines'}, status=status.HTTP_400_BAD_REQUEST)
+        since = params.get('since')
+        if since:
+            try:
+                since = parse_time(since).timestamp()
+            except ValueError:
+                return Response({'error': 'since must be a unix time or an ISO 8601 date'}, status=status.HTTP_400_BAD_REQUEST)
+        level = params.get('level')
+        if level and level not in LEVELS:
+            return Response({'error': f"level must be one of {', '.join(LEVELS)}"}, status=status.HTTP_400_BAD_REQUEST)
+        q = params.get('q')
+        after = params.get('after')
+        if after:
+            try:
+                inode, offset = (int(part) for part in after.split(':'))
+            except ValueError:
+                return Response({'error': 'after must be the value of a previous response'}, status=status.HTTP_400_BAD_REQUEST)
+
+        path = channel_log_path(channel.name)
+        if after:
+            # Only what was written since the previous response, no waiting for more
+            lines, position = read_after(path, (inode, offset), level, q)
+        else:
+            lines, position = search(path, tail, since or None, level, q)
+
+        return Response({
+            'channel_id': channel.id,
+            'log_file': os.path.basename(path),
+            'count': len(lines),
+            'lines': [line.decode('utf-8', 'replace') for line in lines],
+            'after': '%d:%d' % position,
+        })
+
+# Job history of a channel, newest first, paged by (timestamp, id) so deep pages cost the same as the first
+class ChannelEventView(APIView):
+    default_limit = 100
+    max_limit = 1000
+
+    @staticmethod
+    def encode_cursor(event):
+        return base64.urlsafe_b64encode(f"{event.timestamp.isoformat()}|{event.id}".encode()).decode()
+
+    @staticmethod
+    def decode_cursor(cursor):
+        timestamp, _, event_id = base64.urlsafe_b64decode(cursor.encode()).decode().partition('|')
+        return parse_time(timestamp), int(event_id)
+
+    def get(self, request, pk):
+        if not Channel.objects.filter(pk=pk).exists():
+            return Response({'error': 'Channel not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        params = request.query_params
+        try:
+            limit = min(max(int(params.get('limit', self.default_limit)), 1), self.max_limit)
+        except ValueError:
+            return Response({'error': 'limit must be a number of events'}, status=status.HTTP_400_BAD_REQUEST)
+
+        events = JobEvent.objects.filter(channel_id=pk)
+        kinds = [kind for kind in params.get('kind', '').split(',') if kind]
+        valid_kinds = [kind for kind, _ in JobEvent.KIND_CHOICES]
+        if any(kind not in valid_kinds for kind in kinds):
+            return Response({'error': f"kind must be one of {', '.join(valid_kinds)}"}, status=status.HTTP_400_BAD_REQUEST)
+        if kinds:
+            events = events.filter(kind__in=kinds)
+        for name, lookup in (('since', 'timestamp__gte'), ('until', 'timestamp__lt')):
+            if params.get(name):
+                try:
+                    events = events.filter(**{lookup: parse_time(params[name])})
+                except ValueError:
+                    return Response({'error': f"{name} must be a unix time or an ISO 8601 date"}, status=status.HTTP_400_BAD_REQUEST)
+        if params.get('cursor'):
+            try:
+                timestamp, event_id = self.decode_cursor(params['cursor'])
+            except ValueError:
+                return Response({'error': 'Invalid cursor'}, status=status.HTTP_400_BAD_REQUEST)
+            # Seek past the last event of the previous page on the (channel, timestamp, id) index
+            events = events.filter(Q(timestamp__lt=timestamp) | Q(timestamp=timestamp, id__lt=event_id))
+
+        # One extra row tells whether there is a next page
+        page = list(events.order_by('-timestamp', '-id')[:limit + 1])
+        next_url = None
+        if len(page) > limit:
+            page = page[:limit]
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', self.encode_cursor(page[-1]))
 
-        in_mbps = (in_bytes*8)/(1027*1024)
-        out_mbps = (out_bytes*8)/(1024*1024)
-        
         return Response({
-            "cpu_usage": cpu_usage,
-            "ram_usage": ram_usage,
-            "network":{
-                "in_mbps": in_mbps,
-                "out_mbps":out_mbps
-            }
+            'channel_id': pk,
+            'count': len(page),
+            'next': next_url,
+            'events': JobEventSerializer(page, many=True).data,
         })
+
+class SystemMetricsView(APIView):
+    def get(self, request):
+        # Samples are collected in the background, this only reads memory
+        sampler = get_sampler()
+        data = dict(sampler.latest())
+
+        # Optional history window in seconds, e.g. ?history=60
+        history = request.query_params.get('history')
+        if history:
+            try:
+                seconds = max(float(history), 0)
+            except ValueError:
+                return Response({'error': 'history must be a number of seconds'}, status=status.HTTP_400_BAD_REQUEST)
+            data['history'] = sampler.history(seconds)
+
+        # Encode budget left for new channels (see admission.py), refreshed by the sampler
+        data['capacity'] = sampler.capacity()
+        return Response(data)
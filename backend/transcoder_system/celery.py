@@ -28,11 +28,13 @@ app.autodiscover_tasks()
 def restart_jobs(sender, **kwargs):
     from transcoder.models import TranscodingJob
     from transcoder.tasks import transcoding_start
+    from transcoder.nodes import local_jobs, local_node_name, queue_options
 
-    running_jobs = TranscodingJob.objects.filter(status='running')
+    # Only this host's jobs, other nodes restart their own
+    running_jobs = local_jobs(TranscodingJob.objects.filter(status='running'))
     for job in running_jobs:
         print(f"[Celery] Auto-restarting job: {job.channel.name}")
-        transcoding_start.delay(job.id)
+        transcoding_start.apply_async([job.id], **queue_options(local_node_name()))
 
 # task for debugging (this is just for testing).
 @app.task(bind=True)
@@ -77,6 +77,17 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'transcoder_system.wsgi.application'
+ASGI_APPLICATION = 'transcoder_system.asgi.application'
+
+# Channel layer used to push job status and metrics over websockets
+CHANNEL_LAYERS = {
+    'default': {
+        'BACKEND': 'channels_redis.core.RedisChannelLayer',
+        'CONFIG': {
+            'hosts': [os.environ.get('CHANNEL_LAYER_REDIS_URL', 'redis://localhost:6379/1')],
+        },
+    },
+}
 
 REST_FRAMEWORK = {
     "EXCEPTION_HANDLER": "transcoder_system.exceptions.custom_exception_handler"
@@ -86,13 +97,35 @@ REST_FRAMEWORK = {
 # Database
 # https://docs.djangoproject.com/en/4.2/ref/settings/#databases
 
-DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / "db.sqlite3",
+# PostgreSQL is used when DB_ENGINE=postgres, SQLite otherwise (local development)
+if os.environ.get('DB_ENGINE', 'sqlite') == 'postgres':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': os.environ.get('POSTGRES_DB', 'transcoder'),
+            'USER': os.environ.get('POSTGRES_USER', 'transcoder'),
+            'PASSWORD': os.environ.get('POSTGRES_PASSWORD', ''),
+            'HOST': os.environ.get('POSTGRES_HOST', 'localhost'),
+            'PORT': os.environ.get('POSTGRES_PORT', '5432'),
+            # Keep connections open between requests/tasks instead of reconnecting each time
+            'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 600)),
+            'CONN_HEALTH_CHECKS': True,
+            'OPTIONS': {
+                'connect_timeout': 5,
+            },
+        }
+    }
+else:
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / "db.sqlite3",
+            'OPTIONS': {
+                # Wait for the write lock instead of failing straight away
+                'timeout': 20,
+            },
+        }
     }
-}
-
 
 
 # Password validation
@@ -146,19 +179,103 @@ MEDIA_ROOT = os.path.join(BASE_DIR, 'media')  # Stores uploaded media files
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
 #CELERY_BROKER_URL = 'redis://172.26.8.213:6379/0'
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
+# Several transcoder nodes share one broker, see NODE_NAME
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
 
 # Celery Settings
 CELERY_ACCEPT_CONTENT = ['json'] # Only accept JSON messages.
 CELERY_TASK_SERIALIZER = 'json' # Serializes tasks using JSON.
 #CELERY_RESULT_BACKEND = 'redis://172.26.8.213:6379/0' # Stores task results in Redis.
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0' # Stores task results in Redis.
+CELERY_RESULT_BACKEND = os.environ.get('CELERY_RESULT_BACKEND', CELERY_BROKER_URL) # Stores task results in Redis.
 
 
 
 # Celery will retry connecting to Redis automatically on startup.
 CELERY_BROKER_CONNECTION_RETRY_ON_STARTUP = True
 
+# Periodic tasks, run by `celery -A transcoder_system beat`
+CELERY_BEAT_SCHEDULE = {
+    'rollup-job-events': {
+        'task': 'transcoder.tasks.rollup_job_events',
+        'schedule': 24 * 3600,
+    },
+}
+
 
 CORS_ALLOW_ALL_ORIGINS = True
 
+# FFmpeg supervisor control socket (python manage.py run_supervisor)
+SUPERVISOR_HOST = os.environ.get('SUPERVISOR_HOST', '127.0.0.1')
+SUPERVISOR_PORT = int(os.environ.get('SUPERVISOR_PORT', 7800))
+
+# Opt-in: ABR channels with the same input share one FFmpeg (one demux and decode). The shared process is
+# restarted whenever a channel joins or leaves, interrupting the output of every channel on that input, and
+# a failure in one channel (bad logo, dead output, stall) restarts all of them
+SHARE_INPUTS = os.environ.get('SHARE_INPUTS', 'false').lower() == 'true'
+
+# Cores the encoders may use, all of the host when unset
+ENCODER_CORES = int(os.environ['ENCODER_CORES']) if os.environ.get('ENCODER_CORES') else None
+
+# Pin each FFmpeg to a core set sized by its encoding cost, within one NUMA node
+CPU_PLACEMENT = os.environ.get('CPU_PLACEMENT', 'true').lower() == 'true'
+
+# Admission control: starts beyond the encode budget are rejected (409), or queued with ADMISSION_QUEUE
+# or ?queue=true. The budget is ENCODE_CAPACITY (1.0 = one 1080p25 x264 encode), else the cores divided
+# by the cores per unit measured by `manage.py benchmark_ladder --calibrate` into CAPACITY_FILE
+ADMISSION_CONTROL = os.environ.get('ADMISSION_CONTROL', 'true').lower() == 'true'
+ADMISSION_QUEUE = os.environ.get('ADMISSION_QUEUE', 'false').lower() == 'true'
+ENCODE_CAPACITY = float(os.environ['ENCODE_CAPACITY']) if os.environ.get('ENCODE_CAPACITY') else None
+CAPACITY_FILE = os.environ.get('CAPACITY_FILE', os.path.join(BASE_DIR, 'capacity.json'))
+
+# Multi-node: name of this transcoder host. Its supervisor registers it and its Celery worker must consume
+# the queue node.<NODE_NAME>. Unset for a single host
+NODE_NAME = os.environ.get('NODE_NAME') or None
+# Address the API hosts reach this node's supervisor on, SUPERVISOR_HOST if unset
+NODE_SUPERVISOR_HOST = os.environ.get('NODE_SUPERVISOR_HOST') or None
+NODE_HEARTBEAT_INTERVAL = float(os.environ.get('NODE_HEARTBEAT_INTERVAL', 5))
+NODE_HEARTBEAT_TIMEOUT = float(os.environ.get('NODE_HEARTBEAT_TIMEOUT', 30))
+
+# Retries of a failed FFmpeg: exponential backoff from RETRY_BASE_DELAY seconds up to RETRY_MAX_DELAY, with
+# jitter. An input failing again within CIRCUIT_RESET_AFTER seconds keeps backing off for all its channels
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', 10))
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', 300))
+CIRCUIT_RESET_AFTER = float(os.environ.get('CIRCUIT_RESET_AFTER', 600))
+
+# Input liveness probing by the supervisor: every INPUT_PROBE_INTERVAL seconds each multicast group is joined
+# and each HLS manifest fetched, waiting up to INPUT_PROBE_TIMEOUT. Results count for INPUT_PROBE_TTL seconds;
+# starts on an input that is down wait until it is seen again
+INPUT_PROBE = os.environ.get('INPUT_PROBE', 'true').lower() == 'true'
+INPUT_PROBE_INTERVAL = float(os.environ.get('INPUT_PROBE_INTERVAL', 5))
+INPUT_PROBE_TIMEOUT = float(os.environ.get('INPUT_PROBE_TIMEOUT', 2))
+INPUT_PROBE_TTL = float(os.environ.get('INPUT_PROBE_TTL', 15))
+
+# Channel logs: rotated at LOG_MAX_SIZE bytes or every LOG_ROTATE_INTERVAL seconds, rotated segments compressed
+# (LOG_COMPRESSION gzip, or zstd with the zstandard package) and kept within LOG_RETENTION_BYTES/LOG_RETENTION_DAYS
+# per channel and LOG_TOTAL_BYTES overall
+LOG_MAX_SIZE = int(os.environ.get('LOG_MAX_SIZE', 5 * 1024 * 1024))
+LOG_ROTATE_INTERVAL = int(os.environ.get('LOG_ROTATE_INTERVAL', 24 * 3600))
+LOG_COMPRESSION = os.environ.get('LOG_COMPRESSION', 'gzip')
+LOG_RETENTION_BYTES = int(os.environ.get('LOG_RETENTION_BYTES', 10 * 1024 * 1024))
+LOG_RETENTION_DAYS = float(os.environ.get('LOG_RETENTION_DAYS', 14))
+LOG_TOTAL_BYTES = int(os.environ.get('LOG_TOTAL_BYTES', 2 * 1024 * 1024 * 1024))
+
+# Channel logs directory (logs/channels under the working directory by default)
+CHANNEL_LOG_DIR = os.environ.get('CHANNEL_LOG_DIR') or None
+
+# FFmpeg stderr filter: one progress line per LOG_PROGRESS_INTERVAL seconds (0 keeps all), a warning repeated
+# within LOG_REPEAT_WINDOW seconds is counted and logged as "Last message repeated N times". Errors are always kept
+LOG_PROGRESS_INTERVAL = float(os.environ.get('LOG_PROGRESS_INTERVAL', 10))
+LOG_REPEAT_WINDOW = float(os.environ.get('LOG_REPEAT_WINDOW', 30))
+
+# Job history: the supervisor writes its JobEvents every EVENT_FLUSH_INTERVAL seconds. Events older than
+# JOB_EVENT_RETENTION_DAYS are rolled up into daily counts per channel by the rollup_job_events task
+EVENT_FLUSH_INTERVAL = float(os.environ.get('EVENT_FLUSH_INTERVAL', 2))
+JOB_EVENT_RETENTION_DAYS = float(os.environ.get('JOB_EVENT_RETENTION_DAYS', 90))
+
+# Bulk start: FFmpeg launches per second
+BULK_START_RATE = float(os.environ.get('BULK_START_RATE', 5))
+
+# System metrics sampler (seconds between samples, number of samples kept)
+METRICS_SAMPLE_INTERVAL = float(os.environ.get('METRICS_SAMPLE_INTERVAL', 1.0))
+METRICS_HISTORY_SIZE = int(os.environ.get('METRICS_HISTORY_SIZE', 300))
+
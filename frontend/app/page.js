@@ -1,5 +1,5 @@
 'use client';
-import { useEffect, useState } from 'react';
+import { useEffect, useRef, useState } from 'react';
 import { useRouter } from 'next/navigation';
 import Image from 'next/image';
 import TVNLogo from './TVN-logo.png';
@@ -30,8 +30,72 @@ export default function Dashboard() {
       });
   }, []);
 
-  // Fetch metrics
+  // Live updates over websocket, falls back to polling when the socket is down
+  const [socketOpen, setSocketOpen] = useState(false);
+  // Metrics only arrive over the socket while `manage.py publish_metrics` runs, so they are
+  // polled until a sample comes in and again when none has for METRICS_SOCKET_TIMEOUT ms
+  const METRICS_SOCKET_TIMEOUT = 10000;
+  const [metricsLive, setMetricsLive] = useState(false);
+  const metricsTimer = useRef();
+
+  useEffect(() => {
+    const wsUrl = process.env.NEXT_PUBLIC_BACKEND_WS_URL
+      || `${window.location.protocol === 'https:' ? 'wss' : 'ws'}://${window.location.host}/ws/status/`;
+    let socket;
+    let retryTimer;
+    let closed = false;
+
+    const connect = () => {
+      socket = new WebSocket(wsUrl);
+      socket.onopen = () => setSocketOpen(true);
+      socket.onmessage = (event) => {
+        const message = JSON.parse(event.data);
+        if (message.type === 'metrics') {
+          setMetrics(message);
+          setMetricsLive(true);
+          clearTimeout(metricsTimer.current);
+          metricsTimer.current = setTimeout(() => setMetricsLive(false), METRICS_SOCKET_TIMEOUT);
+        } else if (message.type === 'job_status') {
+          setChannels(prev => prev.map(ch => (
+            ch.job_id === message.job_id
+              ? {
+                  ...ch,
+                  status: message.status,
+                  ...('error_message' in message ? { error_message: message.error_message } : {}),
+                }
+              : ch
+          )));
+          if (['running', 'error'].includes(message.status)) {
+            setStarting(prev => ({ ...prev, [message.job_id]: false }));
+          }
+          if (['stopped', 'error'].includes(message.status)) {
+            setStopping(prev => ({ ...prev, [message.job_id]: false }));
+          }
+        }
+      };
+      socket.onclose = () => {
+        setSocketOpen(false);
+        clearTimeout(metricsTimer.current);
+        setMetricsLive(false);
+        if (!closed) {
+          retryTimer = setTimeout(connect, 5000);
+        }
+      };
+    };
+
+    connect();
+    return () => {
+      closed = true;
+      clearTimeout(retryTimer);
+      clearTimeout(metricsTimer.current);
+      socket.close();
+    };
+  }, []);
+
+  // Fetch metrics (only while no samples arrive over the websocket)
   useEffect(() => {
+    if (metricsLive) return;
+
     const fetchMetrics = async () => {
       try {
         const response = await axios.get(`${apiUrl}/metrics/`);
@@ -44,13 +108,16 @@ export default function Dashboard() {
     fetchMetrics();
     const interval = setInterval(fetchMetrics, 3000);
     return () => clearInterval(interval);
-  }, []);
+  }, [metricsLive]);
 
   // Handle start
   const handleStart = async (jobID) => {
     setStarting(prev => ({ ...prev, [jobID]: true }));
     try {
       await axios.post(`${apiUrl}/job/${jobID}/start/`);
+      // Status changes arrive over the websocket, no need to poll
+      if (socketOpen) return;
+
       const response = await axios.get(`${apiUrl}/channels`);
       setChannels(response.data);
 
@@ -98,6 +165,9 @@ export default function Dashboard() {
     setStopping(prev => ({ ...prev, [jobID]: true }));
     try {
       await axios.post(`${apiUrl}/job/${jobID}/stop/`);
+      // Status changes arrive over the websocket, no need to poll
+      if (socketOpen) return;
+
       const response = await axios.get(`${apiUrl}/channels`);
       setChannels(response.data);
       